@@ -1,20 +1,79 @@
-from flask import Flask, render_template, request, send_file, redirect, url_for, flash, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify
 from pytubefix import YouTube
-import os, subprocess, datetime, threading, re, uuid
+import os, threading, re, uuid, time, itertools, json, contextlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 from config import DOWNLOAD_FOLDER, UPLOAD_FOLDER, MERGED_FOLDER, HOST, PORT, print_config_info, SERVER_MODE
+from config import FETCH_WORKERS, CPU_WORKERS, MAX_QUEUED_JOBS, JOBS_DB, JOB_TTL_HOURS
+from config import METADATA_CACHE_SIZE, METADATA_TTL_MINUTES, METADATA_CACHE_DIR
+from config import ARTIFACT_CACHE_MB, ARTIFACT_EVICTION_POLICY, SEGMENT_CONNECTIONS, SEGMENT_SIZE_MB
+from config import SHARED_STATE, BOOT_ID, DELIVERY_MODE, ACCEL_PREFIX, ACCEL_ROOT, MAX_EVENT_STREAMS
+from config import MAX_UPLOAD_MB, MAX_UPLOAD_REQUEST_MB, UPLOAD_EARLY_PROBE
+from config import BATCH_RESOLVE_WORKERS, BATCH_MAX_VIDEOS, AUDIO_FORMAT, AUDIO_BITRATE, MERGE_PIPELINE
+from config import WORKSPACE_DIR, WORKSPACE_TMPFS, WORKSPACE_TMPFS_MB, ENCODE_PROFILE, ENCODE_THREADS
+from job_store import JobStore, is_terminal
+from events import EventBus
+from metadata_cache import MetadataCache, extract_video_id
+from coalescer import DownloadCoalescer
+from artifact_cache import ArtifactCache, artifact_dirname
+from fetcher import TransferProgress, SegmentedDownloader, count_chunks, journal_path, open_url_stream, remove_partial, run_parallel, stale_partials
+from batches import expand_playlist, is_batch_url, summarize
+from delivery import content_disposition, plan_delivery, read_range, stream_zip, unique_names
+from audio import audio_extension, audio_variant, check_audio_options, extract_audio
+from merger import codec_from_manifest, merge_av, merge_streams, plan_merge, probe_inputs, resolve_profile
+from merger import ffmpeg_capabilities, get_ffmpeg_path, stream_fragmented_mp4
+from uploads import UploadRejected, UploadTooLarge, ingest_multipart
+from scheduler import JobScheduler, SharedJobScheduler, QueueFullError, PRIORITY_LOW
+from workspace import WorkspaceManager
 
 app = Flask(__name__)
 app.secret_key = 'youtube-downloader-secret-key'
 
-# Global variables for tracking downloads
-download_status = {}
-download_progress = {}
+# Progress streams wait on this instead of polling the job store
+events = EventBus()
 
-# Global variables for tracking merges
-merge_status = {}
-merge_progress = {}
-merge_files = {}
+# Download and merge jobs, persisted across restarts and shared by all
+# worker processes when started through serve.py
+jobs = JobStore(JOBS_DB, ttl_seconds=JOB_TTL_HOURS * 3600, on_evict=lambda job: release_job_files(job),
+                on_change=lambda job: job_changed(job), shared=SHARED_STATE)
+
+# Identical downloads share one transfer and its output file
+coalescer = DownloadCoalescer(store=jobs if SHARED_STATE else None)
+
+# Finished files indexed by (video ID, itag, mode), kept under a byte budget
+artifacts = ArtifactCache(JOBS_DB, max_bytes=ARTIFACT_CACHE_MB * 1024 * 1024,
+                          policy=ARTIFACT_EVICTION_POLICY, in_use=coalescer.in_use)
+
+# Scratch directories, one per running merge or conversion
+workspaces = WorkspaceManager(WORKSPACE_DIR, WORKSPACE_TMPFS, WORKSPACE_TMPFS_MB * 1024 * 1024)
+
+# Bounded pools for fetch jobs and CPU-bound merges, fed from a queue in the
+# jobs database when several worker processes share it
+if SHARED_STATE:
+    scheduler = SharedJobScheduler(JOBS_DB, fetch_workers=FETCH_WORKERS, cpu_workers=CPU_WORKERS,
+                                   max_queued=MAX_QUEUED_JOBS, boot_id=BOOT_ID or None)
+else:
+    scheduler = JobScheduler(fetch_workers=FETCH_WORKERS, cpu_workers=CPU_WORKERS, max_queued=MAX_QUEUED_JOBS)
+
+# FFmpeg's location and encoders are looked up once here, not on every merge
+ffmpeg_capabilities()
+
+# Threads per encoder: the cores shared out between the encodes that may run at once
+resolve_profile(ENCODE_PROFILE)
+encode_threads = ENCODE_THREADS or (max(1, (os.cpu_count() or 1) // scheduler.cpu_workers)
+                                    if scheduler.cpu_workers > 0 else 0)
+
+def encode_options(extra):
+    """Profile, threads and encode backlog for merge_av, called while holding a CPU slot"""
+    return {"profile": extra.get("encode_profile") or ENCODE_PROFILE, "threads": encode_threads,
+            "backlog": scheduler.encode_backlog()}
+
+def quality_value(label):
+    """Numeric part of a quality label such as '1080p' or '128kbps'"""
+    digits = re.sub(r'\D', '', label or '')
+    return int(digits) if digits else 0
 
 def sanitize_filename(filename):
     """Clean filename for safe saving"""
@@ -23,138 +82,251 @@ def sanitize_filename(filename):
     return filename[:200] if len(filename) > 200 else filename
 
 def process_merge(video_path, audio_path, output_path, merge_id):
-    """Process file merging using MoviePy"""
+    """Process file merging, remuxing with FFmpeg and re-encoding only what has to be"""
+    # The output is written in the job's own directory and moved into
+    # place once complete
+    work = workspaces.open(merge_id, expected_bytes=sum(os.path.getsize(path) for path in (video_path, audio_path)
+                                                        if os.path.exists(path)))
+    scratch_path = work.file(os.path.basename(output_path))
     try:
-        merge_status[merge_id] = "starting"
-        merge_progress[merge_id] = 0
+        job = jobs.update(merge_id, status="starting", progress=0)
+        key = job.extra.get("key") or f"merge:{merge_id}"
         
-        # Import moviepy here to avoid import errors if not installed
+        # Stream-copy remux first, it avoids decoding a single frame
+        jobs.update(merge_id, status="merging", progress=0)
+        with scheduler.cpu_slot():
+            merge_info = merge_av(video_path, audio_path, scratch_path, job.extra.get("probe"),
+                                  on_progress=report_encode(merge_id), **encode_options(job.extra))
+        work.publish(scratch_path, output_path)
+        job = jobs.update(merge_id, status="completed", progress=100, extra={"merge": merge_info})
+        artifacts.add(key, output_path, job.filename, category="merged")
+        print(f"Merge completed via {merge_info['method']} in {merge_info['seconds']}s")
+        
+        # Clean up input files
         try:
-            from moviepy.editor import VideoFileClip, AudioFileClip
-            merge_status[merge_id] = "loading_files"
-            merge_progress[merge_id] = 20
-            
-            # Load video and audio
-            video_clip = VideoFileClip(video_path)
-            audio_clip = AudioFileClip(audio_path)
-            
-            merge_status[merge_id] = "merging"
-            merge_progress[merge_id] = 50
-            
-            # Set audio to video
-            final_clip = video_clip.set_audio(audio_clip)
-            
-            merge_status[merge_id] = "writing_output"
-            merge_progress[merge_id] = 75
-            
-            # Write the result with optimized settings
-            final_clip.write_videofile(
-                output_path, 
-                codec='libx264', 
-                audio_codec='aac',
-                verbose=False,
-                logger=None,
-                preset='fast',  # Faster encoding
-                ffmpeg_params=['-movflags', '+faststart'],  # Web optimization
-                temp_audiofile='temp-audio.m4a',
-                remove_temp=True
-            )
-            
-            # Clean up
-            video_clip.close()
-            audio_clip.close()
-            final_clip.close()
-            
-            merge_status[merge_id] = "completed"
-            merge_progress[merge_id] = 100
-            
-            # Clean up input files
-            try:
-                os.remove(video_path)
-                os.remove(audio_path)
-            except:
-                pass  # Don't fail if cleanup fails
-                
-        except ImportError:
-            raise Exception("MoviePy is not installed. Please install it with: pip install moviepy")
+            os.remove(video_path)
+            os.remove(audio_path)
+        except:
+            pass  # Don't fail if cleanup fails
             
     except Exception as e:
-        merge_status[merge_id] = "error"
-        merge_progress[merge_id] = 0
         print(f"Merge error: {str(e)}")
         # Store error for retrieval
-        merge_files[merge_id] = {"error": str(e)}
+        jobs.update(merge_id, status="error", progress=0, error=str(e))
+    finally:
+        work.cleanup()
 
-def update_progress(download_id, stream, chunk, bytes_remaining):
-    """Update download progress"""
-    total_size = stream.filesize
-    bytes_downloaded = total_size - bytes_remaining
-    progress = (bytes_downloaded / total_size) * 100
-    download_progress[download_id] = round(progress, 1)
+# Cached YouTube objects are shared between jobs, so each worker thread
+# registers the callback for the download it is running
+_progress_context = threading.local()
 
-def process_download(url, itag, mode, download_id):
-    """Background download processing"""
-    try:
-        download_status[download_id] = "starting"
-        download_progress[download_id] = 0
-        
-        # Try to create YouTube object with retries
+def dispatch_progress(stream, chunk, bytes_remaining):
+    """Forward a pytubefix progress callback to the current thread's job"""
+    callback = getattr(_progress_context, "callback", None)
+    if callback:
+        callback(stream, chunk, bytes_remaining)
+
+YOUTUBE_RETRIES = 3
+
+def open_youtube(url):
+    """Create a YouTube object and load its details, a single attempt"""
+    yt = YouTube(url, 
+               on_progress_callback=dispatch_progress,
+               use_oauth=False,
+               allow_oauth_cache=False)
+    
+    # Test if we can access video info
+    _ = yt.title  # This will trigger the actual connection
+    return yt
+
+def youtube_failure(error, attempt):
+    """Exception to give up with after a failed attempt, or None to retry"""
+    error_msg = str(error).lower()
+    
+    # Check for specific error types
+    if "private" in error_msg or "unavailable" in error_msg:
+        return Exception("This video is private or unavailable. Please check the URL and try a different video.")
+    elif "age" in error_msg and "restricted" in error_msg:
+        return Exception("This video is age-restricted and cannot be downloaded.")
+    elif "live" in error_msg:
+        return Exception("Live streams cannot be downloaded. Please wait until the stream ends.")
+    elif "premium" in error_msg or "members" in error_msg:
+        return Exception("This video requires YouTube Premium or channel membership.")
+    
+    if attempt < YOUTUBE_RETRIES - 1:
+        return None
+    # Provide helpful error message based on common issues
+    if "retries" in error_msg or "timeout" in error_msg or "connection" in error_msg:
+        return Exception(f"Network connection issue. Please check your internet connection and try again. If the problem persists, the video might be temporarily unavailable.")
+    return Exception(f"Failed to connect after {YOUTUBE_RETRIES} attempts. This might be due to network issues, video restrictions, or temporary YouTube problems. Error: {str(error)}")
+
+def retry_wait(attempt):
+    """Seconds to wait before the next attempt: 2, 4"""
+    return (attempt + 1) * 2
+
+def fetch_youtube(url, on_attempt=None):
+    """Create a YouTube object, retrying transient failures"""
+    for attempt in range(YOUTUBE_RETRIES):
+        try:
+            print(f"Attempt {attempt + 1} to access YouTube URL: {url}")
+            if on_attempt:
+                on_attempt(attempt + 1)
+            yt = open_youtube(url)
+            print(f"Successfully connected on attempt {attempt + 1}")
+            return yt
+            
+        except Exception as e:
+            print(f"Attempt {attempt + 1} failed: {str(e)}")
+            failure = youtube_failure(e, attempt)
+            if failure is not None:
+                raise failure
+            wait_time = retry_wait(attempt)
+            print(f"Waiting {wait_time} seconds before retry...")
+            time.sleep(wait_time)
+    
+    raise Exception("Could not create YouTube object")
+
+# Ranged multi-connection transfers, the connection pool is shared by all jobs:
+# every fetch worker downloads up to two streams (video and audio) at once
+segmented = SegmentedDownloader(connections=SEGMENT_CONNECTIONS, segment_size=SEGMENT_SIZE_MB * 1024 * 1024,
+                                parallel_streams=FETCH_WORKERS * 2) if SEGMENT_CONNECTIONS > 0 else None
+
+def download_stream(stream, output_dir, filename, on_bytes, refresh=None):
+    """Download a stream over several ranged connections, or via pytubefix
+
+    on_bytes(bytes_done, segments) is called as data arrives; segments is
+    None when pytubefix does the transfer. Ranged downloads are retried up
+    to 3 times, resuming from the bytes already on disk; refresh(itag), if
+    given, returns the stream with a fresh URL for the next attempt.
+    """
+    path = os.path.join(output_dir, filename)
+    if segmented is not None and not getattr(stream, 'is_sabr', False):
         max_retries = 3
-        yt = None
-        
         for attempt in range(max_retries):
             try:
-                print(f"Attempt {attempt + 1} to access YouTube URL: {url}")
-                download_status[download_id] = f"connecting_attempt_{attempt + 1}"
-                
-                yt = YouTube(url, 
-                           on_progress_callback=lambda stream, chunk, bytes_remaining: 
-                           update_progress(download_id, stream, chunk, bytes_remaining),
-                           use_oauth=False,
-                           allow_oauth_cache=False)
-                
-                # Test if we can access video info
-                _ = yt.title  # This will trigger the actual connection
-                print(f"Successfully connected on attempt {attempt + 1}")
-                break
-                
+                segmented.download(stream.url, path, on_progress=on_bytes,
+                                   expected_size=getattr(stream, '_filesize', None))
+                return path
             except Exception as e:
-                error_msg = str(e).lower()
-                print(f"Attempt {attempt + 1} failed: {str(e)}")
-                
-                # Check for specific error types
-                if "private" in error_msg or "unavailable" in error_msg:
-                    raise Exception("This video is private or unavailable. Please check the URL and try a different video.")
-                elif "age" in error_msg and "restricted" in error_msg:
-                    raise Exception("This video is age-restricted and cannot be downloaded.")
-                elif "live" in error_msg:
-                    raise Exception("Live streams cannot be downloaded. Please wait until the stream ends.")
-                elif "premium" in error_msg or "members" in error_msg:
-                    raise Exception("This video requires YouTube Premium or channel membership.")
-                
+                print(f"Segmented download attempt {attempt + 1} failed: {e}")
                 if attempt < max_retries - 1:
-                    import time
-                    wait_time = (attempt + 1) * 2  # 2, 4, 6 seconds
-                    print(f"Waiting {wait_time} seconds before retry...")
-                    time.sleep(wait_time)
-                else:
-                    # Provide helpful error message based on common issues
-                    if "retries" in error_msg or "timeout" in error_msg or "connection" in error_msg:
-                        raise Exception(f"Network connection issue. Please check your internet connection and try again. If the problem persists, the video might be temporarily unavailable.")
-                    else:
-                        raise Exception(f"Failed to connect after {max_retries} attempts. This might be due to network issues, video restrictions, or temporary YouTube problems. Error: {str(e)}")
-        
-        if not yt:
-            raise Exception("Could not create YouTube object")
+                    time.sleep((attempt + 1) * 2)
+                    if refresh:
+                        # Stream URLs expire, resolve them again before resuming
+                        stream = refresh(stream.itag) or stream
+        print("Segmented download failed, falling back to a single connection")
+        remove_partial(path)
+    
+    _progress_context.callback = lambda stream, chunk, bytes_remaining: \
+        on_bytes(stream.filesize - bytes_remaining, None)
+    try:
+        stream.download(output_path=output_dir, filename=filename)
+    finally:
+        _progress_context.callback = None
+    return path
+
+def stream_chunks(stream, on_bytes):
+    """Bytes of a stream as they download, over ranged connections when enabled"""
+    if segmented is not None:
+        return segmented.stream(stream.url, on_progress=on_bytes)
+    _, chunks = open_url_stream(stream.url)
+    return count_chunks(chunks, lambda done: on_bytes(done, None))
+
+def pipeline_plan(video_stream, audio_stream):
+    """Merge plan for piping both streams straight into FFmpeg, or None if they need temp files
+
+    Only stream-copied video qualifies: a re-encode is slower than the
+    download, so there is nothing to overlap.
+    """
+    if not MERGE_PIPELINE or os.name != 'posix':
+        return None
+    if getattr(video_stream, 'is_sabr', False) or getattr(audio_stream, 'is_sabr', False):
+        return None
+    try:
+        plan = plan_merge({'video': codec_from_manifest(video_stream.video_codec)},
+                          {'audio': codec_from_manifest(audio_stream.audio_codec)})
+    except Exception:
+        return None
+    return plan if plan['video'] == 'copy' else None
+
+def track_transfer(download_id, totals):
+    """Attach byte counters for a job's streams, progress events go out at most twice a second"""
+    def publish():
+        if jobs.shared:
+            # Other worker processes read the progress from the job store
+            jobs.save_live(download_id, transfer.snapshot())
+        events.publish(download_id)
+
+    transfer = jobs.track(download_id, TransferProgress(totals, publish=publish))
+    return transfer
+
+def report_encode(job_id):
+    """on_progress callback for merge_av showing encoder progress, fps and ETA on a job"""
+    def on_progress(report):
+        jobs.set_live(job_id, {"progress": report["percent"] or 0, "encode_fps": report["fps"],
+                               "encode_speed": report["speed"], "eta": report["eta"]})
+    return on_progress
+
+def pick_audio_stream(yt):
+    """Best audio stream to pair with a video-only stream, MP4 audio first for compatibility"""
+    audio_stream = yt.streams.filter(only_audio=True, mime_type="audio/mp4").order_by('abr').desc().first()
+    if not audio_stream:
+        audio_stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
+    return audio_stream
+
+# Video details and stream manifests shared by /analyze and the download workers
+metadata = MetadataCache(fetch_youtube, max_entries=METADATA_CACHE_SIZE,
+                         ttl_seconds=METADATA_TTL_MINUTES * 60, disk_dir=METADATA_CACHE_DIR or None)
+
+def audio_settings(extra):
+    """Output format and bitrate (kbps) of an audio download, from its job record"""
+    return extra.get("audio_format") or AUDIO_FORMAT, int(extra.get("audio_bitrate") or AUDIO_BITRATE)
+
+def audio_request_options(data):
+    """Validated audio format fields of a request, as job extra (empty when not given)"""
+    if not data.get("audio_format") and not data.get("audio_bitrate"):
+        return {}
+    audio_format, bitrate = check_audio_options(data.get("audio_format") or AUDIO_FORMAT,
+                                                data.get("audio_bitrate") or AUDIO_BITRATE)
+    return {"audio_format": audio_format, "audio_bitrate": bitrate}
+
+def download_key(url, itag, mode, extra):
+    """Coalescing and cache key of a download; audio formats are cached separately"""
+    variant = audio_variant(*audio_settings(extra)) if mode == "audio" else None
+    return coalescer.key_for(extract_video_id(url), itag, mode, variant)
+
+def process_download(url, itag, mode, download_id):
+    """Background download processing
+
+    Partial files are kept on failure, so a retry or a requeue after a
+    restart resumes them.
+    """
+    held_paths = []
+    work = None
+    
+    def refresh(stream_itag):
+        metadata.invalidate(url)
+        return metadata.get(url, need_object=True).yt.streams.get_by_itag(stream_itag)
+    
+    try:
+        jobs.update(download_id, status="starting", progress=0)
+        
+        # Reuse the YouTube object resolved by /analyze when it is still cached
+        yt = metadata.get(url, need_object=True,
+                          on_attempt=lambda attempt: jobs.update(download_id, status=f"connecting_attempt_{attempt}")).yt
             
         safe_title = sanitize_filename(yt.title)
-        timestamp = str(int(datetime.datetime.now().timestamp()))
+        
+        # Each (video, itag, mode) gets its own directory so equal titles never collide
+        extra = jobs.get(download_id).extra
+        output_dir = os.path.join(DOWNLOAD_FOLDER, artifact_dirname(download_key(url, itag, mode, extra)))
+        os.makedirs(output_dir, exist_ok=True)
         print(f"Video title: {yt.title}")
         print(f"Safe title: {safe_title}")
         
         # Audio-only download
         if mode == "audio":
-            download_status[download_id] = "downloading_audio"
+            jobs.update(download_id, status="downloading_audio")
             stream = yt.streams.get_by_itag(itag)
             if not stream:
                 stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
@@ -162,22 +334,48 @@ def process_download(url, itag, mode, download_id):
             if not stream:
                 raise Exception("No audio stream available")
             
-            # Create filename with quality info
-            quality_info = f"_{stream.abr}" if hasattr(stream, 'abr') and stream.abr else ""
-            filename = f"{safe_title}{quality_info}.mp3"
-            output_path = os.path.join(DOWNLOAD_FOLDER, filename)
-            stream.download(output_path=DOWNLOAD_FOLDER, filename=filename)
+            # Copy into the container of the codec, or transcode, while it downloads
+            audio_format, bitrate = audio_settings(extra)
+            codec = codec_from_manifest(stream.audio_codec)
+            if audio_format == "copy":
+                quality_info = f"_{stream.abr}" if hasattr(stream, 'abr') and stream.abr else ""
+            else:
+                quality_info = f"_{bitrate}kbps"
+            filename = f"{safe_title}{quality_info}.{audio_extension(audio_format, codec)}"
+            output_path = os.path.join(output_dir, filename)
+            transfer = track_transfer(download_id, {"audio": stream.filesize})
+            work = workspaces.open(download_id, expected_bytes=stream.filesize * 2 if stream.filesize else None)
+            scratch_path = work.file(filename)
+            
+            source = None
+            if getattr(stream, 'is_sabr', False):
+                # No plain URL to read from, pytubefix fetches it into a file first,
+                # before the encoder takes its CPU place
+                source = download_stream(stream, work.path, f"source_{stream.itag}.{stream.subtype}",
+                                         partial(transfer.update, "audio"), refresh)
+            # Encoders take a CPU worker place, copying is too cheap to count. One
+            # fed from the live download holds its place for the whole transfer,
+            # although the network usually paces it: counting it anyway keeps the
+            # encoders at or below the cores that encode_threads is split between.
+            # The stream is opened only once the place is taken, so no connection
+            # sits idle meanwhile
+            with contextlib.nullcontext() if audio_format == "copy" else scheduler.cpu_slot():
+                if audio_format != "copy":
+                    jobs.update(download_id, status="converting_audio")
+                if source is None:
+                    _, chunks = open_url_stream(stream.url, segmented.session if segmented else None)
+                    source = count_chunks(chunks, partial(transfer.update, "audio"))
+                extract_audio(source, scratch_path, audio_format, codec, bitrate)
+            work.publish(scratch_path, output_path)
             
-            download_status[download_id] = "completed"
-            download_progress[download_id] = 100
-            download_status[f"{download_id}_file"] = output_path
-            download_status[f"{download_id}_filename"] = filename
+            jobs.update(download_id, status="completed", progress=100,
+                        file_path=output_path, filename=filename)
             print(f"Audio download completed: {filename}")
             return
 
         # Progressive download (already has video+audio)
         elif mode == "progressive":
-            download_status[download_id] = "downloading_video"
+            jobs.update(download_id, status="downloading_video")
             stream = yt.streams.get_by_itag(itag)
             if not stream:
                 raise Exception("Selected video stream not available")
@@ -185,88 +383,94 @@ def process_download(url, itag, mode, download_id):
             # Create filename with quality info
             quality_info = f"_{stream.resolution}" if hasattr(stream, 'resolution') and stream.resolution else ""
             filename = f"{safe_title}{quality_info}.mp4"
-            output_path = os.path.join(DOWNLOAD_FOLDER, filename)
-            stream.download(output_path=DOWNLOAD_FOLDER, filename=filename)
+            transfer = track_transfer(download_id, {"video": stream.filesize})
+            output_path = download_stream(stream, output_dir, filename, partial(transfer.update, "video"), refresh)
             
-            download_status[download_id] = "completed"
-            download_progress[download_id] = 100
-            download_status[f"{download_id}_file"] = output_path
-            download_status[f"{download_id}_filename"] = filename
+            jobs.update(download_id, status="completed", progress=100,
+                        file_path=output_path, filename=filename)
             print(f"Progressive download completed: {filename}")
             return
 
-        # Merge download (high quality video + audio) - ALWAYS TRY MOVIEPY FIRST
+        # Merge download (high quality video + audio) - remux first, re-encode only if needed
         elif mode == "merge":
-            video_path = os.path.join(DOWNLOAD_FOLDER, f"temp_video_{timestamp}.mp4")
-            output_path = os.path.join(DOWNLOAD_FOLDER, f"{safe_title}.mp4")
+            # Named by itag, not time, so a retried job finds its partial files
+            video_filename = f"temp_video_{itag}.mp4"
+            video_path = os.path.join(output_dir, video_filename)
 
-            # Download audio first (usually faster) - prefer MP4 audio for better compatibility
-            download_status[download_id] = "downloading_audio"
-            
-            # Try to get MP4 audio first (better compatibility), then fallback to any audio
-            audio_stream = yt.streams.filter(only_audio=True, mime_type="audio/mp4").order_by('abr').desc().first()
-            if not audio_stream:
-                audio_stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
+            video_stream = yt.streams.get_by_itag(itag)
+            if not video_stream:
+                raise Exception("Selected video stream not available")
             
+            audio_stream = pick_audio_stream(yt)
             if not audio_stream:
                 raise Exception("No audio stream available")
-            
+
+            # Get video quality for filename
+            quality_info = f"_{video_stream.resolution}" if video_stream and hasattr(video_stream, 'resolution') and video_stream.resolution else "_HQ"
+            final_filename = f"{safe_title}{quality_info}_merged.mp4"
+            final_path = os.path.join(output_dir, final_filename)
+            # The merged file is written in the job's own directory and moved into place once complete
+            work = workspaces.open(download_id, expected_bytes=(video_stream.filesize or 0) + (audio_stream.filesize or 0))
+            scratch_path = work.file(final_filename)
+
             # Use appropriate extension based on audio type
             audio_ext = "m4a" if "mp4" in audio_stream.mime_type else "webm"
-            audio_filename = f"temp_audio_{timestamp}.{audio_ext}"
-            audio_path = os.path.join(DOWNLOAD_FOLDER, audio_filename)
-            
-            print(f"Downloading audio: {audio_stream.mime_type}, {audio_stream.abr}")
-            audio_stream.download(output_path=DOWNLOAD_FOLDER, filename=audio_filename)
+            audio_filename = f"temp_audio_{audio_stream.itag}.{audio_ext}"
+            audio_path = os.path.join(output_dir, audio_filename)
 
-            # Download video
-            download_status[download_id] = "downloading_video"
-            video_stream = yt.streams.get_by_itag(itag)
-            if not video_stream:
-                raise Exception("Selected video stream not available")
+            # Remux while both streams download, nothing but the result touches the disk.
+            # A pipe cannot resume, so partial temp files from an earlier attempt are finished instead
+            plan = pipeline_plan(video_stream, audio_stream)
+            if plan and not any(os.path.exists(journal_path(path)) for path in (video_path, audio_path)):
+                jobs.update(download_id, status="downloading_audio_video")
+                transfer = track_transfer(download_id, {"audio": audio_stream.filesize, "video": video_stream.filesize})
+                print(f"Piping audio ({audio_stream.mime_type}, {audio_stream.abr}) and video ({video_stream.resolution}) into FFmpeg ({plan['method']})")
+                try:
+                    # Re-encoded audio (e.g. Opus to AAC) runs an encoder, which takes a CPU worker place
+                    with contextlib.nullcontext() if plan['audio'] == 'copy' else scheduler.cpu_slot():
+                        merge_info = merge_streams(stream_chunks(video_stream, partial(transfer.update, "video")),
+                                                   stream_chunks(audio_stream, partial(transfer.update, "audio")),
+                                                   scratch_path, plan, duration=yt.length)
+                    work.publish(scratch_path, final_path)
+                    jobs.update(download_id, status="completed", progress=100,
+                                file_path=final_path, filename=final_filename,
+                                extra={"merge": merge_info})
+                    print(f"Pipelined merge completed in {merge_info['seconds']}s: {final_filename}")
+                    return
+                except Exception as e:
+                    print(f"Pipelined merge failed: {e}, downloading to temporary files instead")
             
-            video_stream.download(output_path=DOWNLOAD_FOLDER, filename=f"temp_video_{timestamp}.mp4")
-
-            # Try MoviePy FIRST (no FFmpeg dependency)
-            download_status[download_id] = "merging_files_python"
-            print("Using MoviePy for merging (better compatibility)...")
+            # Keep cleanup away from the temp files while this job uses them
+            for path in (video_path, audio_path):
+                coalescer.acquire(path)
+                held_paths.append(path)
             
-            try:
-                # Try to use moviepy for merging
-                from moviepy.editor import VideoFileClip, AudioFileClip
-                
-                print("Loading video and audio files...")
-                video_clip = VideoFileClip(video_path)
-                audio_clip = AudioFileClip(audio_path)
-                
-                print("Merging video and audio...")
-                final_video = video_clip.set_audio(audio_clip)
-                
-                # Get video quality for filename
-                quality_info = f"_{video_stream.resolution}" if video_stream and hasattr(video_stream, 'resolution') and video_stream.resolution else "_HQ"
-                final_filename = f"{safe_title}{quality_info}_merged.mp4"
-                final_path = os.path.join(DOWNLOAD_FOLDER, final_filename)
-                
-                print("Writing final video file...")
-                # Optimized settings for faster processing
-                final_video.write_videofile(
-                    final_path, 
-                    codec='libx264', 
-                    audio_codec='aac', 
-                    verbose=False, 
-                    logger=None,
-                    preset='fast',  # Faster encoding
-                    ffmpeg_params=['-movflags', '+faststart'],  # Web optimization
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
-                
-                # Clean up
-                video_clip.close()
-                audio_clip.close()
-                final_video.close()
-                
-                print("MoviePy merge completed successfully")
+            # Fetch both streams at once, progress counts bytes across both
+            jobs.update(download_id, status="downloading_audio_video")
+            transfer = track_transfer(download_id, {"audio": audio_stream.filesize, "video": video_stream.filesize})
+            
+            def fetch(stream, filename, name):
+                download_stream(stream, output_dir, filename, partial(transfer.update, name), refresh)
+            
+            print(f"Downloading audio ({audio_stream.mime_type}, {audio_stream.abr}) and video ({video_stream.resolution}) in parallel")
+            run_parallel([
+                lambda: fetch(audio_stream, audio_filename, "audio"),
+                lambda: fetch(video_stream, video_filename, "video")
+            ])
+
+            # Stream-copy remux FIRST, only re-encodes when the codecs require it
+            # Progress from here on is the encoder's, not the transfer's
+            jobs.track(download_id, None)
+            jobs.update(download_id, status="merging_files", progress=0)
+            if get_ffmpeg_path():
+                try:
+                    with scheduler.cpu_slot():
+                        merge_info = merge_av(video_path, audio_path, scratch_path,
+                                              on_progress=report_encode(download_id), **encode_options(extra))
+                except Exception as e:
+                    raise Exception(f"Merging failed: {e}")
+                work.publish(scratch_path, final_path)
+                print(f"Merge completed via {merge_info['method']} in {merge_info['seconds']}s")
                 
                 # Clean up temporary files
                 try:
@@ -275,129 +479,335 @@ def process_download(url, itag, mode, download_id):
                 except Exception as e:
                     print(f"Cleanup error: {e}")
                 
-                download_status[download_id] = "completed"
-                download_progress[download_id] = 100
-                download_status[f"{download_id}_file"] = final_path
-                download_status[f"{download_id}_filename"] = final_filename
+                jobs.update(download_id, status="completed", progress=100,
+                            file_path=final_path, filename=final_filename,
+                            extra={"merge": merge_info})
                 print(f"Merge download completed: {final_filename}")
                 return
-                
-            except ImportError:
-                print("MoviePy not available, trying FFmpeg...")
-                # Fall back to FFmpeg if MoviePy is not available
-                pass
-            except Exception as e:
-                print(f"MoviePy merge failed: {e}, trying FFmpeg...")
-                # Fall back to FFmpeg if MoviePy fails
-                pass
 
-            # FFmpeg fallback (only if MoviePy fails)
-            download_status[download_id] = "checking_ffmpeg"
-            ffmpeg_check = subprocess.run("ffmpeg -version", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # Without FFmpeg the streams are handed over as they are, for the File Merger tab
+            jobs.update(download_id, status="providing_separate_files")
+            print("FFmpeg is not available. Providing video and audio files separately...")
             
-            if ffmpeg_check.returncode != 0:
-                # Neither MoviePy nor FFmpeg available - provide separate files
-                download_status[download_id] = "providing_separate_files"
-                print("Neither MoviePy nor FFmpeg available. Providing video and audio files separately...")
-                
-                # Copy video file to final location with descriptive name
-                video_final_name = f"{safe_title}_{video_stream.resolution}_VIDEO_ONLY.mp4"
-                video_final_path = os.path.join(DOWNLOAD_FOLDER, video_final_name)
-                
-                audio_final_name = f"{safe_title}_{audio_stream.abr}_AUDIO_ONLY.{audio_ext}"
-                audio_final_path = os.path.join(DOWNLOAD_FOLDER, audio_final_name)
-                
-                import shutil
-                shutil.copy2(video_path, video_final_path)
-                shutil.copy2(audio_path, audio_final_path)
-                
-                # Store both files info
-                download_status[f"{download_id}_video_file"] = video_final_path
-                download_status[f"{download_id}_video_filename"] = video_final_name
-                download_status[f"{download_id}_audio_file"] = audio_final_path
-                download_status[f"{download_id}_audio_filename"] = audio_final_name
-                
-                # Use video file as primary download
-                output_path = video_final_path
-                final_filename = video_final_name
-                
-                download_status[download_id] = "completed"
-                download_progress[download_id] = 100
-                download_status[f"{download_id}_file"] = output_path
-                download_status[f"{download_id}_filename"] = final_filename
-                print(f"Separate files provided: {video_final_name} and {audio_final_name}")
-                return
-                    
-            else:
-                # FFmpeg is available - use it for merging
-                download_status[download_id] = "merging_files"
-                
-                # Get video quality for filename
-                quality_info = f"_{video_stream.resolution}" if video_stream and hasattr(video_stream, 'resolution') and video_stream.resolution else "_HQ"
-                final_filename = f"{safe_title}{quality_info}_merged.mp4"
-                final_path = os.path.join(DOWNLOAD_FOLDER, final_filename)
-                
-                # Try multiple FFmpeg commands for better compatibility
-                merge_commands = [
-                    # Command 1: Standard merge with audio re-encoding
-                    f'ffmpeg -i "{video_path}" -i "{audio_path}" -c:v copy -c:a aac -b:a 128k -shortest "{final_path}" -y',
-                    # Command 2: Force audio mapping
-                    f'ffmpeg -i "{video_path}" -i "{audio_path}" -c:v copy -c:a aac -map 0:v:0 -map 1:a:0 -shortest "{final_path}" -y',
-                    # Command 3: Re-encode both if needed
-                    f'ffmpeg -i "{video_path}" -i "{audio_path}" -c:v libx264 -c:a aac -b:a 128k -shortest "{final_path}" -y'
-                ]
-                
-                merge_success = False
-                last_error = ""
-                
-                for i, cmd in enumerate(merge_commands):
-                    print(f"Trying FFmpeg merge command {i+1}: {cmd}")
-                    result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    
-                    if result.returncode == 0:
-                        print(f"FFmpeg merge successful with command {i+1}")
-                        merge_success = True
-                        break
-                    else:
-                        last_error = result.stderr.decode()
-                        print(f"FFmpeg command {i+1} failed: {last_error}")
-                
-                if not merge_success:
-                    raise Exception(f"All FFmpeg merge attempts failed. Last error: {last_error}")
+            # Copy video file to final location with descriptive name
+            video_final_name = f"{safe_title}_{video_stream.resolution}_VIDEO_ONLY.mp4"
+            video_final_path = os.path.join(output_dir, video_final_name)
+            
+            audio_final_name = f"{safe_title}_{audio_stream.abr}_AUDIO_ONLY.{audio_ext}"
+            audio_final_path = os.path.join(output_dir, audio_final_name)
+            
+            import shutil
+            shutil.copy2(video_path, video_final_path)
+            shutil.copy2(audio_path, audio_final_path)
+            
+            # Use video file as primary download, keep both files info
+            jobs.update(download_id, status="completed", progress=100,
+                        file_path=video_final_path, filename=video_final_name,
+                        extra={
+                            "video_file": video_final_path,
+                            "video_filename": video_final_name,
+                            "audio_file": audio_final_path,
+                            "audio_filename": audio_final_name
+                        })
+            print(f"Separate files provided: {video_final_name} and {audio_final_name}")
+            return
 
-                # Verify the merged file has audio
-                download_status[download_id] = "verifying_audio"
-                verify_cmd = f'ffprobe -v quiet -show_streams -select_streams a "{final_path}"'
-                verify_result = subprocess.run(verify_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                
-                if verify_result.returncode != 0 or not verify_result.stdout.strip():
-                    print("Warning: Merged file may not have audio, trying alternative merge...")
-                    # Try one more time with different settings
-                    alt_cmd = f'ffmpeg -i "{video_path}" -i "{audio_path}" -c:v copy -c:a libmp3lame -b:a 128k -ac 2 -ar 44100 "{final_path}" -y'
-                    alt_result = subprocess.run(alt_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    if alt_result.returncode != 0:
-                        print(f"Alternative FFmpeg merge also failed: {alt_result.stderr.decode()}")
+        else:
+            raise Exception(f"Unknown download mode: {mode}")
+        
+    except Exception as e:
+        jobs.update(download_id, status=f"error: {str(e)}", progress=0, error=str(e))
+        # Stream URLs may have expired, make the next attempt resolve them again
+        metadata.invalidate(url)
+    finally:
+        _progress_context.callback = None
+        for path in held_paths:
+            coalescer.release(path)
+        if work is not None:
+            work.cleanup()
 
-                # Clean up temporary files
-                try:
-                    if os.path.exists(audio_path): os.remove(audio_path)
-                    if os.path.exists(video_path): os.remove(video_path)
-                except Exception as e:
-                    print(f"Cleanup error: {e}")
-                
-                download_status[download_id] = "completed"
-                download_progress[download_id] = 100
-                download_status[f"{download_id}_file"] = final_path
-                download_status[f"{download_id}_filename"] = final_filename
-                print(f"FFmpeg merge download completed: {final_filename}")
+def run_download_job(url, itag, mode, download_id, key):
+    """Run a download and hand its result to every job coalesced onto it"""
+    process_download(url, itag, mode, download_id)
+    job = jobs.get(download_id)
+    if job.status == "completed":
+        artifacts.add(key, job.file_path, job.filename)
+        for follower_id in coalescer.finish(key, download_id, job.file_path):
+            jobs.update(follower_id, status="completed", progress=100,
+                        file_path=job.file_path, filename=job.filename,
+                        extra={"merge": job.extra["merge"]} if "merge" in job.extra else None)
+    else:
+        for follower_id in coalescer.fail(key, download_id):
+            jobs.update(follower_id, status=job.status, progress=0, error=job.error)
+
+def job_changed(job):
+    """Wake progress streams of a job, and of the batch it belongs to"""
+    events.publish(job.job_id)
+    batch_id = job.extra.get("batch")
+    if batch_id:
+        events.publish(batch_id)
+        if job.finished:
+            finish_batch_if_done(batch_id)
+
+# Quality presets resolved on the server instead of an itag: best, smallest,
+# audio-best (or audio), an exact height such as 1080p or a ceiling such as <=720p
+QUALITY_PRESET_RE = re.compile(r'^(best|smallest|audio|audio-best|(<=)?(\d{3,4})p)$')
+QUALITY_PRESETS = "best, 1080p, <=720p, smallest or audio-best"
+
+def is_quality_preset(quality):
+    return isinstance(quality, str) and bool(QUALITY_PRESET_RE.match(quality))
+
+def choose_option(manifest, quality):
+    """Quality page option matching a quality preset, or None if no stream fits
+
+    A progressive stream wins over a merged one of the same resolution, as
+    it needs no merge step.
+    """
+    match = QUALITY_PRESET_RE.match(quality)
+    video_options, audio_options = build_quality_options(manifest)
+    if quality in ("audio", "audio-best"):
+        return audio_options[0] if audio_options else None
+    if quality == "smallest":
+        # Unknown sizes count as large, ties go to the lower resolution
+        return min(video_options, key=lambda option: (option["size_mb"] or float("inf"),
+                                                      quality_value(option["resolution"])), default=None)
+    if match.group(3):
+        height = int(match.group(3))
+        video_options = [option for option in video_options
+                         if (quality_value(option["resolution"]) <= height if match.group(2)
+                             else quality_value(option["resolution"]) == height)]
+    return max(video_options, key=lambda option: quality_value(option["resolution"]), default=None)
+
+def resolve_download(job_id, quality, priority=None, defer=False):
+    """Pick the stream for a quality choice of a resolving job and queue its download
+
+    With defer=True a full queue leaves the job 'waiting' instead of failing
+    it; start_waiting_downloads() queues it once there is room.
+    """
+    job = jobs.get(job_id)
+    if job is None or job.finished or "itag" in job.extra:
+        return
+    video_url = job.extra["url"]
+    try:
+        info = metadata.get(video_url)
+        option = choose_option(info.manifest, quality)
+        if option is None:
+            raise Exception(f"No {quality} stream available")
+        jobs.update(job_id, extra={"itag": option["itag"], "mode": option["download_type"],
+                                   "title": info.manifest["title"]})
+        start_download(job_id, video_url, option["itag"], option["download_type"], priority=priority, defer=defer)
+    except Exception as e:
+        jobs.update(job_id, status=f"error: {str(e)}", progress=0, error=str(e))
+
+# Quality choices of bulk API jobs are resolved here, off the request thread
+resolvers = ThreadPoolExecutor(max_workers=BATCH_RESOLVE_WORKERS, thread_name_prefix="resolve")
+
+# Playlists are expanded and resolved here, never on a fetch worker
+batch_runners = ThreadPoolExecutor(max_workers=BATCH_RESOLVE_WORKERS, thread_name_prefix="batch")
+
+# Expands playlist and channel URLs, replaceable with a fake in tests
+playlist_expander = expand_playlist
+
+_waiting_lock = threading.Lock()
+
+def start_waiting_downloads():
+    """Queue downloads left 'waiting' by a full queue, for as long as there is room
+
+    Runs whenever a worker takes a job off the queue. Each job is claimed in
+    the job store first, so with several server processes only one of them
+    queues it.
+    """
+    if not _waiting_lock.acquire(blocking=False):
+        return  # another thread is already filling the queue
+    try:
+        for job in jobs.with_status("waiting", "download"):
+            if not jobs.claim(job.job_id, "waiting", status="queued"):
+                continue
+            try:
+                # Still the in-flight download of its key, identical jobs keep following it
+                scheduler.submit(job.job_id, run_download_job, job.extra["url"], job.extra["itag"],
+                                 job.extra["mode"], job.job_id, job.extra["key"], priority=PRIORITY_LOW)
+            except QueueFullError:
+                jobs.update(job.job_id, status="waiting")
                 return
+            except Exception as e:
+                jobs.update(job.job_id, status=f"error: {str(e)}", progress=0, error=str(e))
+    finally:
+        _waiting_lock.release()
+
+def submit_batch(batch_id):
+    """Run a batch on the batch threads, owned by this process"""
+    jobs.update(batch_id, status="queued", extra={"runner": getattr(scheduler, "instance", None)})
+    batch_runners.submit(run_batch, batch_id)
 
+def run_batch(batch_id):
+    """Expand a playlist into download jobs, resolving a few videos at a time
+
+    Downloads are queued at low priority so single videos are not stuck
+    behind a long playlist; those that find the queue full wait until
+    workers make room. Running it again (after a restart) only resolves the
+    videos that were not queued yet.
+    """
+    batch = jobs.get(batch_id)
+    quality = batch.extra.get("quality", "best")
+    try:
+        children = batch.extra.get("children")
+        if children is None:
+            jobs.update(batch_id, status="expanding")
+            title, video_urls = playlist_expander(batch.extra["url"], BATCH_MAX_VIDEOS)
+            if not video_urls:
+                raise Exception("No videos found at this URL")
+            children = [f"{batch_id}-{index:04d}" for index in range(len(video_urls))]
+            for child_id, video_url in zip(children, video_urls):
+                jobs.create(child_id, "download", status="resolving",
+                            extra={"url": video_url, "batch": batch_id, **batch.extra.get("audio", {})})
+            jobs.update(batch_id, status="downloading", extra={"title": title, "children": children})
         else:
-            raise Exception(f"Unknown download mode: {mode}")
+            jobs.update(batch_id, status="downloading")
         
+        with ThreadPoolExecutor(max_workers=BATCH_RESOLVE_WORKERS, thread_name_prefix="batch-resolve") as pool:
+            list(pool.map(partial(resolve_download, quality=quality, priority=PRIORITY_LOW, defer=True), children))
+        jobs.update(batch_id, extra={"resolved": True})
+        start_waiting_downloads()
+        finish_batch_if_done(batch_id)
     except Exception as e:
-        download_status[download_id] = f"error: {str(e)}"
-        download_progress[download_id] = 0
+        print(f"Batch {batch_id} failed: {e}")
+        jobs.update(batch_id, status=f"error: {str(e)}", progress=0, error=str(e))
+
+def finish_batch_if_done(batch_id):
+    """Mark a batch completed once every one of its downloads has finished"""
+    batch = jobs.get(batch_id)
+    if batch is None or batch.status != "downloading":
+        return
+    children = [jobs.get(child_id) for child_id in batch.extra.get("children", [])]
+    if all(child is None or child.finished for child in children):
+        jobs.update(batch_id, status="completed", progress=100)
+
+scheduler.register(run_download_job, process_merge)
+scheduler.on_dequeue = start_waiting_downloads
+if SHARED_STATE:
+    # Workers take jobs queued by any process, not only after a local submit
+    scheduler.start()
+
+def start_download(download_id, url, itag, mode, priority=None, defer=False):
+    """Queue a download job, or attach it to an identical running or finished one
+
+    With defer=True a full queue leaves the job 'waiting' for
+    start_waiting_downloads() instead of raising QueueFullError.
+    """
+    key = download_key(url, itag, mode, jobs.get(download_id).extra)
+    cached = artifacts.lookup(key)
+    if cached:
+        file_path, filename = cached
+        coalescer.hold_for_job(file_path)
+        jobs.update(download_id, status="completed", progress=100, file_path=file_path,
+                    filename=filename, extra={"key": key, "reused": True})
+        print(f"Serving cached download for {key}: {filename}")
+        return
+    
+    # Written before joining: once this job follows another one, finishing
+    # that download may complete it at any moment
+    jobs.update(download_id, status="queued", progress=0)
+    role, target = coalescer.join(key, download_id)
+    if not SHARED_STATE:
+        # The shared job store records both while joining
+        jobs.update(download_id, extra={"key": key, "follows": target} if role == "follower" else {"key": key})
+    if role == "follower":
+        print(f"Attached download {download_id} to in-flight job {target}")
+    else:
+        try:
+            scheduler.submit(download_id, run_download_job, url, itag, mode, download_id, key,
+                             **({"priority": priority} if priority is not None else {}))
+        except QueueFullError as e:
+            if defer:
+                jobs.update(download_id, status="waiting")
+                return
+            for follower_id in coalescer.fail(key, download_id):
+                jobs.update(follower_id, status=f"error: {str(e)}", progress=0, error=str(e))
+            raise
+
+def holds_file(job):
+    """Whether a finished job keeps a reference on its file: downloads, and merges served from the cache"""
+    return (job.kind == "download" or job.extra.get("reused")) and job.status == "completed" and bool(job.file_path)
+
+def release_job_files(job):
+    """Drop the file reference of a job whose record expired"""
+    if holds_file(job):
+        coalescer.release_for_job(job.file_path)
+
+def recover_interrupted_jobs():
+    """Requeue jobs that were left unfinished when the server last stopped"""
+    # The references release_job_files() drops when these records expire
+    for job in jobs.completed("download") + jobs.completed("merge"):
+        if holds_file(job):
+            coalescer.hold_for_job(job.file_path)
+    adopted = artifacts.adopt_untracked(DOWNLOAD_FOLDER, "downloads") + artifacts.adopt_untracked(MERGED_FOLDER, "merged")
+    if adopted:
+        print(f"Indexed {adopted} existing files in the artifact cache")
+    # Scratch left by jobs that died with the previous server, running ones belong to other workers
+    swept = workspaces.sweep(in_use=scheduler.knows)
+    if swept:
+        print(f"Removed {swept} abandoned job workspaces")
+    
+    recovered = 0
+    for job in jobs.interrupted():
+        if scheduler.knows(job.job_id):
+            # Still queued or running in another worker process
+            continue
+        try:
+            if job.kind == "download" and job.extra.get("batch") and "itag" not in job.extra:
+                # Resolved again when its batch is recovered
+                continue
+            elif job.kind == "download" and job.status == "waiting":
+                # Queued by start_waiting_downloads() below
+                continue
+            elif job.kind == "download" and job.extra.get("quality") and "itag" not in job.extra:
+                resolvers.submit(resolve_download, job.job_id, job.extra["quality"])
+            elif job.kind == "batch":
+                if job.extra.get("resolved"):
+                    # Every video was queued, only the downloads themselves are left
+                    finish_batch_if_done(job.job_id)
+                    continue
+                if SHARED_STATE and scheduler.instance_alive(job.extra.get("runner")):
+                    continue  # still being resolved by another worker process
+                if not jobs.claim(job.job_id, job.status, status="queued"):
+                    continue  # another worker process recovered it first
+                submit_batch(job.job_id)
+            elif job.kind == "download" and job.extra.get("url"):
+                start_download(job.job_id, job.extra["url"], job.extra.get("itag"), job.extra.get("mode", "progressive"))
+            elif job.kind == "merge" and all(os.path.exists(job.extra.get(key) or "") for key in ("video_path", "audio_path")):
+                jobs.update(job.job_id, status="queued", progress=0)
+                scheduler.submit(job.job_id, process_merge, job.extra["video_path"], job.extra["audio_path"],
+                                 job.file_path, job.job_id)
+            else:
+                jobs.update(job.job_id, status="error" if job.kind == "merge" else "error: Interrupted by a server restart",
+                            progress=0, error="Interrupted by a server restart")
+                continue
+            recovered += 1
+        except QueueFullError as e:
+            jobs.update(job.job_id, status="error" if job.kind == "merge" else f"error: {str(e)}",
+                        progress=0, error=str(e))
+    start_waiting_downloads()
+    if recovered:
+        print(f"Recovered {recovered} interrupted jobs")
+
+_recovery_lock = threading.Lock()
+_recovery_done = False
+
+@app.before_request
+def recover_jobs_once():
+    """Run job recovery in the serving process on its first request
+
+    Every worker process runs it; with shared state jobs another worker
+    still knows about are left alone, so this is safe to repeat.
+    """
+    global _recovery_done
+    if _recovery_done:
+        return
+    with _recovery_lock:
+        if not _recovery_done:
+            _recovery_done = True
+            recover_interrupted_jobs()
 
 @app.route("/")
 def index():
@@ -479,37 +889,38 @@ def cleanup_storage():
     directory_type = data.get('type', 'all')  # 'downloads', 'uploads', 'merged', 'all'
     max_age_hours = data.get('max_age_hours', 24)  # Default: 24 hours
     
-    import time
     current_time = time.time()
     max_age_seconds = max_age_hours * 3600
     
-    cleaned_files = 0
-    freed_space = 0
+    # Downloads and merged outputs are indexed, only expired entries are visited
+    categories = ['downloads', 'merged'] if directory_type == 'all' else [directory_type]
+    categories = [category for category in categories if category in ('downloads', 'merged')]
+    cleaned_files, freed_space = artifacts.evict_older_than(max_age_seconds, categories) if categories else (0, 0)
     
-    directories_to_clean = []
-    if directory_type == 'all':
-        directories_to_clean = [DOWNLOAD_FOLDER, UPLOAD_FOLDER, MERGED_FOLDER]
-    elif directory_type == 'downloads':
-        directories_to_clean = [DOWNLOAD_FOLDER]
-    elif directory_type == 'uploads':
-        directories_to_clean = [UPLOAD_FOLDER]
-    elif directory_type == 'merged':
-        directories_to_clean = [MERGED_FOLDER]
-    
-    for directory in directories_to_clean:
-        if os.path.exists(directory):
-            for filename in os.listdir(directory):
-                file_path = os.path.join(directory, filename)
-                if os.path.isfile(file_path):
-                    file_age = current_time - os.path.getmtime(file_path)
-                    if file_age > max_age_seconds:
-                        try:
-                            file_size = os.path.getsize(file_path)
-                            os.remove(file_path)
-                            cleaned_files += 1
-                            freed_space += file_size
-                        except:
-                            pass
+    # Resumable partial downloads are not indexed, drop the ones nobody came back for
+    if 'downloads' in categories:
+        for path in stale_partials(DOWNLOAD_FOLDER, max_age_seconds):
+            if coalescer.in_use(path):
+                continue
+            file_size = os.path.getsize(path) if os.path.exists(path) else 0
+            remove_partial(path)
+            cleaned_files += 1
+            freed_space += file_size
+    
+    # Uploads only hold inputs of pending merges, walk that folder directly
+    if directory_type in ('all', 'uploads') and os.path.exists(UPLOAD_FOLDER):
+        for filename in os.listdir(UPLOAD_FOLDER):
+            file_path = os.path.join(UPLOAD_FOLDER, filename)
+            if os.path.isfile(file_path):
+                file_age = current_time - os.path.getmtime(file_path)
+                if file_age > max_age_seconds:
+                    try:
+                        file_size = os.path.getsize(file_path)
+                        os.remove(file_path)
+                        cleaned_files += 1
+                        freed_space += file_size
+                    except:
+                        pass
     
     freed_space_mb = round(freed_space / (1024 * 1024), 2)
     
@@ -520,6 +931,63 @@ def cleanup_storage():
         'freed_space_mb': freed_space_mb
     })
 
+def build_quality_options(manifest):
+    """Video and audio choices offered on the quality page for a manifest"""
+    streams = manifest["streams"]
+    
+    # Get all available streams - prioritize merged video+audio
+    video_streams = []
+    audio_streams = []
+    
+    # Get best audio stream for merging calculations
+    audio_only = sorted((stream for stream in streams if stream["type"] == "audio"),
+                        key=lambda stream: quality_value(stream["abr"]), reverse=True)
+    best_audio = audio_only[0] if audio_only else None
+    audio_size = round(best_audio["filesize"] / 1024 / 1024, 2) if best_audio and best_audio["filesize"] else 50
+    by_resolution = sorted((stream for stream in streams if stream["type"] == "video"),
+                           key=lambda stream: quality_value(stream["resolution"]), reverse=True)
+    
+    # Progressive streams (video + audio already merged)
+    for stream in by_resolution:
+        if stream["progressive"] and stream["subtype"] == "mp4" and stream["resolution"]:
+            size_mb = round(stream["filesize"] / 1024 / 1024, 2) if stream["filesize"] else 0
+            video_streams.append({
+                "resolution": stream["resolution"],
+                "size_mb": size_mb,
+                "itag": stream["itag"],
+                "type": "Ready to Download (Video+Audio)",
+                "fps": stream["fps"] or 30,
+                "download_type": "progressive"
+            })
+    
+    # Adaptive video streams (higher quality, will be merged with audio)
+    for stream in by_resolution:
+        if stream["adaptive"] and stream["mime_type"] == "video/mp4" and stream["resolution"]:
+            video_size = round(stream["filesize"] / 1024 / 1024, 2) if stream["filesize"] else 0
+            total_size = video_size + audio_size if video_size else 0
+            video_streams.append({
+                "resolution": stream["resolution"],
+                "size_mb": total_size,
+                "itag": stream["itag"],
+                "type": "High Quality (Auto-Merged)",
+                "fps": stream["fps"] or 30,
+                "download_type": "merge"
+            })
+    
+    # Audio-only streams
+    for stream in audio_only:
+        if stream["abr"]:
+            size_mb = round(stream["filesize"] / 1024 / 1024, 2) if stream["filesize"] else 0
+            audio_streams.append({
+                "quality": f"{stream['abr']} - {stream['audio_codec']}",
+                "size_mb": size_mb,
+                "itag": stream["itag"],
+                "type": "Audio Only",
+                "download_type": "audio"
+            })
+    
+    return video_streams, audio_streams
+    
 @app.route("/analyze", methods=["POST"])
 def analyze():
     try:
@@ -528,97 +996,24 @@ def analyze():
             flash("Please enter a YouTube URL", "error")
             return redirect(url_for('index'))
         
-        # Try to connect with retries
-        max_retries = 3
-        yt = None
+        if is_batch_url(url):
+            # Playlists and channels are downloaded as a batch
+            return render_template("batch.html", url=url, batch_id=None)
         
-        for attempt in range(max_retries):
-            try:
-                print(f"Analyze attempt {attempt + 1} for URL: {url}")
-                yt = YouTube(url, use_oauth=False, allow_oauth_cache=False)
-                
-                # Test connection by accessing title
-                _ = yt.title
-                print(f"Analysis successful on attempt {attempt + 1}")
-                break
-                
-            except Exception as e:
-                error_msg = str(e).lower()
-                print(f"Analysis attempt {attempt + 1} failed: {str(e)}")
-                
-                # Check for specific error types
-                if "private" in error_msg or "unavailable" in error_msg:
-                    raise Exception("This video is private or unavailable. Please check the URL and try a different video.")
-                elif "age" in error_msg and "restricted" in error_msg:
-                    raise Exception("This video is age-restricted and cannot be downloaded.")
-                elif "live" in error_msg:
-                    raise Exception("Live streams cannot be downloaded. Please wait until the stream ends.")
-                elif "premium" in error_msg or "members" in error_msg:
-                    raise Exception("This video requires YouTube Premium or channel membership.")
-                
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(2)  # Wait 2 seconds between retries
-                else:
-                    if "retries" in error_msg or "timeout" in error_msg or "connection" in error_msg:
-                        raise Exception("Network connection issue. Please check your internet connection and try again. If the problem persists, the video might be temporarily unavailable.")
-                    else:
-                        raise Exception(f"Could not access video after {max_retries} attempts. This might be due to network issues, video restrictions, or temporary YouTube problems. Error: {str(e)}")
-        
-        if not yt:
-            raise Exception("Could not create YouTube object")
-        
-        # Get all available streams - prioritize merged video+audio
-        video_streams = []
-        audio_streams = []
-        
-        # Get best audio stream for merging calculations
-        best_audio = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
-        audio_size = round(best_audio.filesize / 1024 / 1024, 2) if best_audio and best_audio.filesize else 50
-        
-        # Progressive streams (video + audio already merged)
-        for stream in yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc():
-            if stream.resolution:
-                size_mb = round(stream.filesize / 1024 / 1024, 2) if stream.filesize else 0
-                video_streams.append({
-                    "resolution": stream.resolution,
-                    "size_mb": size_mb,
-                    "itag": stream.itag,
-                    "type": "Ready to Download (Video+Audio)",
-                    "fps": getattr(stream, 'fps', 30),
-                    "download_type": "progressive"
-                })
-        
-        # Adaptive video streams (higher quality, will be merged with audio)
-        for stream in yt.streams.filter(adaptive=True, mime_type="video/mp4").order_by('resolution').desc():
-            if stream.resolution:
-                video_size = round(stream.filesize / 1024 / 1024, 2) if stream.filesize else 0
-                total_size = video_size + audio_size
-                video_streams.append({
-                    "resolution": stream.resolution,
-                    "size_mb": total_size,
-                    "itag": stream.itag,
-                    "type": "High Quality (Auto-Merged with MoviePy)",
-                    "fps": getattr(stream, 'fps', 30),
-                    "download_type": "merge"
-                })
-        
-        # Audio-only streams
-        for stream in yt.streams.filter(only_audio=True).order_by('abr').desc():
-            if stream.abr:
-                size_mb = round(stream.filesize / 1024 / 1024, 2) if stream.filesize else 0
-                audio_streams.append({
-                    "quality": f"{stream.abr} - {stream.audio_codec}",
-                    "size_mb": size_mb,
-                    "itag": stream.itag,
-                    "type": "Audio Only (MP3)",
-                    "download_type": "audio"
-                })
+        # The async server resolves the video before handing the request over
+        prefetch_error = request.environ.get("ytdl.analyze_error")
+        if prefetch_error:
+            raise Exception(prefetch_error)
+        
+        info = metadata.get(url)
+        video_streams, audio_streams = build_quality_options(info.manifest)
         
         return render_template("streams.html", 
-                             yt=yt, 
+                             yt=info.manifest, 
                              video_streams=video_streams, 
                              audio_streams=audio_streams,
+                             audio_format=AUDIO_FORMAT,
+                             audio_bitrate=AUDIO_BITRATE,
                              url=url)
         
     except Exception as e:
@@ -627,95 +1022,410 @@ def analyze():
 
 @app.route("/download", methods=["POST"])
 def download():
+    """Start a download of an itag, or of a quality preset picked on the server
+
+    JSON requests get the download ID back instead of the progress page.
+    """
+    data = (request.get_json(silent=True) if request.is_json else request.form) or {}
+    
+    def fail(message):
+        if request.is_json:
+            return jsonify({"success": False, "error": message}), 400
+        flash(message, "error")
+        return redirect(url_for('index'))
+    
     try:
-        url = request.form["url"]
-        itag = request.form["itag"]
-        download_type = request.form.get("download_type", "progressive")
+        url = (data.get("url") or "").strip()
+        itag = str(data.get("itag") or "")
+        quality = data.get("quality")
+        download_type = data.get("download_type", "progressive")
         
-        if not url or not itag:
-            flash("Missing required parameters", "error")
-            return redirect(url_for('index'))
+        if not url or not (itag or quality):
+            return fail("Missing required parameters")
+        if not itag and not is_quality_preset(quality):
+            return fail(f"Quality must be {QUALITY_PRESETS}")
+        try:
+            audio = audio_request_options(data)
+        except Exception as e:
+            return fail(str(e))
 
         # Generate download ID
-        download_id = str(int(datetime.datetime.now().timestamp() * 1000))
+        download_id = str(uuid.uuid4())
 
-        # Start download in background
-        thread = threading.Thread(target=process_download, args=(url, itag, download_type, download_id))
-        thread.daemon = True
-        thread.start()
+        if itag:
+            # Queue download for the fetch workers
+            jobs.create(download_id, "download",
+                        extra={"url": url, "itag": itag, "mode": download_type, **audio})
+            try:
+                start_download(download_id, url, itag, download_type)
+            except QueueFullError as e:
+                jobs.delete(download_id)
+                return fail(str(e))
+        else:
+            # The stream and download type come from the cached manifest,
+            # without a trip through the quality page
+            jobs.create(download_id, "download", status="resolving",
+                        extra={"url": url, "quality": quality, **audio})
+            resolvers.submit(resolve_download, download_id, quality)
 
+        if request.is_json:
+            return jsonify({"success": True, "download_id": download_id})
         return render_template("progress.html", download_id=download_id)
         
     except Exception as e:
+        return fail(f"Error: {str(e)}")
+
+@app.route("/stream")
+def stream_download():
+    """Send a download to the client while it is still being fetched
+
+    Progressive and audio streams are relayed as they arrive; merge mode
+    remuxes the video and audio URLs into a fragmented MP4 on the fly.
+    Nothing is stored on disk.
+    """
+    url = request.args.get("url", "")
+    itag = request.args.get("itag", "")
+    mode = request.args.get("download_type", "progressive")
+    if not url or not itag:
+        flash("Missing required parameters", "error")
+        return redirect(url_for('index'))
+    
+    try:
+        yt = metadata.get(url, need_object=True).yt
+        safe_title = sanitize_filename(yt.title)
+        stream = yt.streams.get_by_itag(itag)
+        if mode == "audio" and not stream:
+            stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
+        if not stream:
+            raise Exception("Selected stream not available")
+        
+        if mode == "merge":
+            audio_stream = pick_audio_stream(yt)
+            if not audio_stream:
+                raise Exception("No audio stream available")
+            plan = plan_merge({'video': codec_from_manifest(stream.video_codec)},
+                              {'audio': codec_from_manifest(audio_stream.audio_codec)})
+            print(f"Streaming {plan['method']} of itag {itag} with audio itag {audio_stream.itag}")
+            length, chunks = None, stream_fragmented_mp4(stream.url, audio_stream.url, plan)
+            filename = f"{safe_title}_{stream.resolution or 'HQ'}_merged.mp4"
+            mimetype = "video/mp4"
+        else:
+            length, chunks = open_url_stream(stream.url, segmented.session if segmented else None)
+            quality_info = stream.abr if mode == "audio" else stream.resolution
+            filename = f"{safe_title}_{quality_info}.{stream.subtype}" if quality_info else f"{safe_title}.{stream.subtype}"
+            mimetype = stream.mime_type
+        
+        # Fail here, before the response starts, if the source cannot be read at all
+        first = next(chunks, b"")
+    except Exception as e:
+        metadata.invalidate(url)
         flash(f"Error: {str(e)}", "error")
         return redirect(url_for('index'))
+    
+    headers = {
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+        # Keep reverse proxies from buffering the whole response
+        "X-Accel-Buffering": "no"
+    }
+    if length:
+        headers["Content-Length"] = str(length)
+    return Response(itertools.chain([first], chunks), mimetype=mimetype, headers=headers)
 
-@app.route("/progress_api/<download_id>")
-def get_progress(download_id):
-    """Get download progress as JSON"""
-    from flask import jsonify
-    status = download_status.get(download_id, "not_found")
-    progress = download_progress.get(download_id, 0)
+@app.route("/api/metadata-cache")
+def metadata_cache_stats():
+    """Get metadata cache hit/miss counters"""
+    return jsonify(metadata.stats())
+
+@app.route("/api/artifact-cache")
+def artifact_cache_stats():
+    """Get artifact cache usage"""
+    return jsonify(artifacts.stats())
+
+@app.route("/api/queue")
+def queue_stats():
+    """Get scheduler queue and worker usage"""
+    return jsonify(scheduler.stats())
+
+def download_progress(download_id):
+    """Progress of a download job as sent to the browser"""
+    job = jobs.get(download_id)
+    if job is None:
+        return {"status": "not_found", "progress": 0}
+    
+    # Coalesced jobs report the state of the download they are attached to
+    if not job.finished and job.extra.get("follows"):
+        job = jobs.get(job.extra["follows"]) or job
     
     response = {
-        "status": status,
-        "progress": progress
+        "status": job.status,
+        "progress": job.progress
     }
     
-    if status == "completed":
-        file_path = download_status.get(f"{download_id}_file")
-        filename = download_status.get(f"{download_id}_filename")
-        if file_path and os.path.exists(file_path):
+    if job.status == "queued":
+        response["queue_position"] = scheduler.queue_position(job.job_id)
+    elif job.transfer is not None and not job.finished:
+        # Speed and ETA are only worked out here, when someone asks
+        response.update(job.transfer.snapshot())
+    elif job.live and not job.finished:
+        # Encoder progress, or a transfer in another worker process: what was last stored
+        response.update(job.live)
+    elif job.status == "completed":
+        if job.file_path and os.path.exists(job.file_path):
             response["download_ready"] = True
-            response["filename"] = filename
+            response["filename"] = job.filename
+        if "merge" in job.extra:
+            response["merge"] = job.extra["merge"]
+    
+    return response
+
+@app.route("/progress_api/<download_id>")
+def get_progress(download_id):
+    """Get download progress as JSON"""
+    return jsonify(download_progress(download_id))
+
+def submit_api_job(item):
+    """Create and queue one job of a bulk request, returns its entry in the response"""
+    if not isinstance(item, dict):
+        return {"error": "Each job must be an object"}
+    url = str(item.get("url") or "").strip()
+    itag = item.get("itag")
+    quality = item.get("quality")
+    mode = item.get("mode", "progressive")
+    if not url:
+        return {"error": "Missing url"}
+    if itag is None and quality is None:
+        return {"error": "Give an itag or a quality"}
+    
+    try:
+        audio = audio_request_options(item)
+    except Exception as e:
+        return {"error": str(e)}
+    
+    job_id = str(uuid.uuid4())
+    if itag is None:
+        if not is_quality_preset(quality):
+            return {"error": f"Quality must be {QUALITY_PRESETS}"}
+        # Stream lookups can take seconds, they run after the response is sent
+        jobs.create(job_id, "download", status="resolving", extra={"url": url, "quality": quality, **audio})
+        resolvers.submit(resolve_download, job_id, quality)
+        return {"job_id": job_id, "status": "resolving"}
     
-    return jsonify(response)
+    itag = str(itag)
+    if not itag.isdigit():
+        return {"error": "itag must be a number"}
+    if mode not in ("progressive", "merge", "audio"):
+        return {"error": "mode must be progressive, merge or audio"}
+    jobs.create(job_id, "download", extra={"url": url, "itag": itag, "mode": mode, **audio})
+    try:
+        start_download(job_id, url, itag, mode)
+    except QueueFullError as e:
+        jobs.delete(job_id)
+        return {"error": str(e)}
+    return {"job_id": job_id, "status": jobs.get(job_id).status}
+
+@app.route("/api/jobs", methods=["POST"])
+def submit_api_jobs():
+    """Start many downloads from one JSON request
+
+    Body: {"jobs": [{"url": ..., "itag": ..., "mode": ...} or {"url": ..., "quality": ...}]}.
+    Entries of the response are in the same order, with a job_id or an error.
+    """
+    data = request.get_json(silent=True)
+    items = data.get("jobs") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a JSON list of jobs"}), 400
+    if len(items) > MAX_QUEUED_JOBS:
+        return jsonify({"error": f"At most {MAX_QUEUED_JOBS} jobs per request"}), 400
+    return jsonify({"jobs": [submit_api_job(item) for item in items]})
+
+def compact_status(job, followed=None):
+    """Status and progress of a job with only the fields that apply to it"""
+    state = followed if followed is not None and not job.finished else job
+    entry = {"status": state.status, "progress": state.progress}
+    if state.status == "queued":
+        entry["queue_position"] = scheduler.queue_position(state.job_id)
+    elif state.transfer is not None and state.transfer.total_bytes and not state.finished:
+        entry["progress"] = min(round(state.transfer.done_bytes / state.transfer.total_bytes * 100, 1), 100)
+    elif state.live and not state.finished:
+        entry["progress"] = state.live["progress"]
+    elif state.error:
+        entry["error"] = state.error
+    elif state.status == "completed" and state.file_path:
+        entry["file"] = url_for("download_file", download_id=job.job_id)
+    return entry
+
+@app.route("/api/jobs/status", methods=["GET", "POST"])
+def api_jobs_status():
+    """Status of many jobs at once, from ?ids=a,b,c or a JSON body {"ids": [...]}"""
+    if request.method == "POST":
+        data = request.get_json(silent=True)
+        ids = data.get("ids") if isinstance(data, dict) else data
+    else:
+        ids = [job_id for job_id in request.args.get("ids", "").split(",") if job_id]
+    if not isinstance(ids, list) or not all(isinstance(job_id, str) for job_id in ids):
+        return jsonify({"error": "Expected a list of job ids"}), 400
+    
+    found = jobs.get_many(ids)
+    followed = jobs.get_many([job.extra["follows"] for job in found.values()
+                              if not job.finished and job.extra.get("follows")])
+    return jsonify({"jobs": {
+        job_id: compact_status(found[job_id], followed.get(found[job_id].extra.get("follows")))
+        if job_id in found else {"status": "not_found"}
+        for job_id in ids
+    }})
+
+# Progress changes closer together than this are sent as one event
+EVENT_MIN_INTERVAL = 1.0
+EVENT_KEEPALIVE = 15
+# Jobs run by other worker processes publish no events here, so shared
+# state re-reads the job store this often
+EVENT_POLL_INTERVAL = 1.0 if SHARED_STATE else EVENT_KEEPALIVE
+
+# Every open stream holds a request thread, so only so many at once
+event_streams = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+def progress_events(job_id, payload_for):
+    """Server-Sent Events stream of a job's progress, sent only when it changes"""
+    job = jobs.get(job_id)
+    keys = [job_id]
+    if job is not None and job.extra.get("follows"):
+        # Coalesced jobs show the progress of the download they follow
+        keys.append(job.extra["follows"])
+    
+    with events.subscribe(*keys) as subscription:
+        yield "retry: 3000\n\n"
+        last = None
+        last_sent = time.monotonic()
+        while True:
+            payload = payload_for(job_id)
+            data = json.dumps(payload)
+            if data != last:
+                yield f"data: {data}\n\n"
+                last = data
+                last_sent = time.monotonic()
+            if payload["status"] in ("not_found", "unknown") or is_terminal(payload["status"]):
+                return
+            if not subscription.wait(EVENT_POLL_INTERVAL) and time.monotonic() - last_sent >= EVENT_KEEPALIVE:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            # Updates arriving meanwhile are picked up by the next payload
+            time.sleep(EVENT_MIN_INTERVAL)
+
+def progress_payload_for(job):
+    """Progress function matching the kind of a job"""
+    if job is not None and job.kind == "merge":
+        return merge_progress
+    if job is not None and job.kind == "batch":
+        return batch_progress
+    return download_progress
+
+@app.route("/events/<job_id>")
+def job_events(job_id):
+    """Push download, merge or batch progress to the browser as Server-Sent Events"""
+    if not event_streams.acquire(blocking=False):
+        # The pages fall back to polling when the stream cannot be opened
+        return Response("Too many progress streams", status=503, headers={"Retry-After": "5"})
+    try:
+        payload_for = progress_payload_for(jobs.get(job_id))
+    except Exception:
+        event_streams.release()
+        raise
+    response = Response(progress_events(job_id, payload_for), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(event_streams.release)
+    return response
+
+def plan_artifact_delivery(path, filename, get_header):
+    """How to answer a request for a finished file, tagged by its artifact cache entry"""
+    delivery = plan_delivery(path, filename, get_header, tag=artifacts.etag_for(path),
+                             mode=DELIVERY_MODE, accel_prefix=ACCEL_PREFIX, accel_root=ACCEL_ROOT)
+    if delivery.status in (200, 206) and delivery.start == 0:
+        # A download resumed over several ranges counts as one use
+        artifacts.touch_path(path)
+    return delivery
+
+def send_artifact(path, filename):
+    """Send a finished file with ETag, conditional and Range support, or hand it to the proxy"""
+    delivery = plan_artifact_delivery(path, filename, request.headers.get)
+    if not delivery.body:
+        return Response(status=delivery.status, headers=delivery.headers)
+    file_wrapper = request.environ.get("wsgi.file_wrapper")
+    if file_wrapper is not None:
+        # Servers such as gunicorn send this with sendfile(2), from the current
+        # offset for Content-Length bytes
+        f = open(path, "rb")
+        f.seek(delivery.start)
+        body = file_wrapper(f, 1024 * 1024)
+    else:
+        body = read_range(path, delivery.start, delivery.length)
+    return Response(body, status=delivery.status, headers=delivery.headers, direct_passthrough=True)
 
 @app.route("/download_file/<download_id>")
 def download_file(download_id):
     """Download the completed file"""
     try:
-        file_path = download_status.get(f"{download_id}_file")
-        filename = download_status.get(f"{download_id}_filename")
+        job = jobs.get(download_id)
         
-        if not file_path or not os.path.exists(file_path):
+        if not job or not job.file_path or not os.path.exists(job.file_path):
             flash("File not found or download not completed", "error")
             return redirect(url_for('index'))
         
         # Use the actual video title as filename
-        return send_file(file_path, as_attachment=True, download_name=filename)
+        return send_artifact(job.file_path, job.filename or os.path.basename(job.file_path))
         
     except Exception as e:
         flash(f"Error downloading file: {str(e)}", "error")
         return redirect(url_for('index'))
 
+# Uploads are probed from their first megabyte while the rest arrives
+upload_probes = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload-probe")
+
+def probe_partial(path):
+    """Probe a file from what has arrived so far, None if that is not enough
+    (e.g. an MP4 with its index at the end)"""
+    try:
+        return probe_inputs(path)[0]
+    except Exception:
+        return None
+
 @app.route("/merge-files", methods=["POST"])
 def merge_files():
     """Handle file upload and start merge process"""
+    # Generate unique merge ID
+    merge_id = str(uuid.uuid4())
+    probes = {}
+
+    def destination(field, filename):
+        # Secure filenames, written straight to their final place
+        if field not in ("video_file", "audio_file") or not filename:
+            return None
+        kind = "video" if field == "video_file" else "audio"
+        return os.path.join(UPLOAD_FOLDER, f"{merge_id}_{kind}_{secure_filename(filename) or kind}")
+
+    def start_probe(field, path):
+        probes[field] = upload_probes.submit(probe_partial, path)
+
     try:
-        if 'video_file' not in request.files or 'audio_file' not in request.files:
+        form, files = ingest_multipart(request.stream, request.content_type or "", request.content_length,
+                                       destination, max_file_bytes=MAX_UPLOAD_MB * 1024 * 1024,
+                                       max_request_bytes=MAX_UPLOAD_REQUEST_MB * 1024 * 1024,
+                                       on_header=start_probe if UPLOAD_EARLY_PROBE else None)
+    except UploadTooLarge as e:
+        return jsonify({"success": False, "error": str(e)}), 413
+    except UploadRejected as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+    try:
+        if 'video_file' not in files or 'audio_file' not in files:
+            for upload in files.values():
+                os.remove(upload.path)
             return jsonify({"success": False, "error": "Both video and audio files are required"})
         
-        video_file = request.files['video_file']
-        audio_file = request.files['audio_file']
-        output_name = request.form.get('output_name', '').strip()
-        
-        if video_file.filename == '' or audio_file.filename == '':
-            return jsonify({"success": False, "error": "Both files must be selected"})
-        
-        # Generate unique merge ID
-        merge_id = str(uuid.uuid4())
-        
-        # Secure filenames
-        video_filename = secure_filename(video_file.filename)
-        audio_filename = secure_filename(audio_file.filename)
-        
-        # Save uploaded files
-        video_path = os.path.join(UPLOAD_FOLDER, f"{merge_id}_video_{video_filename}")
-        audio_path = os.path.join(UPLOAD_FOLDER, f"{merge_id}_audio_{audio_filename}")
-        
-        video_file.save(video_path)
-        audio_file.save(audio_path)
+        video, audio = files['video_file'], files['audio_file']
+        video_path, audio_path = video.path, audio.path
+        output_name = form.get('output_name', '').strip()
         
         # Generate output filename
         if output_name:
@@ -723,49 +1433,170 @@ def merge_files():
             if not output_filename.endswith('.mp4'):
                 output_filename += '.mp4'
         else:
-            base_name = os.path.splitext(video_filename)[0]
+            base_name = os.path.splitext(secure_filename(video.filename) or "video")[0]
             output_filename = f"{base_name}_merged.mp4"
         
+        # Only applies if the inputs cannot be stream-copied
+        encode_profile = form.get('encode_profile', '').strip().lower()
+        if encode_profile:
+            try:
+                resolve_profile(encode_profile)
+            except Exception as e:
+                for path in (video_path, audio_path):
+                    os.remove(path)
+                return jsonify({"success": False, "error": str(e)})
+        
+        # The same pair of inputs merged before is served from the artifact cache
+        key = f"merge:{video.sha256}:{audio.sha256}" + (f":{encode_profile}" if encode_profile else "")
+        cached = artifacts.lookup(key)
+        if cached:
+            for path in (video_path, audio_path):
+                os.remove(path)
+            coalescer.hold_for_job(cached[0])
+            jobs.create(merge_id, "merge", status="completed", progress=100, file_path=cached[0],
+                        filename=output_filename, extra={"key": key, "reused": True})
+            print(f"Serving cached merge for {output_filename}")
+            return jsonify({"success": True, "merge_id": merge_id})
+        
         output_path = os.path.join(MERGED_FOLDER, f"{merge_id}_{output_filename}")
         
-        # Store merge info
-        merge_files[merge_id] = {
-            "output_path": output_path,
-            "output_filename": output_filename
-        }
+        # Probes that finished during the upload save the merge from probing again
+        probed = [probes[field].result() if field in probes and probes[field].done() else None
+                  for field in ("video_file", "audio_file")]
         
-        # Start merge process in background
-        merge_thread = threading.Thread(target=process_merge, args=(video_path, audio_path, output_path, merge_id))
-        merge_thread.daemon = True
-        merge_thread.start()
+        # Store merge info and queue merge process for the workers
+        jobs.create(merge_id, "merge", file_path=output_path, filename=output_filename,
+                    extra={"video_path": video_path, "audio_path": audio_path, "key": key,
+                           "probe": probed if all(probed) else None, "encode_profile": encode_profile or None})
+        try:
+            scheduler.submit(merge_id, process_merge, video_path, audio_path, output_path, merge_id)
+        except QueueFullError as e:
+            for path in (video_path, audio_path):
+                if os.path.exists(path): os.remove(path)
+            jobs.delete(merge_id)
+            return jsonify({"success": False, "error": str(e)})
         
         return jsonify({"success": True, "merge_id": merge_id})
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+@app.route("/batch", methods=["POST"])
+def start_batch():
+    """Download every video of a playlist or channel, from the form or a JSON body"""
+    data = request.get_json(silent=True) if request.is_json else request.form
+    data = data or {}
+    url = (data.get("url") or "").strip()
+    quality = data.get("quality", "best")
+    
+    def fail(message):
+        if request.is_json:
+            return jsonify({"success": False, "error": message}), 400
+        flash(message, "error")
+        return redirect(url_for('index'))
+    
+    if not is_batch_url(url):
+        return fail("Please enter a YouTube playlist or channel URL")
+    if not is_quality_preset(quality):
+        return fail(f"Quality must be {QUALITY_PRESETS}")
+    
+    try:
+        audio = audio_request_options(data)
+    except Exception as e:
+        return fail(str(e))
+    
+    batch_id = str(uuid.uuid4())
+    jobs.create(batch_id, "batch", extra={"url": url, "quality": quality, "audio": audio})
+    submit_batch(batch_id)
+    
+    if request.is_json:
+        return jsonify({"success": True, "batch_id": batch_id})
+    return render_template("batch.html", url=url, batch_id=batch_id)
+
+def batch_progress(batch_id):
+    """Totals of a batch plus the progress of each of its downloads"""
+    batch = jobs.get(batch_id)
+    if batch is None or batch.kind != "batch":
+        return {"status": "not_found", "progress": 0}
+    
+    items = []
+    for child_id in batch.extra.get("children", []):
+        child = jobs.get(child_id)
+        payload = download_progress(child_id)
+        items.append({"job_id": child_id, "title": child.extra.get("title") if child else None,
+                      "status": payload["status"], "progress": payload["progress"]})
+    
+    response = {"status": batch.status, "title": batch.extra.get("title")}
+    response.update(summarize(items))
+    response["items"] = items
+    if batch.status == "queued":
+        response["queue_position"] = scheduler.queue_position(batch_id)
+    elif batch.error:
+        response["error"] = batch.error
+    return response
+
+@app.route("/batch/<batch_id>")
+def get_batch_progress(batch_id):
+    """Get batch progress as JSON"""
+    return jsonify(batch_progress(batch_id))
+
+@app.route("/batch/<batch_id>/zip")
+def download_batch_zip(batch_id):
+    """Download the finished files of a batch as one ZIP, built while it streams"""
+    batch = jobs.get(batch_id)
+    if batch is None or batch.kind != "batch":
+        flash("Batch not found", "error")
+        return redirect(url_for('index'))
+    
+    finished = [child for child in (jobs.get(child_id) for child_id in batch.extra.get("children", []))
+                if child is not None and child.status == "completed"
+                and child.file_path and os.path.exists(child.file_path)]
+    if not finished:
+        flash("No downloads of this batch have finished yet", "error")
+        return redirect(url_for('index'))
+    
+    paths = [child.file_path for child in finished]
+    names = unique_names([child.filename or os.path.basename(child.file_path) for child in finished])
+    # Cleanup must not remove a file while it is being zipped
+    for path in paths:
+        coalescer.acquire(path)
+    archive_name = sanitize_filename(batch.extra.get("title") or "playlist") + ".zip"
+    response = Response(stream_zip(zip(names, paths)), mimetype="application/zip",
+                        headers={"Content-Disposition": content_disposition(archive_name)})
+    response.call_on_close(lambda: [coalescer.release(path) for path in paths])
+    return response
+
+def merge_progress(merge_id):
+    """Progress of a merge job as sent to the browser"""
+    job = jobs.get(merge_id)
+    if job is None:
+        return {"status": "unknown", "progress": 0}
+        
+    response = {
+        "status": job.status,
+        "progress": job.progress
+    }
+    
+    if job.status == "queued":
+        response["queue_position"] = scheduler.queue_position(merge_id)
+    elif job.live and not job.finished:
+        # Encoder progress, fps and ETA
+        response.update(job.live)
+    elif job.status == "completed":
+        response["download_url"] = f"/download-merged/{merge_id}"
+        response["filename"] = job.filename or "merged_video.mp4"
+        if "merge" in job.extra:
+            response["merge"] = job.extra["merge"]
+    elif job.status == "error":
+        response["error"] = job.error or "Unknown error occurred"
+    
+    return response
+
 @app.route("/merge-progress/<merge_id>")
 def get_merge_progress(merge_id):
     """Get merge progress"""
     try:
-        status = merge_status.get(merge_id, "unknown")
-        progress = merge_progress.get(merge_id, 0)
-        
-        response = {
-            "status": status,
-            "progress": progress
-        }
-        
-        if status == "completed":
-            merge_info = merge_files.get(merge_id, {})
-            response["download_url"] = f"/download-merged/{merge_id}"
-            response["filename"] = merge_info.get("output_filename", "merged_video.mp4")
-        elif status == "error":
-            merge_info = merge_files.get(merge_id, {})
-            response["error"] = merge_info.get("error", "Unknown error occurred")
-        
-        return jsonify(response)
-        
+        return jsonify(merge_progress(merge_id))
     except Exception as e:
         return jsonify({"status": "error", "progress": 0, "error": str(e)})
 
@@ -773,19 +1604,19 @@ def get_merge_progress(merge_id):
 def download_merged(merge_id):
     """Download merged file"""
     try:
-        merge_info = merge_files.get(merge_id)
-        if not merge_info:
+        job = jobs.get(merge_id)
+        if not job or job.kind != "merge":
             flash("Merge not found", "error")
             return redirect(url_for('index'))
         
-        output_path = merge_info["output_path"]
-        output_filename = merge_info["output_filename"]
+        output_path = job.file_path
+        output_filename = job.filename
         
         if not os.path.exists(output_path):
             flash("Merged file not found", "error")
             return redirect(url_for('index'))
         
-        return send_file(output_path, as_attachment=True, download_name=output_filename)
+        return send_artifact(output_path, output_filename or os.path.basename(output_path))
         
     except Exception as e:
         flash(f"Download error: {str(e)}", "error")
@@ -798,7 +1629,7 @@ if __name__ == "__main__":
     print("Access at: http://localhost:5000")
     if SERVER_MODE:
         print("Network access: http://[server-ip]:5000")
-    print("MoviePy integration for seamless merging")
+    print("FFmpeg stream-copy merging")
     print("Built-in file merger tool")
     print("Network retry logic")
     if SERVER_MODE:
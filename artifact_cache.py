@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Artifact cache for YouTube Downloader
+Indexes finished files by what they contain (video ID, itag, mode) so repeat
+requests are served from disk, and keeps storage under a byte budget by
+evicting least recently (or least frequently) used files in the background
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+def artifact_dirname(key):
+    """Directory name holding the files of one artifact key"""
+    return re.sub(r'[^0-9A-Za-z_-]', '_', key)[:120]
+
+class ArtifactCache:
+    """SQLite index of finished files with size-bounded eviction"""
+
+    def __init__(self, db_path, max_bytes, policy="lru", in_use=None, batch_size=16, low_water=0.9):
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.in_use = in_use or (lambda path: False)
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS artifacts (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                filename TEXT,
+                category TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS artifacts_last_access ON artifacts (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS artifacts_hits ON artifacts (hits, last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS artifacts_path ON artifacts (path)")
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+
+    def add(self, key, path, filename, category="downloads"):
+        """Index a finished file, scheduling eviction when over budget"""
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM artifacts WHERE key = ?", (key,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            self._conn.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                               (key, path, filename, category, size, now, now))
+            self.total_bytes += size
+        if self.total_bytes > self.max_bytes:
+            self._start()
+            self._wakeup.set()
+
+    def lookup(self, key):
+        """Return (path, filename) of a cached artifact and mark it as used"""
+        with self._lock:
+            row = self._conn.execute("SELECT path, filename, size FROM artifacts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            path, filename, size = row
+            if not os.path.exists(path):
+                # Removed behind our back, forget it
+                self._conn.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+                self.total_bytes -= size
+                return None
+            self._conn.execute("UPDATE artifacts SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                               (time.time(), key))
+            return path, filename
+
+    def touch_path(self, path):
+        """Mark an artifact as used when it is served by path"""
+        with self._lock:
+            self._conn.execute("UPDATE artifacts SET last_access = ?, hits = hits + 1 WHERE path = ?",
+                               (time.time(), path))
+
+    def etag_for(self, path):
+        """Validator for an indexed file from its key, size and when it was stored, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT key, size, created FROM artifacts WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        return hashlib.sha1(f"{row[0]}:{row[1]}:{row[2]}".encode()).hexdigest()[:20]
+
+    def adopt_untracked(self, directory, category):
+        """Index files in a directory that predate the cache, returns how many were added"""
+        if not os.path.isdir(directory):
+            return 0
+        adopted = 0
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            with self._lock:
+                known = self._conn.execute("SELECT 1 FROM artifacts WHERE path = ?", (entry.path,)).fetchone()
+            if known:
+                continue
+            stat = entry.stat()
+            with self._lock:
+                self._conn.execute("INSERT OR IGNORE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                                   (f"untracked:{entry.path}", entry.path, entry.name, category,
+                                    stat.st_size, stat.st_mtime, stat.st_mtime))
+                self.total_bytes += stat.st_size
+            adopted += 1
+        return adopted
+
+    def evict_older_than(self, max_age_seconds, categories=None):
+        """Remove artifacts not used within max_age_seconds
+
+        Walks only the matching index rows, not the directories. Returns
+        (files removed, bytes freed).
+        """
+        cutoff = time.time() - max_age_seconds
+        query = "SELECT key, path, size FROM artifacts WHERE last_access < ?"
+        params = [cutoff]
+        if categories:
+            query += f" AND category IN ({', '.join('?' for _ in categories)})"
+            params += list(categories)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return self._remove(rows)
+
+    def refresh_total(self):
+        """Re-read the indexed size, which other processes sharing the index change too"""
+        with self._lock:
+            self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+        return self.total_bytes
+
+    def evict_to_budget(self):
+        """Evict one batch of entries while over budget, returns bytes freed"""
+        self.refresh_total()
+        target = self.max_bytes * self.low_water
+        if self.total_bytes <= target:
+            return 0
+        order = "hits ASC, last_access ASC" if self.policy == "lfu" else "last_access ASC"
+        batch = []
+        excess = self.total_bytes - target
+        with self._lock:
+            # The cursor stops as soon as a batch is collected
+            for key, path, size in self._conn.execute(f"SELECT key, path, size FROM artifacts ORDER BY {order}"):
+                if self.in_use(path):
+                    continue
+                batch.append((key, path, size))
+                excess -= size
+                if excess <= 0 or len(batch) >= self.batch_size:
+                    break
+        return self._remove(batch)[1]
+
+    def stats(self):
+        """Index size and budget usage"""
+        self.refresh_total()
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+        return {
+            "artifacts": count,
+            "total_mb": round(self.total_bytes / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+            "policy": self.policy
+        }
+
+    def _remove(self, rows):
+        removed = 0
+        freed = 0
+        for key, path, size in rows:
+            if self.in_use(path):
+                continue
+            directory = os.path.dirname(path)
+            try:
+                if os.path.basename(directory) == artifact_dirname(key):
+                    shutil.rmtree(directory, ignore_errors=True)
+                elif os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"Could not evict {path}: {e}")
+                continue
+            with self._lock:
+                self._conn.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+                self.total_bytes -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._evictor, name="artifact-evictor")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _evictor(self):
+        while True:
+            self._wakeup.wait(60)
+            self._wakeup.clear()
+            # Small batches keep each pass short and let new requests in between
+            while self.total_bytes > self.max_bytes * self.low_water:
+                if not self.evict_to_budget():
+                    break
+                time.sleep(0.1)
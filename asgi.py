@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for YouTube Downloader
+Serves /analyze, progress, event and file download routes from an asyncio
+loop so slow YouTube lookups and long-lived connections do not each hold a
+thread; every other route is handed to the Flask app in a worker thread
+
+Run with: python asgi.py  (requires uvicorn: pip install uvicorn)
+"""
+
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as web
+from config import HOST, PORT, ASGI_THREADS, print_config_info
+from batches import is_batch_url
+from job_store import is_terminal
+
+executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi-blocking")
+
+FILE_CHUNK_SIZE = 256 * 1024
+
+async def run_blocking(func, *args):
+    """Run a blocking call in the worker pool"""
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+async def fetch_youtube_async(url):
+    """fetch_youtube() that waits between attempts without holding a thread"""
+    for attempt in range(web.YOUTUBE_RETRIES):
+        try:
+            print(f"Attempt {attempt + 1} to access YouTube URL: {url}")
+            return await run_blocking(web.open_youtube, url)
+        except Exception as e:
+            print(f"Attempt {attempt + 1} failed: {str(e)}")
+            failure = web.youtube_failure(e, attempt)
+            if failure is not None:
+                raise failure
+            await asyncio.sleep(web.retry_wait(attempt))
+    raise Exception("Could not create YouTube object")
+
+async def read_body(receive):
+    """Read the request body, spooling large uploads to a temporary file"""
+    body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body.write(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    body.seek(0)
+    return body
+
+class ReceiveStream(io.RawIOBase):
+    """wsgi.input that pulls the request body from the ASGI channel as the app reads it
+
+    Read from a worker thread, so uploads go straight to wherever the
+    route writes them instead of being spooled first.
+    """
+
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.buffer = b""
+        self.offset = 0
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.offset >= len(self.buffer) and not self.finished:
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            if message["type"] == "http.disconnect":
+                self.finished = True
+                break
+            self.buffer = message.get("body", b"")
+            self.offset = 0
+            self.finished = not message.get("more_body")
+        count = min(len(b), len(self.buffer) - self.offset)
+        b[:count] = self.buffer[self.offset:self.offset + count]
+        self.offset += count
+        return count
+
+def watch_disconnect(receive):
+    """Event set once the client goes away, for handlers that stream"""
+    disconnected = asyncio.Event()
+
+    async def watch():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    return disconnected, asyncio.ensure_future(watch())
+
+async def send_start(send, status, content_type, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode())] +
+                   [(name.encode(), str(value).encode("latin-1")) for name, value in headers]
+    })
+
+async def send_json(send, data, status=200):
+    body = json.dumps(data).encode()
+    await send_start(send, status, "application/json", [("content-length", len(body))])
+    await send({"type": "http.response.body", "body": body})
+
+class WsgiBridge:
+    """Runs the Flask app for a request in the worker pool
+
+    Response bodies are pulled one chunk at a time, so streaming routes such
+    as /stream keep streaming.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send, body=None, extra_environ=None):
+        if body is None:
+            body = ReceiveStream(receive, asyncio.get_running_loop())
+        environ = self.environ(scope, body)
+        if extra_environ:
+            environ.update(extra_environ)
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+            return lambda data: None
+
+        result = await run_blocking(self.wsgi_app, environ, start_response)
+        chunks = iter(result)
+        try:
+            chunk = await run_blocking(next, chunks, None)
+            await send({
+                "type": "http.response.start",
+                "status": started["status"],
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                            for name, value in started["headers"]]
+            })
+            while chunk is not None:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                chunk = await run_blocking(next, chunks, None)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                await run_blocking(result.close)
+            body.close()
+
+    @staticmethod
+    def environ(scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", ""),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "REMOTE_ADDR": client[0],
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.input_terminated": True,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+                environ[name] = value
+                continue
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+flask_bridge = WsgiBridge(web.app)
+
+async def analyze(scope, receive, send):
+    """Resolve the video without blocking, then let Flask render the page from the cache"""
+    body = await read_body(receive)
+    extra = {}
+    content_type = dict(scope["headers"]).get(b"content-type", b"")
+    if content_type.startswith(b"application/x-www-form-urlencoded"):
+        form = parse_qs(body.read().decode("utf-8", "replace"))
+        body.seek(0)
+        url = (form.get("url") or [""])[0]
+        if url and not is_batch_url(url):
+            try:
+                await web.metadata.get_async(url, fetch_youtube_async, run_blocking)
+            except Exception as e:
+                extra["ytdl.analyze_error"] = str(e)
+    await flask_bridge(scope, receive, send, body=body, extra_environ=extra)
+
+# Job lookups read the jobs database and the filesystem, so every one of them
+# runs in the worker pool rather than on the event loop
+
+async def progress(scope, receive, send, job_id):
+    await send_json(send, await run_blocking(web.download_progress, job_id))
+
+async def merge_progress(scope, receive, send, job_id):
+    try:
+        await send_json(send, await run_blocking(web.merge_progress, job_id))
+    except Exception as e:
+        await send_json(send, {"status": "error", "progress": 0, "error": str(e)})
+
+async def job_events(scope, receive, send, job_id):
+    """Server-Sent Events like the Flask /events route, with no thread per client"""
+    job = await run_blocking(web.jobs.get, job_id)
+    payload_for = web.progress_payload_for(job)
+    keys = [job_id]
+    if job is not None and job.extra.get("follows"):
+        keys.append(job.extra["follows"])
+
+    disconnected, watcher = watch_disconnect(receive)
+    await send_start(send, 200, "text/event-stream", [("cache-control", "no-cache"), ("x-accel-buffering", "no")])
+    try:
+        with web.events.subscribe_async(*keys) as subscription:
+            await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+            last = None
+            last_sent = time.monotonic()
+            while not disconnected.is_set():
+                payload = await run_blocking(payload_for, job_id)
+                data = json.dumps(payload)
+                if data != last:
+                    await send({"type": "http.response.body", "body": f"data: {data}\n\n".encode(), "more_body": True})
+                    last = data
+                    last_sent = time.monotonic()
+                if payload["status"] in ("not_found", "unknown") or is_terminal(payload["status"]):
+                    break
+                if (not await subscription.wait(web.EVENT_POLL_INTERVAL)
+                        and time.monotonic() - last_sent >= web.EVENT_KEEPALIVE):
+                    await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+                    last_sent = time.monotonic()
+                await asyncio.sleep(web.EVENT_MIN_INTERVAL)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        watcher.cancel()
+
+async def send_file(scope, send, path, filename):
+    """Send a file with ETag, conditional and Range support
+
+    Uses the server's zero-copy send extension when it offers one, else
+    reads chunks in the worker pool.
+    """
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+    delivery = await run_blocking(web.plan_artifact_delivery, path, filename, lambda name: headers.get(name.lower()))
+    await send({
+        "type": "http.response.start",
+        "status": delivery.status,
+        "headers": [(name.lower().encode(), value.encode("latin-1")) for name, value in delivery.headers]
+    })
+    if not delivery.body:
+        await send({"type": "http.response.body", "body": b""})
+        return
+    f = await run_blocking(open, path, "rb")
+    try:
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            await send({"type": "http.response.zerocopysend", "file": f,
+                        "offset": delivery.start, "count": delivery.length})
+            return
+        await run_blocking(f.seek, delivery.start)
+        remaining = delivery.length
+        while remaining > 0:
+            chunk = await run_blocking(f.read, min(FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        await run_blocking(f.close)
+
+def finished_file(job_id, kind=None):
+    """The job if its file is there to send, else None"""
+    job = web.jobs.get(job_id)
+    if job is None or (kind and job.kind != kind) or not job.file_path or not os.path.exists(job.file_path):
+        return None
+    return job
+
+async def download_file(scope, receive, send, job_id):
+    job = await run_blocking(finished_file, job_id)
+    if job is None:
+        # Flask renders the error flash and redirect
+        return await flask_bridge(scope, receive, send)
+    await send_file(scope, send, job.file_path, job.filename or os.path.basename(job.file_path))
+
+async def download_merged(scope, receive, send, job_id):
+    job = await run_blocking(finished_file, job_id, "merge")
+    if job is None:
+        return await flask_bridge(scope, receive, send)
+    await send_file(scope, send, job.file_path, job.filename or os.path.basename(job.file_path))
+
+ROUTES = [
+    ("POST", re.compile(r"^/analyze$"), analyze),
+    ("GET", re.compile(r"^/progress_api/([^/]+)$"), progress),
+    ("GET", re.compile(r"^/merge-progress/([^/]+)$"), merge_progress),
+    ("GET", re.compile(r"^/events/([^/]+)$"), job_events),
+    ("GET", re.compile(r"^/download_file/([^/]+)$"), download_file),
+    ("GET", re.compile(r"^/download-merged/([^/]+)$"), download_merged),
+]
+
+async def application(scope, receive, send):
+    """ASGI application: async routes first, everything else through Flask"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # The Flask before_request hook never sees requests served here
+                await run_blocking(web.recover_jobs_once)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    for method, pattern, handler in ROUTES:
+        if scope["method"] == method:
+            match = pattern.match(scope["path"])
+            if match:
+                return await handler(scope, receive, send, *match.groups())
+    await flask_bridge(scope, receive, send)
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        print("The ASGI server needs uvicorn: pip install uvicorn")
+        sys.exit(1)
+    print_config_info()
+    print(f"\nYouTube Downloader - ASGI mode at http://localhost:{PORT}")
+    uvicorn.run(application, host=HOST, port=PORT, log_level="warning")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Audio extraction for YouTube Downloader
+Turns an audio-only stream into a properly labelled audio file: the stream
+is copied into the container of its codec (.m4a, .opus) or transcoded to
+MP3/AAC, with the downloaded bytes piped into FFmpeg as they arrive
+"""
+
+import os
+import subprocess
+import threading
+
+from merger import get_ffmpeg_path, has_encoder
+
+# 'copy' keeps the stream's codec, the others re-encode at a bitrate
+AUDIO_FORMATS = ('copy', 'mp3', 'aac')
+MIN_BITRATE = 32
+MAX_BITRATE = 320
+
+# Source codec -> (extension, FFmpeg muxer) when copying
+_COPY_CONTAINERS = {'aac': ('m4a', 'ipod'), 'opus': ('opus', 'opus'), 'vorbis': ('ogg', 'ogg'),
+                    'mp3': ('mp3', 'mp3')}
+# Output format -> (extension, FFmpeg encoder, muxer) when transcoding
+_ENCODERS = {'mp3': ('mp3', 'libmp3lame', 'mp3'), 'aac': ('m4a', 'aac', 'ipod')}
+
+def check_audio_options(audio_format, bitrate):
+    """Validate an output format and bitrate (kbps), returns them normalized"""
+    if audio_format not in AUDIO_FORMATS:
+        raise Exception(f"Audio format must be one of {', '.join(AUDIO_FORMATS)}")
+    try:
+        bitrate = int(bitrate)
+    except (TypeError, ValueError):
+        raise Exception("Audio bitrate must be a number of kbps")
+    if not MIN_BITRATE <= bitrate <= MAX_BITRATE:
+        raise Exception(f"Audio bitrate must be between {MIN_BITRATE} and {MAX_BITRATE} kbps")
+    if audio_format != 'copy' and not has_encoder(_ENCODERS[audio_format][1]):
+        raise Exception(f"This FFmpeg build cannot encode {audio_format.upper()}")
+    return audio_format, bitrate
+
+def audio_variant(audio_format, bitrate):
+    """Short label telling outputs of the same stream apart, e.g. 'mp3-192k'"""
+    return 'copy' if audio_format == 'copy' else f"{audio_format}-{bitrate}k"
+
+def audio_extension(audio_format, codec):
+    """Extension of the file written for an output format and source codec"""
+    if audio_format == 'copy':
+        # Unknown codecs keep a Matroska audio container, which holds anything
+        return _COPY_CONTAINERS.get(codec, ('mka', 'matroska'))[0]
+    return _ENCODERS[audio_format][0]
+
+def build_audio_command(ffmpeg, source, output_path, audio_format, codec, bitrate):
+    """FFmpeg arguments writing the first audio stream of source to output_path"""
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-i', source, '-vn', '-map', '0:a:0']
+    if audio_format == 'copy':
+        muxer = _COPY_CONTAINERS.get(codec, ('mka', 'matroska'))[1]
+        cmd += ['-c:a', 'copy']
+    else:
+        _, encoder, muxer = _ENCODERS[audio_format]
+        cmd += ['-c:a', encoder, '-b:a', f'{bitrate}k']
+    if muxer == 'ipod':
+        cmd += ['-movflags', '+faststart']
+    return cmd + ['-f', muxer, output_path]
+
+def extract_audio(source, output_path, audio_format, codec, bitrate=192):
+    """Write source as an audio file in the requested format
+
+    source is a file path, or an iterable of byte chunks (e.g. a download in
+    progress) fed to FFmpeg's stdin so the original is never stored. The
+    output is removed if anything fails.
+    """
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        raise Exception("FFmpeg is not available")
+
+    piped = not isinstance(source, str)
+    process = subprocess.Popen(build_audio_command(ffmpeg, 'pipe:0' if piped else source, output_path,
+                                                   audio_format, codec, bitrate),
+                               stdin=subprocess.PIPE if piped else subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # Drained on the side so FFmpeg never blocks on a full stderr pipe
+    errors = []
+    reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+    reader.start()
+    try:
+        if piped:
+            try:
+                for chunk in source:
+                    process.stdin.write(chunk)
+            except BrokenPipeError:
+                # FFmpeg gave up on the input, its error is reported below
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+        returncode = process.wait()
+        reader.join()
+        if returncode != 0:
+            message = b"".join(errors).decode(errors='replace').strip()
+            raise Exception(f"FFmpeg audio {'copy' if audio_format == 'copy' else 'encode'} failed: {message}")
+    except BaseException:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        reader.join()
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    finally:
+        process.stderr.close()
+    return output_path
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Playlist and channel batches for YouTube Downloader
+Expands a playlist or channel URL into its video URLs and sums up the
+progress of the download jobs a batch was split into
+"""
+
+import itertools
+import re
+from urllib.parse import urlparse
+
+_CHANNEL_PATH_RE = re.compile(r'^/(@[^/]+|channel/[^/]+|c/[^/]+|user/[^/]+)(/videos)?/?$')
+
+def is_batch_url(url):
+    """Whether a URL names a playlist or a channel rather than one video"""
+    parsed = urlparse(url.strip())
+    if not parsed.netloc.endswith(("youtube.com", "youtu.be")):
+        return False
+    return parsed.path == "/playlist" or bool(_CHANNEL_PATH_RE.match(parsed.path))
+
+def expand_playlist(url, limit):
+    """Title and up to limit video URLs of a playlist or channel, in order"""
+    from pytubefix import Channel, Playlist
+
+    if urlparse(url.strip()).path == "/playlist":
+        playlist = Playlist(url)
+        title = playlist.title
+    else:
+        playlist = Channel(url)
+        title = playlist.channel_name
+    # video_urls loads further pages only as it is iterated
+    return title, list(itertools.islice(playlist.video_urls, limit))
+
+def summarize(items):
+    """Batch totals from the progress payloads of its jobs"""
+    completed = sum(1 for item in items if item["status"] == "completed")
+    failed = sum(1 for item in items if item["status"].startswith("error"))
+    progress = sum(100 if item["status"].startswith("error") else item["progress"] or 0 for item in items)
+    return {
+        "total": len(items),
+        "completed": completed,
+        "failed": failed,
+        "progress": round(progress / len(items), 1) if items else 0
+    }
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark: encode profiles and per-encoder thread counts on the CPU
+Generates synthetic clips that have to be re-encoded, then times every
+profile on one clip, and several clips encoded at once with x264 left to
+pick its own thread count versus the cores split between the encoders (what
+YT_ENCODE_THREADS=0 does). No network or GPU is used
+
+Usage: python benchmarks/bench_encode_profiles.py [seconds] [WIDTHxHEIGHT] [concurrent encodes]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from merger import ENCODE_PROFILES, build_merge_command, get_ffmpeg_path, run_ffmpeg
+
+PLAN = {"method": "reencode", "video": "encode", "audio": "encode"}
+
+def make_source(ffmpeg, path, seconds, size):
+    """MPEG-2 video and MP2 audio in Matroska, so the merge has to re-encode"""
+    subprocess.run([ffmpeg, "-v", "error", "-y",
+                    "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}",
+                    "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                    "-c:v", "mpeg2video", "-q:v", "3", "-c:a", "mp2", path], check=True)
+
+def encode(ffmpeg, source, output, profile, threads=0):
+    returncode, errors = run_ffmpeg(build_merge_command(ffmpeg, source, source, output, PLAN,
+                                                        profile=profile, threads=threads))
+    if returncode != 0:
+        raise Exception(f"{profile}: {errors}")
+
+def encode_together(ffmpeg, source, workdir, count, profile, threads):
+    """Wall time of count simultaneous encodes"""
+    workers = [threading.Thread(target=encode, args=(ffmpeg, source, os.path.join(workdir, f"together{index}.mp4"),
+                                                     profile, threads))
+               for index in range(count)]
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.monotonic() - started
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    size = sys.argv[2] if len(sys.argv) > 2 else "1280x720"
+    cores = os.cpu_count() or 1
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else max(2, min(cores, 4))
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        raise Exception("FFmpeg is not available")
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, "source.mkv")
+    make_source(ffmpeg, source, seconds, size)
+
+    print(f"One encode of {seconds:g}s of {size} video per profile")
+    for profile, settings in ENCODE_PROFILES.items():
+        output = os.path.join(workdir, f"{profile}.mp4")
+        started = time.monotonic()
+        encode(ffmpeg, source, output, profile)
+        elapsed = time.monotonic() - started
+        label = f"{profile} ({settings['preset']}, crf {settings['crf']})"
+        print(f"  {label:32s} {elapsed:6.2f}s  "
+              f"{seconds * 30 / elapsed:7.1f} fps  {os.path.getsize(output) / 1e6:6.1f} MB")
+
+    split = max(1, cores // count)
+    print(f"{count} encodes at once on {cores} cores, balanced profile")
+    for label, threads in (("x264 picks threads", 0), (f"{split} threads each", split)):
+        elapsed = encode_together(ffmpeg, source, workdir, count, "balanced", threads)
+        print(f"  {label:20s} {elapsed:6.2f}s  {count * seconds * 30 / elapsed:7.1f} fps in total")
+
+if __name__ == "__main__":
+    main()
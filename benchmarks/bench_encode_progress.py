@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark: encoder speed and progress accuracy per encode profile
+Generates a clip whose video cannot be stream-copied into MP4, re-encodes
+it with each profile through the merge command, and prints wall time,
+encode fps, speed relative to playback, how soon the first progress report
+arrived and how far the reported ETAs were off
+
+Usage: python benchmarks/bench_encode_progress.py [seconds] [WIDTHxHEIGHT]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from merger import ENCODE_PROFILES, build_merge_command, get_ffmpeg_path, run_ffmpeg
+
+def make_source(ffmpeg, path, seconds, size):
+    """MPEG-2 video and MP2 audio in Matroska, so the merge has to re-encode"""
+    subprocess.run([ffmpeg, "-v", "error", "-y",
+                    "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}",
+                    "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                    "-c:v", "mpeg2video", "-q:v", "3", "-c:a", "mp2", path], check=True)
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    size = sys.argv[2] if len(sys.argv) > 2 else "1280x720"
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        raise Exception("FFmpeg is not available")
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, "source.mkv")
+    make_source(ffmpeg, source, seconds, size)
+
+    print(f"Re-encoding {seconds:g}s of {size} video")
+    plan = {"method": "reencode", "video": "encode", "audio": "encode"}
+    for profile in ENCODE_PROFILES:
+        output = os.path.join(workdir, f"{profile}.mp4")
+        reports = []
+        started = time.monotonic()
+        returncode, errors = run_ffmpeg(build_merge_command(ffmpeg, source, source, output, plan, profile=profile),
+                                        seconds, lambda report: reports.append((time.monotonic(), report)))
+        elapsed = time.monotonic() - started
+        if returncode != 0:
+            raise Exception(f"{profile}: {errors}")
+
+        # ETA error: predicted against the time the encode actually took to finish
+        misses = [abs(report["eta"] - (started + elapsed - at)) for at, report in reports
+                  if report["eta"] is not None and report["percent"] < 100]
+        first = reports[0][0] - started if reports else float("nan")
+        print(f"  {profile:10s} {elapsed:6.2f}s  {seconds * 30 / elapsed:7.1f} fps  {seconds / elapsed:5.2f}x  "
+              f"{len(reports):3d} reports, first after {first:.2f}s  "
+              f"ETA off by {max(misses, default=0):.1f}s at most  {os.path.getsize(output) / 1e6:6.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: finished-file delivery through /download_file
+Serves one large completed download from benchmarks/fake_server.py under
+the Flask dev server (chunked reads), gunicorn (sendfile via
+wsgi.file_wrapper) and the ASGI entry point, and measures throughput and
+server CPU for parallel full downloads, then checks that a resumed
+(Range) download gets only the missing bytes
+
+Usage: python benchmarks/bench_file_delivery.py [size_mb] [clients]
+"""
+
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from load_test_asgi import free_port, wait_for_port
+
+JOB_ID = "delivery-bench"
+
+def process_tree_cpu(pid):
+    """CPU seconds used so far by a process and its children (Linux)"""
+    ticks = os.sysconf("SC_CLK_TCK")
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending += [int(child) for child in f.read().split()]
+        except OSError:
+            continue
+    return total
+
+def fetch(port, headers=None):
+    """GET the benchmark file, returns (status, bytes received)"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    connection.request("GET", f"/download_file/{JOB_ID}", headers=headers or {})
+    response = connection.getresponse()
+    received = 0
+    while True:
+        chunk = response.read(1024 * 1024)
+        if not chunk:
+            break
+        received += len(chunk)
+    connection.close()
+    return response.status, received
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "artifact.mp4")
+    with open(path, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+    size = os.path.getsize(path)
+
+    db_path = os.path.join(workdir, "jobs.db")
+    os.environ.update(YT_JOBS_DB=db_path, YT_CPU_WORKERS="0", YT_DOWNLOAD_FOLDER=workdir)
+    from job_store import JobStore
+    JobStore(db_path).create(JOB_ID, "download", status="completed", file_path=path, filename="artifact.mp4")
+
+    print(f"{clients} parallel downloads of a {size_mb} MB file")
+    for mode in ("flask", "gunicorn", "asgi"):
+        port = free_port()
+        server = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_server.py"), mode, str(port)],
+                                  cwd=workdir, env=dict(os.environ),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            fetch(port, {"Range": "bytes=0-0"})  # warm up
+            cpu_before = process_tree_cpu(server.pid)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                results = list(pool.map(lambda _: fetch(port), range(clients)))
+            elapsed = time.perf_counter() - started
+            cpu = process_tree_cpu(server.pid) - cpu_before
+            if any(status != 200 or received != size for status, received in results):
+                raise Exception(f"{mode}: incomplete downloads {results}")
+            total_mb = clients * size / (1024 * 1024)
+
+            status, received = fetch(port, {"Range": f"bytes={size // 2}-"})
+            resumed = "ok" if status == 206 and received == size - size // 2 else f"FAILED ({status}, {received})"
+            print(f"  {mode:9s} {total_mb / elapsed:8.0f} MB/s  server CPU {cpu:5.2f}s "
+                  f"({cpu / (total_mb / 1024):.2f}s per GB)  resume from half: {resumed}")
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
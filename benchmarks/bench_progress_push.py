@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark for progress delivery
+Runs a fake download that reports progress 100 times a second and watches
+it with N clients, first polling /progress_api every second like the old
+pages did, then subscribed to /events. Prints HTTP requests, messages and
+CPU time for each
+
+Usage: python benchmarks/bench_progress_push.py [clients] [seconds]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("YT_JOBS_DB", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("YT_CPU_WORKERS", "0")
+
+import app as server
+
+def fake_download(job_id, seconds):
+    server.jobs.create(job_id, "download", status="downloading_video")
+    started = time.time()
+    while time.time() - started < seconds:
+        server.jobs.set_progress(job_id, round((time.time() - started) / seconds * 100, 1))
+        time.sleep(0.01)
+    server.jobs.update(job_id, status="completed", progress=100)
+
+def poll_client(client, job_id, counts):
+    while True:
+        data = client.get(f"/progress_api/{job_id}").get_json()
+        counts["requests"] += 1
+        counts["messages"] += 1
+        if data["status"] == "completed":
+            return
+        time.sleep(1)
+
+def push_client(client, job_id, counts):
+    response = client.get(f"/events/{job_id}", buffered=False)
+    counts["requests"] += 1
+    for chunk in response.response:
+        counts["messages"] += chunk.count(b"data: ") if isinstance(chunk, bytes) else chunk.count("data: ")
+    response.close()
+
+def run(name, client_fn, clients, seconds):
+    job_id = f"bench-{name}"
+    counts = {"requests": 0, "messages": 0}
+    producer = threading.Thread(target=fake_download, args=(job_id, seconds))
+    cpu = time.process_time()
+    producer.start()
+    time.sleep(0.05)
+    threads = [threading.Thread(target=client_fn, args=(server.app.test_client(), job_id, counts))
+               for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads + [producer]:
+        thread.join()
+    cpu = time.process_time() - cpu
+    print(f"  {name:5} requests {counts['requests']:6}  messages {counts['messages']:6}  cpu {cpu:6.2f}s")
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    # The benchmark itself must not trigger job recovery
+    server._recovery_done = True
+    print(f"{clients} clients watching a {seconds:g}s download")
+    run("poll", poll_client, clients, seconds)
+    run("push", push_client, clients, seconds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the segmented downloader
+Downloads the same payload from a throttled local server with 1 and with N
+connections and prints the throughput of each
+
+Usage: python benchmarks/bench_segmented_download.py [size_mb] [rate_mb_per_connection]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetcher import SegmentedDownloader
+from range_server import RangeServer
+
+def run(url, path, connections, segment_size):
+    downloader = SegmentedDownloader(connections=connections, segment_size=segment_size)
+    started = time.time()
+    downloader.download(url, path)
+    return time.time() - started
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 32
+    rate_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 4
+    size = int(size_mb * 1024 * 1024)
+    with RangeServer(size, rate_limit=int(rate_mb * 1024 * 1024)) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.bin")
+        print(f"{size_mb:g} MB payload, {rate_mb:g} MB/s per connection")
+        for connections in (1, 2, 4, 8):
+            elapsed = run(server.url, path, connections, segment_size=max(size // (connections * 4), 1024 * 1024))
+            with open(path, "rb") as f:
+                intact = f.read() == server.payload
+            print(f"  {connections} connection(s): {elapsed:6.2f}s  {size_mb / elapsed:6.1f} MB/s"
+                  f"  {'ok' if intact else 'CORRUPT'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+App server with a fake YouTube extractor, for load tests
+Every lookup sleeps for a fixed latency and returns a canned video, and a
+download job that never finishes is created for progress/event clients
+
+Usage: python benchmarks/fake_server.py flask|asgi|gunicorn PORT [latency_seconds]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as web
+
+LOAD_TEST_JOB = "load-test"
+
+class FakeStream:
+    def __init__(self, itag, type, mime_type, resolution=None, abr=None, progressive=False):
+        self.itag = itag
+        self.type = type
+        self.mime_type = mime_type
+        self.subtype = mime_type.split("/")[1]
+        self.is_progressive = progressive
+        self.is_adaptive = not progressive
+        self.resolution = resolution
+        self.fps = 30 if type == "video" else None
+        self.abr = abr
+        self.video_codec = "avc1.640028" if type == "video" else None
+        self.audio_codec = "mp4a.40.2" if type == "audio" or progressive else None
+        self._filesize = 50 * 1024 * 1024
+
+class FakeYouTube:
+    def __init__(self, url):
+        self.title = f"Load test {url[-11:]}"
+        self.author = "Load Test"
+        self.views = 1
+        self.length = 60
+        self.description = ""
+        self.thumbnail_url = ""
+        self.streams = [FakeStream(18, "video", "video/mp4", "360p", progressive=True),
+                        FakeStream(137, "video", "video/mp4", "1080p"),
+                        FakeStream(140, "audio", "audio/mp4", abr="128kbps")]
+
+def main():
+    mode, port = sys.argv[1], int(sys.argv[2])
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+
+    def fake_open_youtube(url):
+        time.sleep(latency)
+        return FakeYouTube(url)
+
+    web.open_youtube = fake_open_youtube
+    # Recovery would mark the never-ending job as interrupted
+    web._recovery_done = True
+    web.jobs.create(LOAD_TEST_JOB, "download", status="downloading_video", progress=42)
+
+    if mode == "asgi":
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.application, host="127.0.0.1", port=port, log_level="warning",
+                    backlog=4096, timeout_keep_alive=30)
+    elif mode == "gunicorn":
+        from gunicorn.app.base import BaseApplication
+
+        class FakeServer(BaseApplication):
+            def load_config(self):
+                self.cfg.set("bind", f"127.0.0.1:{port}")
+                self.cfg.set("workers", 1)
+                self.cfg.set("worker_class", "gthread")
+                self.cfg.set("threads", 16)
+
+            def load(self):
+                return web.app
+
+        FakeServer().run()
+    else:
+        web.app.run(host="127.0.0.1", port=port, threaded=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Load test: Flask dev server vs the ASGI entry point
+Starts benchmarks/fake_server.py in each mode, then
+  1. posts many concurrent /analyze requests for distinct videos (every
+     lookup takes the fake extractor's latency), and
+  2. holds many /events connections open while timing /progress_api calls.
+Prints latency, throughput, and the server's thread count and memory
+
+Usage: python benchmarks/load_test_asgi.py [analyze_clients] [event_clients]
+"""
+
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+async def http_request(port, method, path, body=b"", headers=None):
+    """Minimal HTTP/1.1 client, returns (status, seconds)"""
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"{method} {path} HTTP/1.1", "Host: 127.0.0.1", "Connection: close",
+             f"Content-Length: {len(body)}"] + [f"{k}: {v}" for k, v in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1]), time.perf_counter() - started
+
+async def hold_events(port, path, opened, stop):
+    """Open an SSE stream, wait for its first event and keep it open until stop"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode())
+    await writer.drain()
+    while b"data:" not in await reader.readline():
+        pass
+    opened.append(1)
+    await stop.wait()
+    writer.close()
+
+def server_stats(pid):
+    stats = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(("Threads:", "VmRSS:")):
+                name, value = line.split(":", 1)
+                stats[name] = value.strip()
+    return stats
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+async def run_analyze(port, clients):
+    form = lambda i: f"url=https%3A%2F%2Fyoutu.be%2Fload{i:07d}".encode()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(http_request(port, "POST", "/analyze", form(i),
+                                                  {"Content-Type": "application/x-www-form-urlencoded"})
+                                     for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies = [seconds for status, seconds in results if status == 200]
+    print(f"  analyze  {clients} clients: {elapsed:6.2f}s total, {len(latencies)} ok, "
+          f"p50 {statistics.median(latencies):.2f}s p95 {percentile(latencies, 0.95):.2f}s")
+
+async def run_events(port, clients, pid):
+    stop = asyncio.Event()
+    opened = []
+    holders = [asyncio.ensure_future(hold_events(port, "/events/load-test", opened, stop)) for _ in range(clients)]
+    deadline = time.time() + 60
+    while len(opened) < clients and time.time() < deadline:
+        await asyncio.sleep(0.2)
+    stats = server_stats(pid)
+    latencies = []
+    for _ in range(4):
+        batch = await asyncio.gather(*(http_request(port, "GET", "/progress_api/load-test") for _ in range(50)))
+        latencies += [seconds for _, seconds in batch]
+    print(f"  events   {len(opened)}/{clients} streams open, server threads {stats['Threads']}, RSS {stats['VmRSS']}")
+    print(f"  progress 200 requests while streams are open: p50 {statistics.median(latencies) * 1000:.1f}ms "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f}ms")
+    stop.set()
+    await asyncio.gather(*holders, return_exceptions=True)
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise Exception(f"Server on port {port} did not start")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def main():
+    analyze_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    event_clients = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    for mode in ("flask", "asgi"):
+        port = free_port()
+        workdir = tempfile.mkdtemp()
+        env = dict(os.environ, YT_JOBS_DB=os.path.join(workdir, "jobs.db"), YT_CPU_WORKERS="0")
+        server = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_server.py"), mode, str(port)],
+                                  cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            print(f"{mode}:")
+            asyncio.run(run_analyze(port, analyze_clients))
+            asyncio.run(run_events(port, event_clients, server.pid))
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Local HTTP file server for benchmarks
+Serves random bytes with Range support and an optional per-connection rate
+limit, which is roughly how YouTube's stream hosts behave
+"""
+
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients closing probe connections early is expected
+
+class RangeServer:
+    """Serve one in-memory payload at /file on a background thread"""
+
+    def __init__(self, size, rate_limit=None, ranges=True, port=0):
+        self.payload = os.urandom(size)
+        self.rate_limit = rate_limit  # bytes per second per connection
+        self.ranges = ranges
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests += 1
+                start, end = 0, len(server.payload) - 1
+                match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get("Range", ""))
+                if match and server.ranges:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2) or end), end)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(server.payload)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                server.send(self.wfile, start, end)
+
+        self.httpd = _QuietServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/file"
+
+    def send(self, wfile, start, end):
+        chunk = 64 * 1024
+        began = time.time()
+        sent = 0
+        try:
+            for offset in range(start, end + 1, chunk):
+                data = self.payload[offset:min(offset + chunk, end + 1)]
+                wfile.write(data)
+                sent += len(data)
+                if self.rate_limit:
+                    # Sleep until this connection is back under its rate
+                    delay = sent / self.rate_limit - (time.time() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Download coalescing for YouTube Downloader
+Jobs asking for the same video, itag and mode share one in-flight download,
+and files are reference counted so cleanup never removes something a live
+job still points to. Given a shared job store, in-flight downloads and file
+references are looked up there so they hold across server processes
+"""
+
+import threading
+
+class DownloadCoalescer:
+    """Tracks in-flight downloads by key and reference counts their files"""
+
+    def __init__(self, store=None):
+        self.store = store
+        self._lock = threading.Lock()
+        self._inflight = {}   # key -> primary job id
+        self._followers = {}  # primary job id -> [job ids]
+        self._refs = {}       # file path -> number of live jobs using it
+
+    @staticmethod
+    def key_for(video_id, itag, mode, variant=None):
+        # variant tells apart different outputs of one stream, e.g. audio formats
+        return f"{video_id}:{itag}:{mode}:{variant}" if variant else f"{video_id}:{itag}:{mode}"
+
+    def join(self, key, job_id):
+        """Register a job for a key
+
+        Returns ("follower", primary_id) when the same download is in flight,
+        or ("primary", job_id) when this job has to do the download itself.
+        """
+        if self.store is not None:
+            primary = self.store.join_download(job_id, key)
+            return ("primary", job_id) if primary == job_id else ("follower", primary)
+        with self._lock:
+            primary = self._inflight.get(key)
+            if primary is not None:
+                self._followers[primary].append(job_id)
+                return "follower", primary
+            self._inflight[key] = job_id
+            self._followers[job_id] = []
+            return "primary", job_id
+
+    def finish(self, key, job_id, file_path):
+        """Record a finished download and return the follower job ids
+
+        Takes one file reference for the primary and each follower, unless
+        the shared job records serve as references.
+        """
+        if self.store is not None:
+            return self.store.followers(job_id)
+        with self._lock:
+            primary = self._inflight.pop(key, None)
+            followers = self._followers.pop(primary, [])
+            self._refs[file_path] = self._refs.get(file_path, 0) + 1 + len(followers)
+            return followers
+
+    def fail(self, key, job_id):
+        """Drop a failed in-flight download and return its follower job ids"""
+        if self.store is not None:
+            return self.store.followers(job_id)
+        with self._lock:
+            primary = self._inflight.pop(key, None)
+            return self._followers.pop(primary, [])
+
+    def acquire(self, path):
+        """Take a reference on a file"""
+        with self._lock:
+            self._refs[path] = self._refs.get(path, 0) + 1
+
+    def release(self, path):
+        """Drop a reference on a file"""
+        with self._lock:
+            count = self._refs.get(path, 0) - 1
+            if count > 0:
+                self._refs[path] = count
+            else:
+                self._refs.pop(path, None)
+
+    def hold_for_job(self, path):
+        """Take the reference a finished job keeps on its file
+
+        With a shared job store the job record itself is the reference.
+        """
+        if self.store is None:
+            self.acquire(path)
+
+    def release_for_job(self, path):
+        """Drop the reference taken by hold_for_job()"""
+        if self.store is None:
+            self.release(path)
+
+    def in_use(self, path):
+        """Whether any live job still points to a file"""
+        if self._refs.get(path, 0) > 0:
+            return True
+        return self.store is not None and self.store.references(path)
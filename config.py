@@ -37,10 +37,83 @@ DOWNLOAD_FOLDER = os.environ.get('YT_DOWNLOAD_FOLDER', DOWNLOAD_FOLDER)
 UPLOAD_FOLDER = os.environ.get('YT_UPLOAD_FOLDER', UPLOAD_FOLDER)
 MERGED_FOLDER = os.environ.get('YT_MERGED_FOLDER', MERGED_FOLDER)
 
+# Job scheduler limits: fetch workers download streams, CPU workers run merges/encodes
+FETCH_WORKERS = int(os.environ.get('YT_FETCH_WORKERS', '4'))
+CPU_WORKERS = int(os.environ.get('YT_CPU_WORKERS', '0' if IS_VERCEL else str(os.cpu_count() or 1)))
+MAX_QUEUED_JOBS = int(os.environ.get('YT_MAX_QUEUED_JOBS', '100'))
+
+# Job records database and how long finished jobs are kept
+JOBS_DB = os.environ.get('YT_JOBS_DB', "/tmp/jobs.db" if IS_VERCEL else os.path.join(os.getcwd(), "jobs.db"))
+JOB_TTL_HOURS = float(os.environ.get('YT_JOB_TTL_HOURS', '24'))
+
+# Video metadata cache: in-memory entries, lifetime (stream URLs expire) and optional disk tier
+METADATA_CACHE_SIZE = int(os.environ.get('YT_METADATA_CACHE_SIZE', '128'))
+METADATA_TTL_MINUTES = float(os.environ.get('YT_METADATA_TTL_MINUTES', '120'))
+METADATA_CACHE_DIR = os.environ.get('YT_METADATA_CACHE_DIR', '')
+
+# Finished-file cache: disk budget and eviction policy ('lru' or 'lfu')
+ARTIFACT_CACHE_MB = int(os.environ.get('YT_ARTIFACT_CACHE_MB', '1024' if IS_VERCEL else '20480'))
+ARTIFACT_EVICTION_POLICY = os.environ.get('YT_ARTIFACT_EVICTION', 'lru').lower()
+
+# Segmented downloads: parallel ranged connections per stream (0 disables) and segment size
+SEGMENT_CONNECTIONS = int(os.environ.get('YT_SEGMENT_CONNECTIONS', '4'))
+SEGMENT_SIZE_MB = int(os.environ.get('YT_SEGMENT_SIZE_MB', '8'))
+
+# Worker threads the ASGI server (asgi.py) uses for blocking calls such as YouTube lookups
+ASGI_THREADS = int(os.environ.get('YT_ASGI_THREADS', '32'))
+
+# Merge uploads: size limits per file and per request, and whether to probe uploads
+# from their first megabyte while the rest is still arriving
+MAX_UPLOAD_MB = int(os.environ.get('YT_MAX_UPLOAD_MB', '4096'))
+MAX_UPLOAD_REQUEST_MB = int(os.environ.get('YT_MAX_UPLOAD_REQUEST_MB', str(2 * MAX_UPLOAD_MB + 1)))
+UPLOAD_EARLY_PROBE = os.environ.get('YT_UPLOAD_EARLY_PROBE', 'true').lower() == 'true'
+
+# Playlist/channel batches: videos resolved at once per batch, and the most videos taken
+BATCH_RESOLVE_WORKERS = int(os.environ.get('YT_BATCH_RESOLVE_WORKERS', '4'))
+BATCH_MAX_VIDEOS = int(os.environ.get('YT_BATCH_MAX_VIDEOS', '200'))
+
+# Audio downloads unless a request picks otherwise: 'copy' keeps the stream's codec in its own
+# container (.m4a/.opus), 'mp3' or 'aac' transcode at YT_AUDIO_BITRATE kbps
+AUDIO_FORMAT = os.environ.get('YT_AUDIO_FORMAT', 'copy').lower()
+AUDIO_BITRATE = int(os.environ.get('YT_AUDIO_BITRATE', '192'))
+
+# Merge downloads whose video can be stream-copied by piping both streams into FFmpeg as they
+# download, instead of saving them to temporary files first
+MERGE_PIPELINE = os.environ.get('YT_MERGE_PIPELINE', 'true').lower() == 'true'
+
+# Per-job scratch directories for merges and conversions; jobs expected to need at most
+# YT_WORKSPACE_TMPFS_MB go to a RAM-backed filesystem instead (0 or an empty path disables)
+WORKSPACE_DIR = os.environ.get('YT_WORKSPACE_DIR', os.path.join(DOWNLOAD_FOLDER, '.work'))
+WORKSPACE_TMPFS = os.environ.get('YT_WORKSPACE_TMPFS', '/dev/shm' if os.path.isdir('/dev/shm') else '')
+WORKSPACE_TMPFS_MB = int(os.environ.get('YT_WORKSPACE_TMPFS_MB', '256'))
+
+# Re-encoding: profile ('auto', 'throughput', 'balanced' or 'archival') and threads per encoder,
+# 0 splits the cores between the CPU workers so concurrent encodes do not oversubscribe them
+ENCODE_PROFILE = os.environ.get('YT_ENCODE_PROFILE', 'auto').lower()
+ENCODE_THREADS = int(os.environ.get('YT_ENCODE_THREADS', '0'))
+
+# How finished files are sent: 'direct' (ranges and sendfile where the server supports it),
+# or handed to a fronting proxy with 'x-accel' (nginx X-Accel-Redirect) or 'x-sendfile'.
+# For x-accel, files under YT_ACCEL_ROOT are redirected to YT_ACCEL_PREFIX + their relative path
+DELIVERY_MODE = os.environ.get('YT_DELIVERY_MODE', 'direct').lower()
+ACCEL_PREFIX = os.environ.get('YT_ACCEL_PREFIX', '/protected/')
+ACCEL_ROOT = os.environ.get('YT_ACCEL_ROOT', os.path.commonpath([DOWNLOAD_FOLDER, MERGED_FOLDER]))
+
+# Production server (serve.py): worker processes, request threads per worker, and whether
+# they share jobs and the download queue through JOBS_DB (serve.py turns this on)
+WEB_WORKERS = int(os.environ.get('YT_WEB_WORKERS', str(min(os.cpu_count() or 1, 8))))
+WEB_THREADS = int(os.environ.get('YT_WEB_THREADS', '16'))
+# Progress streams (/events) the Flask app keeps open at once, each holds a request thread;
+# clients over the limit poll instead. asgi.py serves them without threads and has no limit
+MAX_EVENT_STREAMS = int(os.environ.get('YT_MAX_EVENT_STREAMS', str(max(1, WEB_THREADS // 2))))
+SHARED_STATE = os.environ.get('YT_SHARED_STATE', 'false').lower() == 'true'
+BOOT_ID = os.environ.get('YT_BOOT_ID', '')
+
 # Create directories on local device
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(MERGED_FOLDER, exist_ok=True)
+os.makedirs(WORKSPACE_DIR, exist_ok=True)
 
 # System information
 SYSTEM_INFO = {
@@ -75,6 +148,7 @@ def print_config_info():
     print(f"Downloads: {DOWNLOAD_FOLDER}")
     print(f"Uploads: {UPLOAD_FOLDER}")
     print(f"Merged: {MERGED_FOLDER}")
+    print(f"Workers: {FETCH_WORKERS} fetch, {CPU_WORKERS} CPU, queue limit {MAX_QUEUED_JOBS}")
     print("=" * 40)
     if SERVER_MODE:
         print("SERVER MODE: Accessible from other devices")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+File delivery for YouTube Downloader
+Works out how to answer a file download: ETag and conditional checks,
+single byte ranges so interrupted downloads resume, and handing the file to
+a fronting proxy (X-Accel-Redirect / X-Sendfile) so it sends the bytes.
+Several files can be sent as one ZIP built while it streams
+"""
+
+import mimetypes
+import os
+import zipfile
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+class Delivery:
+    """The response to one file request
+
+    status is 200, 206, 304 or 416. When body is True the caller sends
+    length bytes of path starting at offset start.
+    """
+
+    __slots__ = ("status", "path", "start", "length", "headers", "body")
+
+    def __init__(self, status, path, start=0, length=0, headers=None, body=False):
+        self.status = status
+        self.path = path
+        self.start = start
+        self.length = length
+        self.headers = headers or []
+        self.body = body
+
+def content_disposition(filename):
+    """Attachment header with an ASCII fallback and the UTF-8 name"""
+    fallback = filename.encode("ascii", "replace").decode("ascii").replace('"', "'").replace("?", "_")
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+def parse_range(value, size):
+    """Byte range (start, end) of a Range header
+
+    Returns None when there is no usable single range (the whole file is
+    sent), or False when the range lies outside the file.
+    """
+    if not value or not value.startswith("bytes=") or "," in value:
+        return None
+    first, _, last = value[6:].strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            count = int(last)
+            if count <= 0:
+                return False
+            return max(size - count, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+def etag_matches(header, etag):
+    """Weak comparison against an If-None-Match list"""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def not_modified_since(header, mtime):
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+def if_range_matches(header, etag, mtime):
+    """Whether a range may be served: If-Range holds the current strong ETag or modification date"""
+    if header.startswith('"'):
+        return header == etag
+    if header.startswith("W/"):
+        return False
+    try:
+        return parsedate_to_datetime(header).timestamp() == int(mtime)
+    except (TypeError, ValueError):
+        return False
+
+def proxy_location(path, prefix, root):
+    """Internal proxy URI of a file under root, or None if it lies elsewhere"""
+    relative = os.path.relpath(os.path.realpath(path), os.path.realpath(root))
+    if relative.startswith(os.pardir):
+        return None
+    return prefix.rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))
+
+def plan_delivery(path, filename, get_header, tag=None, mode="direct", accel_prefix="/protected/", accel_root=None):
+    """Decide the status, headers and byte range for sending a file
+
+    get_header(name) returns a request header or None. tag identifies the
+    file's content (e.g. from the artifact cache); size and modification
+    time are used when there is none.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{tag}"' if tag else f'"{size:x}-{stat.st_mtime_ns:x}"'
+    headers = [("ETag", etag), ("Last-Modified", formatdate(stat.st_mtime, usegmt=True)),
+               ("Cache-Control", "no-cache")]
+
+    if_none_match = get_header("If-None-Match")
+    if_modified_since = get_header("If-Modified-Since")
+    if (if_none_match and etag_matches(if_none_match, etag)) or \
+            (not if_none_match and if_modified_since and not_modified_since(if_modified_since, stat.st_mtime)):
+        return Delivery(304, path, headers=headers)
+
+    headers += [("Content-Type", mimetypes.guess_type(filename)[0] or "application/octet-stream"),
+                ("Content-Disposition", content_disposition(filename))]
+
+    if mode == "x-sendfile":
+        # The proxy reads the file and handles ranges itself
+        return Delivery(200, path, headers=headers + [("X-Sendfile", os.path.realpath(path))])
+    if mode == "x-accel":
+        location = proxy_location(path, accel_prefix, accel_root or os.path.dirname(path))
+        if location is not None:
+            return Delivery(200, path, headers=headers + [("X-Accel-Redirect", location)])
+
+    headers.append(("Accept-Ranges", "bytes"))
+    byte_range = parse_range(get_header("Range"), size)
+    if_range = get_header("If-Range")
+    if byte_range is not None and if_range and not if_range_matches(if_range, etag, stat.st_mtime):
+        byte_range = None
+    if byte_range is False:
+        return Delivery(416, path, headers=headers + [("Content-Range", f"bytes */{size}")])
+    if byte_range is None:
+        return Delivery(200, path, 0, size, headers + [("Content-Length", str(size))], body=True)
+    start, end = byte_range
+    return Delivery(206, path, start, end - start + 1,
+                    headers + [("Content-Range", f"bytes {start}-{end}/{size}"),
+                               ("Content-Length", str(end - start + 1))], body=True)
+
+def read_range(path, start, length, chunk_size=1024 * 1024):
+    """Yield length bytes of a file from start, for servers without sendfile"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+class _ZipSink:
+    """Write-only file for ZipFile that hands out what was written so far"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def unique_names(names):
+    """Names made unique by numbering repeats, e.g. 'clip (2).mp4'"""
+    seen = set()
+    unique = []
+    for name in names:
+        base, ext = os.path.splitext(name)
+        candidate, number = name, 1
+        while candidate.lower() in seen:
+            number += 1
+            candidate = f"{base} ({number}){ext}"
+        seen.add(candidate.lower())
+        unique.append(candidate)
+    return unique
+
+def stream_zip(entries, chunk_size=1024 * 1024):
+    """Yield a ZIP of (name in archive, path) entries while it is built
+
+    Media is already compressed, so files are stored as they are and the
+    archive never has to be written out on the server.
+    """
+    sink = _ZipSink()
+    # Without seek() ZipFile writes sizes after each file instead of going back
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, path in entries:
+            info = zipfile.ZipInfo.from_file(path, name)
+            with open(path, "rb") as src, archive.open(info, "w", force_zip64=True) as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield sink.drain()
+    yield sink.drain()
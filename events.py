@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Job event bus for YouTube Downloader
+Lets progress streams sleep until a job they watch actually changes instead
+of polling the job store on a timer, from threads or from an asyncio loop
+"""
+
+import asyncio
+import threading
+
+class Subscription:
+    """A listener on one or more job keys, woken by EventBus.publish()"""
+
+    def __init__(self, bus, keys):
+        self.bus = bus
+        self.keys = keys
+        self._event = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until a watched key changes, returns False on timeout
+
+        Changes published while the caller was busy are not lost, they make
+        the next wait() return at once.
+        """
+        changed = self._event.wait(timeout)
+        self._event.clear()
+        return changed
+
+    def close(self):
+        self.bus._unsubscribe(self)
+
+    def _notify(self):
+        self._event.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class AsyncSubscription(Subscription):
+    """Subscription awaited from an event loop, publish() may come from any thread"""
+
+    def __init__(self, bus, keys):
+        super().__init__(bus, keys)
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    async def wait(self, timeout=None):
+        """Wait until a watched key changes, returns False on timeout"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            changed = True
+        except asyncio.TimeoutError:
+            changed = False
+        self._event.clear()
+        return changed
+
+    def _notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # the loop has shut down
+
+class EventBus:
+    """Wakes the subscribers of a key whenever it is published
+
+    Publishing is cheap when nobody listens, so it can be called on every
+    progress update.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # key -> set of Subscriptions
+
+    def subscribe(self, *keys):
+        """Listen on keys, use the returned Subscription as a context manager"""
+        return self._add(Subscription(self, keys))
+
+    def subscribe_async(self, *keys):
+        """subscribe() for coroutines running on the current event loop"""
+        return self._add(AsyncSubscription(self, keys))
+
+    def publish(self, key):
+        """Signal that key changed"""
+        if key not in self._subscribers:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            subscription._notify()
+
+    def subscriber_count(self):
+        """Number of open subscriptions"""
+        with self._lock:
+            return len({sub for subs in self._subscribers.values() for sub in subs})
+
+    def _add(self, subscription):
+        keys = subscription.keys
+        with self._lock:
+            for key in keys:
+                self._subscribers.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            for key in subscription.keys:
+                subscribers = self._subscribers.get(key)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[key]
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Stream fetching helpers for YouTube Downloader
+Runs several stream transfers at once, keeps cheap byte counters for their
+progress, and resumes interrupted transfers from a journal of the byte
+ranges already on disk
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class TransferProgress:
+    """Byte counters for the transfers of one job
+
+    update() runs on every received chunk, so it only stores the count and
+    calls publish() at most once per interval. Percent, speed, ETA and
+    segment details are worked out when snapshot() is read.
+    """
+
+    def __init__(self, totals, publish=None, interval=0.5, window=5.0):
+        self.totals = {name: total or 0 for name, total in totals.items()}
+        self.done = {name: 0 for name in totals}
+        self.segments = {}  # name -> callable returning [[done, size], ...]
+        self.publish = publish
+        self.interval = interval
+        self.window = window
+        self.started = time.monotonic()
+        self._published = 0.0
+        self._samples = deque()
+        self._read_lock = threading.Lock()
+
+    def update(self, name, bytes_done, segments=None):
+        """Record how many bytes of one transfer have arrived"""
+        self.done[name] = bytes_done
+        if segments is not None:
+            self.segments[name] = segments
+        now = time.monotonic()
+        if now - self._published >= self.interval:
+            self._published = now
+            if self.publish:
+                self.publish()
+
+    @property
+    def total_bytes(self):
+        return sum(self.totals.values())
+
+    @property
+    def done_bytes(self):
+        return sum(self.done.values())
+
+    @property
+    def percent(self):
+        total = self.total_bytes
+        return min(round(self.done_bytes / total * 100, 1), 100) if total else 0
+
+    def snapshot(self):
+        """Progress, speed (bytes/s), ETA (seconds) and per-segment percentages"""
+        total = self.total_bytes
+        done = self.done_bytes
+        now = time.monotonic()
+        with self._read_lock:
+            # Speed over the last few seconds of reads, or since the start
+            self._samples.append((now, done))
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                self._samples.popleft()
+            since, then = self._samples[0]
+        if now - since >= 1:
+            speed = (done - then) / (now - since)
+        else:
+            speed = done / max(now - self.started, 1e-3)
+        snapshot = {
+            "progress": min(round(done / total * 100, 1), 100) if total else 0,
+            "bytes_done": done,
+            "bytes_total": total,
+            "speed": int(speed),
+            "eta": round((total - done) / speed) if speed > 0 and total > done else None
+        }
+        if self.segments:
+            snapshot["segments"] = {
+                name: [round(seg_done / size * 100) if size else 100 for seg_done, size in segments()]
+                for name, segments in list(self.segments.items())
+            }
+        return snapshot
+
+def run_parallel(tasks):
+    """Run callables concurrently and return their results in order
+
+    Waits for every task; the first exception raised is re-raised.
+    """
+    if len(tasks) == 1:
+        return [tasks[0]()]
+    with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+        futures = [pool.submit(task) for task in tasks]
+        errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    return [future.result() for future in futures]
+
+def open_url_stream(url, session=None, chunk_size=64 * 1024, timeout=30):
+    """Start reading a URL, returns (content length or None, chunk iterator)
+
+    The connection is closed when the iterator is exhausted or closed.
+    """
+    if session is None:
+        import requests
+        session = requests
+    response = session.get(url, stream=True, timeout=timeout)
+    if response.status_code != 200:
+        response.close()
+        raise Exception(f"Unexpected HTTP {response.status_code} while opening stream")
+    length = response.headers.get("Content-Length")
+
+    def chunks():
+        with response:
+            for chunk in response.iter_content(chunk_size):
+                yield chunk
+
+    return (int(length) if length and length.isdigit() else None), chunks()
+
+def count_chunks(chunks, on_bytes):
+    """Pass chunks through, calling on_bytes(bytes so far) after each"""
+    done = 0
+    for chunk in chunks:
+        done += len(chunk)
+        on_bytes(done)
+        yield chunk
+
+JOURNAL_SUFFIX = ".part.json"
+
+def journal_path(path):
+    """Sidecar file recording which byte ranges of path are complete"""
+    return path + JOURNAL_SUFFIX
+
+def remove_partial(path):
+    """Delete a partial download and its journal"""
+    for name in (path, journal_path(path)):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+def stale_partials(directory, max_age_seconds):
+    """Partial downloads under directory whose journal has not changed in max_age_seconds"""
+    cutoff = time.time() - max_age_seconds
+    stale = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(JOURNAL_SUFFIX):
+                journal = os.path.join(root, name)
+                if os.path.getmtime(journal) < cutoff:
+                    stale.append(journal[:-len(JOURNAL_SUFFIX)])
+    return stale
+
+class DownloadJournal:
+    """Per-segment byte counts and CRC32s of a partial download
+
+    Saved atomically next to the file so a transfer can pick up where it
+    stopped after a failed attempt or a server restart.
+    """
+
+    def __init__(self, path, total_size, segments, save_interval=1.0):
+        self.path = journal_path(path)
+        self.total_size = total_size
+        self.segments = segments
+        self.done = [0] * len(segments)
+        self.crcs = [0] * len(segments)
+        self.bytes_done = 0
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._last_save = 0
+
+    @classmethod
+    def load(cls, path, total_size, segments):
+        """Journal of an earlier attempt, with segments that no longer match their CRC reset"""
+        journal = cls(path, total_size, segments)
+        try:
+            with open(journal.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return journal
+        if (data.get("size") != total_size or data.get("segments") != [list(s) for s in segments]
+                or not os.path.exists(path) or os.path.getsize(path) != total_size):
+            return journal
+        with open(path, "rb") as f:
+            for index, ((start, end), done, crc) in enumerate(zip(segments, data["done"], data["crcs"])):
+                f.seek(start)
+                if done and zlib.crc32(f.read(done)) == crc:
+                    journal.done[index] = done
+                    journal.crcs[index] = crc
+        journal.bytes_done = sum(journal.done)
+        return journal
+
+    def record(self, index, chunk):
+        """Count a chunk that has been written to the file"""
+        with self._lock:
+            self.done[index] += len(chunk)
+            self.bytes_done += len(chunk)
+            self.crcs[index] = zlib.crc32(chunk, self.crcs[index])
+
+    def save(self, force=False):
+        """Write the journal, at most once per save_interval unless forced"""
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_save < self.save_interval:
+                return
+            self._last_save = now
+            data = {"size": self.total_size, "segments": [list(s) for s in self.segments],
+                    "done": list(self.done), "crcs": list(self.crcs)}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def verify(self, path, chunk_size=1024 * 1024):
+        """Check that every segment is complete, the file has the expected length
+        and each segment on disk still matches the CRC of the bytes received
+
+        Reads the whole file once. The journal is left in place on failure,
+        so the next attempt fetches only the segments that fail their CRC.
+        """
+        missing = [index for index, (start, end) in enumerate(self.segments)
+                   if self.done[index] != end - start + 1]
+        if missing:
+            raise Exception(f"Download incomplete, {len(missing)} segments missing")
+        size = os.path.getsize(path)
+        if size != self.total_size:
+            raise Exception(f"Downloaded file is {size} bytes, expected {self.total_size}")
+        corrupt = 0
+        with open(path, "rb") as f:
+            for index, (start, end) in enumerate(self.segments):
+                f.seek(start)
+                crc = 0
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = f.read(min(chunk_size, remaining))
+                    if not data:
+                        break
+                    crc = zlib.crc32(data, crc)
+                    remaining -= len(data)
+                if crc != self.crcs[index]:
+                    corrupt += 1
+        if corrupt:
+            raise Exception(f"Download corrupted, {corrupt} segments fail their checksum")
+
+class SegmentedDownloader:
+    """Fetches a URL as byte ranges over several pooled connections
+
+    Segments are written at their offsets into a preallocated file and a
+    failed segment is retried on its own from the last byte it received.
+    Progress is journaled next to the file, so a later call for the same
+    path resumes instead of starting over. Servers without range support
+    are read over a single connection.
+    """
+
+    def __init__(self, connections=4, segment_size=8 * 1024 * 1024, max_retries=3,
+                 timeout=30, chunk_size=256 * 1024, session=None, parallel_streams=1):
+        # parallel_streams: downloads sharing this object (and its connection pool) at once
+        self.connections = max(1, connections)
+        self.parallel_streams = max(1, parallel_streams)
+        self.segment_size = segment_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.session = session or self._make_session()
+
+    def _make_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.connections * self.parallel_streams)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def content_length(self, url):
+        """Total size if the server honours range requests, else None"""
+        response = self.session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=self.timeout)
+        try:
+            if response.status_code != 206:
+                return None
+            content_range = response.headers.get("Content-Range", "")
+            total = content_range.rpartition("/")[2]
+            return int(total) if total.isdigit() else None
+        finally:
+            response.close()
+
+    def plan_segments(self, total_size, grow=True):
+        """Split a size into (start, end) inclusive byte ranges
+
+        With grow, segments of very large files get larger than segment_size
+        so the journal stays short.
+        """
+        segment_size = self.segment_size
+        if grow:
+            segment_size = max(segment_size, -(-total_size // (self.connections * 64)))
+        return [(start, min(start + segment_size, total_size) - 1)
+                for start in range(0, total_size, segment_size)]
+
+    def download(self, url, path, on_progress=None, expected_size=None):
+        """Download url into path, resuming from its journal if one matches
+
+        on_progress(bytes_done, segments) receives the byte count and a
+        callable returning [done, size] per segment, so the list is only
+        built when someone looks at it. expected_size, when known,
+        is checked against what the server reports. Returns the number of
+        bytes.
+        """
+        total_size = self.content_length(url)
+        if total_size is None:
+            remove_partial(path)
+            return self._download_single(url, path, on_progress)
+        if expected_size and total_size != expected_size:
+            raise Exception(f"Server reports {total_size} bytes, expected {expected_size}")
+
+        segments = self.plan_segments(total_size)
+        journal = DownloadJournal.load(path, total_size, segments)
+        if journal.bytes_done:
+            print(f"Resuming {os.path.basename(path)} at {journal.bytes_done} of {total_size} bytes")
+        else:
+            # Preallocate so every segment can write at its own offset
+            with open(path, "wb") as f:
+                f.truncate(total_size)
+            journal.save(force=True)
+
+        def segment_progress():
+            return [[done, end - start + 1] for done, (start, end) in zip(list(journal.done), segments)]
+
+        def report():
+            if on_progress:
+                on_progress(journal.bytes_done, segment_progress)
+
+        report()
+
+        def fetch_segment(index):
+            start, end = segments[index]
+            for attempt in range(self.max_retries + 1):
+                offset = start + journal.done[index]
+                if offset > end:
+                    return
+                try:
+                    self._fetch_range(url, path, offset, end, index, journal, report)
+                    return
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        raise Exception(f"Segment {index} ({start}-{end}) failed after {attempt + 1} attempts: {e}")
+                    time.sleep(min(2 ** attempt, 8))
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.connections, len(segments))) as pool:
+                futures = [pool.submit(fetch_segment, index) for index in range(len(segments))]
+                errors = [future.exception() for future in futures]
+        finally:
+            journal.save(force=True)
+        for error in errors:
+            if error is not None:
+                raise error
+
+        journal.verify(path)
+        os.remove(journal.path)
+        return total_size
+
+    def stream(self, url, on_progress=None):
+        """Yield the content of url in order, fetching the ranges ahead over several connections
+
+        Nothing is written to disk: up to `connections` segments of
+        segment_size are held in memory while the consumer catches up, and a
+        failed segment is retried on its own. on_progress(bytes_done, None)
+        is called as data arrives. Servers without range support are read
+        over one connection.
+        """
+        total_size = self.content_length(url)
+        if total_size is None:
+            yield from self._stream_single(url, on_progress)
+            return
+        # No journal to keep short, segments stay at segment_size to bound memory
+        segments = self.plan_segments(total_size, grow=False)
+        received = [0] * len(segments)
+
+        def fetch_segment(index):
+            start, end = segments[index]
+            parts = []
+            for attempt in range(self.max_retries + 1):
+                offset = start + received[index]
+                try:
+                    headers = {"Range": f"bytes={offset}-{end}"}
+                    with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                        if response.status_code != 206:
+                            raise Exception(f"Unexpected HTTP {response.status_code} for range {offset}-{end}")
+                        for chunk in response.iter_content(self.chunk_size):
+                            chunk = chunk[:end + 1 - offset]
+                            if not chunk:
+                                break
+                            parts.append(chunk)
+                            offset += len(chunk)
+                            received[index] += len(chunk)
+                            if on_progress:
+                                on_progress(sum(received), None)
+                    if offset > end:
+                        return b"".join(parts)
+                    raise Exception(f"Connection closed after {offset - start} of {end - start + 1} bytes")
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        raise Exception(f"Segment {index} ({start}-{end}) failed after {attempt + 1} attempts: {e}")
+                    time.sleep(min(2 ** attempt, 8))
+
+        pool = ThreadPoolExecutor(max_workers=min(self.connections, len(segments)))
+        pending = deque()
+        next_index = 0
+        try:
+            while pending or next_index < len(segments):
+                while next_index < len(segments) and len(pending) < self.connections:
+                    pending.append(pool.submit(fetch_segment, next_index))
+                    next_index += 1
+                yield pending.popleft().result()
+        finally:
+            # A consumer that stops early leaves the segments still queued unfetched
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _stream_single(self, url, on_progress):
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            done = 0
+            for chunk in response.iter_content(self.chunk_size):
+                done += len(chunk)
+                if on_progress:
+                    on_progress(done, None)
+                yield chunk
+
+    def _fetch_range(self, url, path, start, end, index, journal, report):
+        headers = {"Range": f"bytes={start}-{end}"}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 206:
+                raise Exception(f"Unexpected HTTP {response.status_code} for range {start}-{end}")
+            with open(path, "r+b") as f:
+                f.seek(start)
+                position = start
+                for chunk in response.iter_content(self.chunk_size):
+                    # Never write past the segment even if the server over-delivers
+                    chunk = chunk[:end + 1 - position]
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    position += len(chunk)
+                    # Flushed before it is journaled so a resume never trusts unwritten bytes
+                    f.flush()
+                    journal.record(index, chunk)
+                    journal.save()
+                    report()
+        if position <= end:
+            raise Exception(f"Connection closed after {position - start} of {end - start + 1} bytes")
+
+    def _download_single(self, url, path, on_progress):
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            done = 0
+            with open(path, "wb") as f:
+                for chunk in response.iter_content(self.chunk_size):
+                    f.write(chunk)
+                    done += len(chunk)
+                    if on_progress:
+                        on_progress(done, None)
+        return done
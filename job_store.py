@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Persistent job store for YouTube Downloader
+Keeps download and merge job records in SQLite (WAL mode) behind an
+in-memory cache, evicts finished jobs after a TTL and finds jobs that were
+interrupted by a restart. In shared mode several server processes use the
+same database and the cache is bypassed
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+def is_terminal(status):
+    """Whether a status string means the job will not change again"""
+    return status == "completed" or status.startswith("error")
+
+class Job:
+    """A single download or merge job"""
+
+    __slots__ = ("job_id", "kind", "status", "progress", "file_path", "filename",
+                 "error", "extra", "created", "updated", "live", "transfer")
+
+    def __init__(self, job_id, kind, status="queued", progress=0, file_path=None, filename=None,
+                 error=None, extra=None, created=None, updated=None, live=None):
+        now = time.time()
+        self.job_id = job_id
+        self.kind = kind
+        self.status = status
+        self.progress = progress
+        self.file_path = file_path
+        self.filename = filename
+        self.error = error
+        self.extra = extra if extra is not None else {}
+        self.created = created or now
+        self.updated = updated or now
+        self.live = live  # last transfer or encoder snapshot, persisted only in shared mode
+        self.transfer = None  # live TransferProgress, kept in memory only
+
+    @property
+    def finished(self):
+        return is_terminal(self.status)
+
+    def to_row(self):
+        return (self.job_id, self.kind, self.status, self.progress, self.file_path, self.filename,
+                self.error, json.dumps(self.extra), self.created, self.updated,
+                json.dumps(self.live) if self.live else None)
+
+    @classmethod
+    def from_row(cls, row):
+        job_id, kind, status, progress, file_path, filename, error, extra, created, updated, live = row
+        return cls(job_id, kind, status, progress, file_path, filename, error,
+                   json.loads(extra) if extra else {}, created, updated, json.loads(live) if live else None)
+
+class JobStore:
+    """SQLite-backed job records with a write-through in-memory cache
+
+    With shared=True every read goes to the database, since other processes
+    update the same jobs, and live transfer snapshots are written to it so
+    any process can report them.
+    """
+
+    def __init__(self, db_path, ttl_seconds=24 * 3600, evict_interval=60, on_evict=None, on_change=None,
+                 shared=False):
+        self.db_path = db_path
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self.evict_interval = evict_interval
+        self.on_evict = on_evict
+        self.on_change = on_change
+        self._cache = {}
+        self._transfers = {}
+        self._lock = threading.RLock()
+        self._last_evict = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                file_path TEXT,
+                filename TEXT,
+                error TEXT,
+                extra TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                live TEXT
+            )
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if "live" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN live TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_file_path ON jobs (file_path)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def create(self, job_id, kind, **fields):
+        """Create and persist a new job record"""
+        job = Job(job_id, kind, **fields)
+        with self._lock:
+            if not self.shared:
+                self._cache[job_id] = job
+            self._save(job)
+        self._maybe_evict()
+        return job
+
+    def get(self, job_id):
+        """Look up a job, from the cache first and then from disk"""
+        job = self._cache.get(job_id)
+        if job is not None:
+            return job
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = Job.from_row(row)
+            if self.shared:
+                job.transfer = self._transfers.get(job_id)
+            else:
+                self._cache[job_id] = job
+            return job
+
+    def get_many(self, job_ids):
+        """Look up several jobs with one query for those not cached, as {job_id: job}"""
+        found = {job_id: self._cache[job_id] for job_id in job_ids if job_id in self._cache}
+        missing = [job_id for job_id in dict.fromkeys(job_ids) if job_id not in found]
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = self._conn.execute(f"SELECT * FROM jobs WHERE job_id IN ({','.join('?' * len(chunk))})",
+                                          chunk).fetchall()
+                for row in rows:
+                    job = Job.from_row(row)
+                    if self.shared:
+                        job.transfer = self._transfers.get(job.job_id)
+                    else:
+                        self._cache[job.job_id] = job
+                    found[job.job_id] = job
+        return found
+
+    def update(self, job_id, **fields):
+        """Change fields of a job and persist them
+
+        'extra' is merged into the existing extra dict rather than replacing it.
+        """
+        return self._update(job_id, None, fields)
+
+    def claim(self, job_id, expected_status, **fields):
+        """Update a job like update(), but only while its status is expected_status
+
+        Atomic across processes sharing the database, so only one of them
+        acts on a job. Returns the job, or None if the status had changed.
+        """
+        return self._update(job_id, expected_status, fields)
+
+    def _update(self, job_id, expected_status, fields):
+        # In shared mode the read and the write share one write transaction, so
+        # a concurrent change from another process is neither lost nor overwritten
+        with self._lock:
+            if self.shared:
+                self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = self.get(job_id)
+                if job is not None and expected_status in (None, job.status):
+                    self._apply(job, fields)
+                else:
+                    job = None
+                if self.shared:
+                    self._conn.execute("COMMIT")
+            except Exception:
+                if self.shared:
+                    self._conn.execute("ROLLBACK")
+                raise
+        if job is not None and self.on_change:
+            self.on_change(job)
+        return job
+
+    def _apply(self, job, fields):
+        extra = fields.pop("extra", None)
+        if extra:
+            job.extra.update(extra)
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.updated = time.time()
+        if job.finished:
+            job.transfer = None
+            job.live = None
+            self._transfers.pop(job.job_id, None)
+        if not self.shared:
+            self._save(job)
+            return
+        # Write only the changed columns, leaving the rest to other processes
+        names = list(fields) + (["extra"] if extra else []) + ["updated"] + (["live"] if job.finished else [])
+        row = dict(zip(Job.__slots__, job.to_row()))
+        self._conn.execute(f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in names)} WHERE job_id = ?",
+                           [row[name] for name in names] + [job.job_id])
+
+    def set_progress(self, job_id, progress):
+        """Update progress in memory only, it is persisted with the next update()
+
+        In shared mode it is written straight away so other processes see it.
+        """
+        if self.shared:
+            with self._lock:
+                self._conn.execute("UPDATE jobs SET progress = ? WHERE job_id = ?", (progress, job_id))
+            job = self.get(job_id)
+        else:
+            job = self._cache.get(job_id)
+        if job is not None:
+            job.progress = progress
+            if self.on_change:
+                self.on_change(job)
+
+    def track(self, job_id, transfer):
+        """Attach live transfer counters to a job, read back through job.transfer"""
+        job = self.get(job_id)
+        if job is not None:
+            job.transfer = transfer
+            if self.shared:
+                self._transfers[job_id] = transfer
+        return transfer
+
+    def set_live(self, job_id, snapshot):
+        """Show a progress snapshot, e.g. encoder speed, with the job until it finishes
+
+        Kept in memory like set_progress, and written straight away in shared mode.
+        """
+        if self.shared:
+            self.save_live(job_id, snapshot)
+            job = self.get(job_id)
+        else:
+            job = self._cache.get(job_id)
+            if job is not None:
+                job.progress = snapshot["progress"]
+                job.live = snapshot
+        if job is not None and self.on_change:
+            self.on_change(job)
+
+    def save_live(self, job_id, snapshot):
+        """Persist a transfer snapshot for processes that do not run the job (shared mode)"""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET progress = ?, live = ? WHERE job_id = ?",
+                               (snapshot["progress"], json.dumps(snapshot), job_id))
+
+    def join_download(self, job_id, key):
+        """Atomically attach a job to the unfinished download of key (shared mode)
+
+        Returns the id of the job doing the download, which is job_id itself
+        when there is none yet.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE json_extract(extra, '$.key') = ? AND job_id != ?"
+                    " AND json_extract(extra, '$.follows') IS NULL AND json_extract(extra, '$.reused') IS NULL"
+                    " AND status != 'completed' AND status NOT LIKE 'error%' ORDER BY created LIMIT 1",
+                    (key, job_id)
+                ).fetchone()
+                primary = row[0] if row else job_id
+                extra = {"key": key, "follows": primary} if row else {"key": key}
+                self._conn.execute("UPDATE jobs SET extra = json_patch(COALESCE(extra, '{}'), ?) WHERE job_id = ?",
+                                   (json.dumps(extra), job_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return primary
+
+    def followers(self, job_id):
+        """Ids of unfinished jobs attached to a download"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE json_extract(extra, '$.follows') = ?"
+                " AND status != 'completed' AND status NOT LIKE 'error%'", (job_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def references(self, path):
+        """Whether any job record points to a file"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM jobs WHERE file_path = ? LIMIT 1", (path,)).fetchone() is not None
+
+    def delete(self, job_id):
+        """Remove a job record"""
+        with self._lock:
+            self._cache.pop(job_id, None)
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def interrupted(self):
+        """Jobs left unfinished on disk, e.g. by a server restart"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status != 'completed' AND status NOT LIKE 'error%'"
+            ).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def with_status(self, status, kind, limit=50):
+        """Jobs of one kind currently in a status, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND kind = ? ORDER BY created, job_id LIMIT ?",
+                (status, kind, limit)
+            ).fetchall()
+        return [self._cache.get(row[0]) or Job.from_row(row) for row in rows]
+
+    def completed(self, kind):
+        """Finished jobs of one kind that produced a file"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE kind = ? AND status = 'completed' AND file_path IS NOT NULL", (kind,)
+            ).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def evict_expired(self):
+        """Drop finished jobs older than the TTL, returns how many were removed"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            self._last_evict = time.time()
+            for job_id in [job_id for job_id, job in self._cache.items()
+                           if job.finished and job.updated < cutoff]:
+                del self._cache[job_id]
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE updated < ? AND (status = 'completed' OR status LIKE 'error%')",
+                (cutoff,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(row[0],) for row in rows])
+        if self.on_evict:
+            for row in rows:
+                self.on_evict(Job.from_row(row))
+        return len(rows)
+
+    def _maybe_evict(self):
+        if time.time() - self._last_evict >= self.evict_interval:
+            self.evict_expired()
+
+    def _save(self, job):
+        self._conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", job.to_row())
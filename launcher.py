@@ -14,7 +14,7 @@ from pathlib import Path
 
 def check_dependencies():
     """Check if required packages are installed"""
-    required_packages = ['flask', 'pytubefix', 'moviepy']
+    required_packages = ['flask', 'pytubefix', 'imageio_ffmpeg']
     missing_packages = []
     
     for package in required_packages:
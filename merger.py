@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Merge engine for YouTube Downloader
+Probes video/audio inputs and remuxes them without re-encoding whenever the
+codecs fit the MP4 container, falling back to a re-encode only when needed.
+Can also remux straight from the stream URLs into a fragmented MP4 pipe
+"""
+
+import functools
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+# Codecs that can be stream-copied into an MP4 container
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1', 'mpeg4', 'vp9'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'alac', 'ac3', 'eac3'}
+
+# YouTube codec string prefixes (e.g. 'avc1.640028') to FFmpeg codec names
+_MANIFEST_CODECS = {'avc1': 'h264', 'avc3': 'h264', 'hev1': 'hevc', 'hvc1': 'hevc',
+                    'vp09': 'vp9', 'av01': 'av1', 'mp4a': 'aac'}
+
+# x264 and AAC settings used when a stream has to be re-encoded
+ENCODE_PROFILES = {
+    'throughput': {'preset': 'ultrafast', 'crf': 23, 'audio_bitrate': '160k'},
+    'balanced': {'preset': 'fast', 'crf': 23, 'audio_bitrate': '192k'},
+    'archival': {'preset': 'slow', 'crf': 18, 'audio_bitrate': '256k'},
+}
+
+_STREAM_RE = re.compile(r'Stream #(\d+):(\d+)[^:]*: (Video|Audio): (\w+)')
+_SIZE_RE = re.compile(r', (\d{2,5})x(\d{2,5})[, \[]')
+_DURATION_RE = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+
+@functools.lru_cache(maxsize=None)
+def get_ffmpeg_path():
+    """Find an FFmpeg binary on PATH or the one bundled with imageio-ffmpeg, once per process"""
+    path = shutil.which('ffmpeg')
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_capabilities():
+    """Encoders of the FFmpeg binary, read once per process, or None without FFmpeg
+
+    Lets commands be built for what the build supports (e.g. LGPL builds ship
+    without libx264) instead of trying alternatives one after another.
+    """
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        return None
+    result = subprocess.run([ffmpeg, '-hide_banner', '-encoders'], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+    encoders = set()
+    listing = False
+    for line in result.stdout.decode(errors='replace').splitlines():
+        # Entries follow a ' ------' line: ' V....D libx264   libx264 H.264 / AVC ...'
+        if line.strip().startswith('---'):
+            listing = True
+        elif listing and line.strip():
+            fields = line.split()
+            if len(fields) >= 2:
+                encoders.add(fields[1])
+    return {'path': ffmpeg, 'encoders': encoders}
+
+def has_encoder(name):
+    """Whether the FFmpeg build includes an encoder, assumed so if it cannot be asked"""
+    capabilities = ffmpeg_capabilities()
+    return capabilities is None or not capabilities['encoders'] or name in capabilities['encoders']
+
+def probe_inputs(*paths):
+    """Probe media files with a single FFmpeg call
+
+    Returns one dict per input with 'video' and 'audio' codec names (or None),
+    'duration' in seconds and the video 'height' in pixels.
+    """
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        raise Exception("FFmpeg is not available")
+
+    cmd = [ffmpeg, '-hide_banner']
+    for path in paths:
+        cmd += ['-i', path]
+    # FFmpeg exits non-zero without an output file, the stream info is on stderr
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output = result.stderr.decode(errors='replace')
+
+    info = [{'video': None, 'audio': None, 'duration': None, 'height': None} for _ in paths]
+    current = -1
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('Input #'):
+            current += 1
+        elif line.startswith('Duration:') and 0 <= current < len(info):
+            match = _DURATION_RE.search(line)
+            if match:
+                hours, minutes, seconds = match.groups()
+                info[current]['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        else:
+            match = _STREAM_RE.search(line)
+            if match:
+                index = int(match.group(1))
+                kind = match.group(3).lower()
+                if index < len(info) and info[index][kind] is None:
+                    info[index][kind] = match.group(4)
+                    size = _SIZE_RE.search(line) if kind == 'video' else None
+                    if size:
+                        info[index]['height'] = int(size.group(2))
+
+    for path, entry in zip(paths, info):
+        if entry['video'] is None and entry['audio'] is None:
+            raise Exception(f"Could not read media streams from {os.path.basename(path)}")
+    return info
+
+def codec_from_manifest(codec):
+    """FFmpeg codec name for a codec string from a stream manifest"""
+    if not codec:
+        return None
+    prefix = codec.split('.')[0].lower()
+    return _MANIFEST_CODECS.get(prefix, prefix)
+
+def plan_merge(video_info, audio_info):
+    """Decide how each stream is written: 'copy' when the codec fits MP4"""
+    if not video_info['video']:
+        raise Exception("Video input has no video stream")
+    if not audio_info['audio']:
+        raise Exception("Audio input has no audio stream")
+
+    video_action = 'copy' if video_info['video'] in MP4_VIDEO_CODECS else 'encode'
+    audio_action = 'copy' if audio_info['audio'] in MP4_AUDIO_CODECS else 'encode'
+
+    if video_action == 'copy' and audio_action == 'copy':
+        method = 'remux'
+    elif video_action == 'copy':
+        method = 'remux_audio_transcode'
+    else:
+        method = 'reencode'
+    return {'method': method, 'video': video_action, 'audio': audio_action}
+
+def choose_profile(height=None, backlog=0):
+    """Encode profile for a re-encode: 'throughput' when other encodes are waiting
+    for a CPU worker or the picture is larger than 1080p, otherwise 'balanced'"""
+    if backlog > 0 or (height or 0) > 1080:
+        return 'throughput'
+    return 'balanced'
+
+def resolve_profile(profile, height=None, backlog=0):
+    """Profile name for a configured or requested value, which may be 'auto'"""
+    if profile == 'auto':
+        return choose_profile(height, backlog)
+    if profile not in ENCODE_PROFILES:
+        raise Exception(f"Encode profile must be auto or one of {', '.join(ENCODE_PROFILES)}")
+    return profile
+
+def _input_args(path):
+    if path.startswith(('http://', 'https://')):
+        # Ride out dropped connections on long remote inputs
+        return ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5', '-i', path]
+    return ['-i', path]
+
+def _number(value):
+    try:
+        return float(value.rstrip('x'))
+    except (AttributeError, ValueError):
+        return 0.0  # 'N/A' before the first frame
+
+def progress_report(values, duration=None):
+    """Percent, encode fps, speed (x realtime) and ETA from one FFmpeg -progress block"""
+    # out_time_ms is in microseconds too, older builds only write that one
+    seconds = max(_number(values.get('out_time_us') or values.get('out_time_ms')) / 1e6, 0)
+    speed = _number(values.get('speed'))
+    report = {'seconds': round(seconds, 1), 'fps': round(_number(values.get('fps')), 1),
+              'speed': round(speed, 2), 'percent': None, 'eta': None}
+    if values.get('progress') == 'end':
+        report.update(percent=100, eta=0)
+    elif duration:
+        report['percent'] = min(round(seconds / duration * 100, 1), 100)
+        if speed > 0 and duration > seconds:
+            report['eta'] = round((duration - seconds) / speed)
+    return report
+
+def run_ffmpeg(cmd, duration=None, on_progress=None, interval=0.5, pass_fds=()):
+    """Run an FFmpeg command writing to a file, returns (return code, error output)
+
+    With on_progress, FFmpeg's -progress output is read as it runs and
+    progress_report() dicts are passed on at most every interval seconds,
+    percentages relative to duration (seconds) when it is known. pass_fds
+    are inherited by FFmpeg (e.g. 'pipe:N' inputs) and closed here once it
+    has started.
+    """
+    if on_progress is not None:
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE if on_progress else subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, pass_fds=pass_fds)
+    finally:
+        # FFmpeg holds its own copies, the writers see EOF/EPIPE only once ours are gone
+        for fd in pass_fds:
+            os.close(fd)
+    # Drained on the side so FFmpeg never blocks on a full stderr pipe
+    errors = []
+    reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+    reader.start()
+    try:
+        if on_progress is not None:
+            values = {}
+            reported = 0
+            for line in process.stdout:
+                key, _, value = line.decode(errors='replace').strip().partition('=')
+                values[key] = value
+                if key == 'progress':
+                    # Each block of key=value lines ends with progress=continue|end
+                    now = time.monotonic()
+                    if value == 'end' or now - reported >= interval:
+                        reported = now
+                        on_progress(progress_report(values, duration))
+                    values = {}
+        returncode = process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        reader.join()
+        if process.stdout:
+            process.stdout.close()
+        process.stderr.close()
+    return returncode, b"".join(errors).decode(errors='replace').strip()
+
+def build_merge_command(ffmpeg, video_path, audio_path, output_path, plan, fragmented=False,
+                        profile='balanced', threads=0):
+    """Build the FFmpeg argument list for a merge plan
+
+    With fragmented=True the output is a fragmented MP4, which can be written
+    to a pipe because it never seeks back to patch the header. profile names
+    the ENCODE_PROFILES entry used for re-encoded streams; threads caps the
+    encoder's threads (0 lets x264 use every core).
+    """
+    settings = ENCODE_PROFILES[profile]
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+           *_input_args(video_path), *_input_args(audio_path),
+           '-map', '0:v:0', '-map', '1:a:0']
+    if plan['video'] == 'copy':
+        cmd += ['-c:v', 'copy']
+    elif has_encoder('libx264'):
+        cmd += ['-c:v', 'libx264', '-preset', settings['preset'], '-crf', str(settings['crf'])]
+    else:
+        # FFmpeg's own MPEG-4 Part 2 encoder, in every build
+        cmd += ['-c:v', 'mpeg4', '-q:v', '3']
+    if plan['video'] != 'copy' and threads:
+        cmd += ['-threads', str(threads)]
+    if plan['audio'] == 'copy':
+        cmd += ['-c:a', 'copy']
+    else:
+        cmd += ['-c:a', 'aac', '-b:a', settings['audio_bitrate']]
+    if fragmented:
+        cmd += ['-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', output_path]
+    else:
+        cmd += ['-movflags', '+faststart', output_path]
+    return cmd
+
+# FFmpeg errors (lowercased) of streams that cannot be copied into MP4 as they are
+COPY_INCOMPATIBLE_ERRORS = (
+    'could not find tag for codec',
+    'not currently supported in container',
+    'incompatible with output codec',
+    'malformed aac bitstream',
+    'timestamps are unset',
+    'non monotonically increasing dts',
+)
+
+def copy_incompatible(errors):
+    """Whether FFmpeg's error output says a stream copy failed that a re-encode would fix"""
+    errors = (errors or '').lower()
+    return any(message in errors for message in COPY_INCOMPATIBLE_ERRORS)
+
+def merge_av(video_path, audio_path, output_path, probed=None, on_progress=None,
+             profile='balanced', threads=0, backlog=0):
+    """Merge a video and an audio file, remuxing without re-encoding when possible
+
+    probed may hold probe_inputs() results for both files gathered earlier,
+    e.g. while they were uploaded; they are only used if they include a
+    duration. on_progress receives progress_report() dicts while FFmpeg
+    runs. profile ('auto' picks from the video height and the number of
+    encodes waiting, backlog) and threads apply to re-encoded streams.
+    Returns a dict describing the decision: 'method', per-stream actions,
+    probed codecs, the profile and 'seconds' spent merging.
+    """
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        raise Exception("FFmpeg is not available")
+
+    started = time.time()
+    if probed and all(info and info.get('duration') for info in probed):
+        video_info, audio_info = probed
+    else:
+        video_info, audio_info = probe_inputs(video_path, audio_path)
+    plan = plan_merge(video_info, audio_info)
+    print(f"Merge plan: {plan['method']} (video {video_info['video']} -> {plan['video']}, "
+          f"audio {audio_info['audio']} -> {plan['audio']})")
+    # The output lasts as long as the longer input
+    duration = max(video_info['duration'] or 0, audio_info['duration'] or 0) or None
+    profile = resolve_profile(profile, video_info.get('height'), backlog)
+
+    returncode, errors = run_ffmpeg(build_merge_command(ffmpeg, video_path, audio_path, output_path, plan,
+                                                        profile=profile, threads=threads),
+                                    duration, on_progress)
+
+    if returncode != 0 and plan['method'] != 'reencode' and copy_incompatible(errors):
+        # The probe missed something the container cannot hold as it is; any
+        # other failure would only fail again after a full re-encode
+        print(f"Remux failed, re-encoding: {errors}")
+        plan = {'method': 'reencode', 'video': 'encode', 'audio': 'encode'}
+        returncode, errors = run_ffmpeg(build_merge_command(ffmpeg, video_path, audio_path, output_path, plan,
+                                                            profile=profile, threads=threads),
+                                        duration, on_progress)
+
+    if returncode != 0:
+        raise Exception(f"FFmpeg merge failed: {errors}")
+
+    return {
+        'method': plan['method'],
+        'video': plan['video'],
+        'audio': plan['audio'],
+        'video_codec': video_info['video'],
+        'audio_codec': audio_info['audio'],
+        'duration': video_info['duration'],
+        'profile': profile if plan['method'] != 'remux' else None,
+        'seconds': round(time.time() - started, 2)
+    }
+
+def _feed_pipe(fd, chunks, errors):
+    """Write byte chunks into a pipe and close it, recording anything but FFmpeg hanging up"""
+    try:
+        with open(fd, 'wb') as pipe:
+            for chunk in chunks:
+                pipe.write(chunk)
+    except BrokenPipeError:
+        # FFmpeg stopped reading, its own error explains why
+        pass
+    except Exception as e:
+        errors.append(e)
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+def merge_streams(video_chunks, audio_chunks, output_path, plan, duration=None, on_progress=None):
+    """Merge two downloads in progress into output_path without storing either stream
+
+    video_chunks and audio_chunks are iterables of bytes (e.g. segmented
+    downloads), each fed to FFmpeg through its own pipe as it arrives. The
+    plan comes from plan_merge() on codecs known up front; duration (seconds)
+    scales the progress passed to on_progress. The output is removed if
+    anything fails. Returns the same kind of dict as merge_av().
+    """
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        raise Exception("FFmpeg is not available")
+
+    started = time.time()
+    video_read, video_write = os.pipe()
+    audio_read, audio_write = os.pipe()
+    errors = []
+    writers = [threading.Thread(target=_feed_pipe, args=(fd, chunks, errors), daemon=True)
+               for fd, chunks in ((video_write, video_chunks), (audio_write, audio_chunks))]
+    cmd = build_merge_command(ffmpeg, f'pipe:{video_read}', f'pipe:{audio_read}', output_path, plan)
+    try:
+        try:
+            for writer in writers:
+                writer.start()
+        except BaseException:
+            os.close(video_read)
+            os.close(audio_read)
+            raise
+        returncode, ffmpeg_errors = run_ffmpeg(cmd, duration, on_progress, pass_fds=(video_read, audio_read))
+        for writer in writers:
+            writer.join()
+        if errors:
+            raise Exception(f"Stream download failed: {errors[0]}")
+        if returncode != 0:
+            raise Exception(f"FFmpeg merge failed: {ffmpeg_errors}")
+        # An MP4 with its index at the end cannot be read from a pipe, yet FFmpeg
+        # still exits cleanly with whatever it managed to write
+        output_info = probe_inputs(output_path)[0]
+        if not output_info['video'] or not output_info['audio']:
+            raise Exception(f"Piped merge produced an incomplete file: {ffmpeg_errors or 'missing streams'}")
+        if duration and (output_info['duration'] or 0) < duration - 2:
+            raise Exception(f"Piped merge stopped at {output_info['duration']}s of {duration}s")
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+    return {
+        'method': plan['method'],
+        'video': plan['video'],
+        'audio': plan['audio'],
+        'pipelined': True,
+        'seconds': round(time.time() - started, 2)
+    }
+
+def stream_fragmented_mp4(video_input, audio_input, plan, chunk_size=64 * 1024):
+    """Remux two inputs (paths or URLs) into a fragmented MP4 and yield it as it is produced
+
+    Nothing is written to disk. FFmpeg blocks on the pipe while the consumer
+    is slow, and is killed if the consumer stops early.
+    """
+    ffmpeg = get_ffmpeg_path()
+    if not ffmpeg:
+        raise Exception("FFmpeg is not available")
+
+    process = subprocess.Popen(build_merge_command(ffmpeg, video_input, audio_input, 'pipe:1', plan, fragmented=True),
+                               stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # Drained on the side so FFmpeg never blocks on a full stderr pipe
+    errors = []
+    reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+    reader.start()
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        if process.wait() != 0:
+            reader.join()
+            raise Exception(f"FFmpeg stream failed: {b''.join(errors).decode(errors='replace').strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        reader.join()
+        process.stdout.close()
+        process.stderr.close()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Video metadata cache for YouTube Downloader
+Keeps the title and stream manifest of recently analyzed videos, keyed by
+video ID, so /analyze and the download workers share one YouTube lookup
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_VIDEO_ID_RE = re.compile(r'(?:v=|/(?:shorts|embed|live|v)/|youtu\.be/)([0-9A-Za-z_-]{11})')
+
+def extract_video_id(url):
+    """Canonical video ID for a YouTube URL, or the trimmed URL if none is found"""
+    match = _VIDEO_ID_RE.search(url)
+    return match.group(1) if match else url.strip()
+
+def _stream_size(stream, resolve):
+    size = getattr(stream, '_filesize', None)
+    if size:
+        return size
+    if not resolve:
+        return None
+    try:
+        return stream.filesize
+    except Exception:
+        return None
+
+def build_manifest(video_id, yt):
+    """Serializable snapshot of a YouTube object's details and streams"""
+    streams = []
+    for stream in yt.streams:
+        is_audio = stream.type == "audio"
+        # Only resolve sizes (possibly a HEAD request) for streams the UI offers
+        resolve = is_audio or stream.is_progressive or stream.mime_type == "video/mp4"
+        streams.append({
+            "itag": stream.itag,
+            "type": stream.type,
+            "mime_type": stream.mime_type,
+            "subtype": stream.subtype,
+            "progressive": stream.is_progressive,
+            "adaptive": stream.is_adaptive,
+            "resolution": getattr(stream, 'resolution', None),
+            "fps": getattr(stream, 'fps', None),
+            "abr": getattr(stream, 'abr', None),
+            "video_codec": getattr(stream, 'video_codec', None),
+            "audio_codec": getattr(stream, 'audio_codec', None),
+            "filesize": _stream_size(stream, resolve)
+        })
+    return {
+        "video_id": video_id,
+        "title": yt.title,
+        "author": yt.author,
+        "views": yt.views or 0,
+        "length": yt.length or 0,
+        "description": yt.description or "",
+        "thumbnail_url": yt.thumbnail_url,
+        "streams": streams
+    }
+
+class VideoInfo:
+    """Cached manifest for one video, plus the live YouTube object when in memory"""
+
+    __slots__ = ("video_id", "manifest", "yt", "expires")
+
+    def __init__(self, video_id, manifest, yt=None, expires=0):
+        self.video_id = video_id
+        self.manifest = manifest
+        self.yt = yt
+        self.expires = expires
+
+    @property
+    def expired(self):
+        return time.time() >= self.expires
+
+class MetadataCache:
+    """LRU memory tier with an optional JSON-on-disk tier
+
+    `loader(url, **kwargs)` must return a pytubefix-like YouTube object; tests
+    can pass a fake factory.
+    """
+
+    def __init__(self, loader, max_entries=128, ttl_seconds=7200, disk_dir=None):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._pending = {}  # video ID -> future of an in-flight get_async() load
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, url, need_object=False, **loader_kwargs):
+        """Return the VideoInfo for a URL, loading it on a miss
+
+        With need_object=True the entry is guaranteed to carry a live YouTube
+        object (a disk hit only has the manifest).
+        """
+        video_id = extract_video_id(url)
+        info = self._lookup(video_id, need_object)
+        if info is not None:
+            return info
+
+        # One loader call per video, concurrent misses wait for it
+        with self._lock:
+            key_lock = self._key_locks.setdefault(video_id, threading.Lock())
+        with key_lock:
+            try:
+                info = self._lookup(video_id, need_object, count=False)
+                if info is not None:
+                    return info
+                with self._lock:
+                    self._stats["misses"] += 1
+                return self._load_info(video_id, self.loader(url, **loader_kwargs))
+            finally:
+                # Dropped while still held, so a new miss never picks up a lock
+                # on its way out; waiters on it find the entry once it is released
+                with self._lock:
+                    if self._key_locks.get(video_id) is key_lock:
+                        del self._key_locks[video_id]
+
+    async def get_async(self, url, loader, run_blocking, need_object=False):
+        """get() for an event loop
+
+        `loader(url)` is a coroutine returning a YouTube object and
+        `run_blocking(func, *args)` awaits func in a worker thread; disk
+        access and manifest building (which may issue HTTP requests) go
+        through it. Concurrent misses for one video share a single load.
+        """
+        video_id = extract_video_id(url)
+        info = await run_blocking(self._lookup, video_id, need_object)
+        if info is not None:
+            return info
+        pending = self._pending.get(video_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[video_id] = future
+        try:
+            with self._lock:
+                self._stats["misses"] += 1
+            info = await run_blocking(self._load_info, video_id, await loader(url))
+            future.set_result(info)
+            return info
+        except Exception as e:
+            future.set_exception(e)
+            # Mark it retrieved so an unawaited failure is not logged
+            future.exception()
+            raise
+        finally:
+            del self._pending[video_id]
+
+    def invalidate(self, url):
+        """Forget a video, e.g. after its stream URLs stopped working"""
+        video_id = extract_video_id(url)
+        with self._lock:
+            self._entries.pop(video_id, None)
+        path = self._disk_path(video_id)
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["max_entries"] = self.max_entries
+            stats["hit_rate"] = round((stats["hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0
+            return stats
+
+    def _lookup(self, video_id, need_object, count=True):
+        with self._lock:
+            info = self._entries.get(video_id)
+            if info is not None and info.expired:
+                del self._entries[video_id]
+                info = None
+            if info is not None and (info.yt is not None or not need_object):
+                self._entries.move_to_end(video_id)
+                if count:
+                    self._stats["hits"] += 1
+                return info
+        if need_object:
+            return None
+        info = self._read_disk(video_id)
+        if info is not None:
+            self._store(info)
+            with self._lock:
+                self._stats["disk_hits"] += 1
+        return info
+
+    def _load_info(self, video_id, yt):
+        info = VideoInfo(video_id, build_manifest(video_id, yt), yt, time.time() + self.ttl_seconds)
+        self._store(info)
+        self._write_disk(info)
+        return info
+
+    def _store(self, info):
+        with self._lock:
+            self._entries[info.video_id] = info
+            self._entries.move_to_end(info.video_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _disk_path(self, video_id):
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, re.sub(r'[^0-9A-Za-z_-]', '_', video_id)[:100] + ".json")
+
+    def _read_disk(self, video_id):
+        path = self._disk_path(video_id)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("expires", 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return VideoInfo(video_id, data["manifest"], None, data["expires"])
+
+    def _write_disk(self, info):
+        path = self._disk_path(info.video_id)
+        if not path:
+            return
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires": info.expires, "manifest": info.manifest}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Metadata cache write failed: {e}")
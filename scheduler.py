@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Job scheduler for YouTube Downloader
+Runs network-bound fetch jobs on a bounded thread pool fed by a priority
+queue, and limits how many mux/encode processes run at once to the cores.
+A worker that has to wait for an encode slot hands its place to a new
+worker first, so queued downloads keep going. The queue lives in memory,
+or in SQLite when several server processes share it
+"""
+
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Lower numbers run first, equal priorities run in FIFO order
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+class JobScheduler:
+    """Bounded worker pool with a priority queue and admission control"""
+
+    def __init__(self, fetch_workers=4, cpu_workers=None, max_queued=100):
+        self.fetch_workers = max(1, fetch_workers)
+        self.cpu_workers = (os.cpu_count() or 1) if cpu_workers is None else cpu_workers
+        self.max_queued = max_queued
+        self._pending = []  # heap of (priority, sequence, job_id, func, args)
+        self._sequence = itertools.count()
+        self._running = set()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._worker_count = itertools.count(1)
+        self._local = threading.local()
+        # Encoders run from this process, at most cpu_workers at once
+        self._cpu_slots = threading.BoundedSemaphore(self.cpu_workers) if self.cpu_workers > 0 else None
+        self._cpu_waiting = 0
+        self._waiting_lock = threading.Lock()
+        self._tasks = {}
+        # Called by a worker each time it takes a job off the queue, i.e. when room frees up
+        self.on_dequeue = None
+
+    def register(self, *funcs):
+        """Make job functions known by name, needed for queues shared between processes"""
+        for func in funcs:
+            self._tasks[func.__name__] = func
+
+    def start(self):
+        """Start the fetch worker threads (idempotent)"""
+        with self._condition:
+            if self._threads:
+                return
+            for _ in range(self.fetch_workers):
+                self._start_worker()
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._worker_main, name=f"fetch-worker-{next(self._worker_count)}")
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _worker_main(self):
+        self._local.worker = True
+        try:
+            self._worker()
+        finally:
+            with self._condition:
+                self._threads.remove(threading.current_thread())
+
+    def _handed_off(self):
+        """Whether this worker gave its place away and should stop after its job"""
+        return getattr(self._local, "handed_off", False)
+
+    def submit(self, job_id, func, *args, priority=PRIORITY_NORMAL):
+        """Queue a job, raising QueueFullError when admission is refused
+
+        Returns the 1-based position of the job in the queue.
+        """
+        self.start()
+        with self._condition:
+            if len(self._pending) >= self.max_queued:
+                raise QueueFullError(f"Server is busy ({len(self._pending)} jobs queued). Please try again in a few minutes.")
+            heapq.heappush(self._pending, (priority, next(self._sequence), job_id, func, args))
+            self._condition.notify()
+            return self._position_locked(job_id)
+
+    def queue_position(self, job_id):
+        """1-based position of a queued job, or None if it is not waiting"""
+        with self._condition:
+            return self._position_locked(job_id)
+
+    def _position_locked(self, job_id):
+        for position, entry in enumerate(sorted(self._pending), start=1):
+            if entry[2] == job_id:
+                return position
+        return None
+
+    def is_running(self, job_id):
+        """Whether a job has been picked up by a worker"""
+        with self._condition:
+            return job_id in self._running
+
+    def knows(self, job_id):
+        """Whether a job is waiting or running"""
+        with self._condition:
+            return job_id in self._running or any(entry[2] == job_id for entry in self._pending)
+
+    def stats(self):
+        """Snapshot of queue and pool usage"""
+        with self._condition:
+            return {
+                "queued": len(self._pending),
+                "running": len(self._running),
+                "fetch_workers": self.fetch_workers,
+                "cpu_workers": self.cpu_workers,
+                "encodes_waiting": self._cpu_waiting,
+                "max_queued": self.max_queued
+            }
+
+    def _worker(self):
+        while not self._handed_off():
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                _, _, job_id, func, args = heapq.heappop(self._pending)
+                self._running.add(job_id)
+            self._dequeued()
+            self._run(job_id, func, args)
+
+    def _dequeued(self):
+        if self.on_dequeue is not None:
+            try:
+                self.on_dequeue()
+            except Exception as e:
+                print(f"Dequeue callback failed: {e}")
+
+    def _run(self, job_id, func, args):
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+        finally:
+            with self._condition:
+                self._running.discard(job_id)
+
+    @contextlib.contextmanager
+    def cpu_slot(self):
+        """Context manager holding one of the cpu_workers places while an encoder runs
+
+        A fetch worker that has to wait for a place starts another worker
+        first and stops once its own job is done, so waiting encodes never
+        hold up the fetch pool. With cpu_workers=0 encoders run without a
+        limit.
+        """
+        if self._cpu_slots is None:
+            yield
+            return
+        if not self._cpu_slots.acquire(blocking=False):
+            self._wait_for_cpu_slot()
+        try:
+            yield
+        finally:
+            self._cpu_slots.release()
+
+    def _wait_for_cpu_slot(self):
+        if getattr(self._local, "worker", False) and not self._handed_off():
+            self._local.handed_off = True
+            with self._condition:
+                self._start_worker()
+        with self._waiting_lock:
+            self._cpu_waiting += 1
+        try:
+            self._cpu_slots.acquire()
+        finally:
+            with self._waiting_lock:
+                self._cpu_waiting -= 1
+
+    def encode_backlog(self):
+        """Encoders of this process waiting for a CPU worker place"""
+        return self._cpu_waiting
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists but belongs to someone else
+    return True
+
+class SharedJobScheduler(JobScheduler):
+    """JobScheduler whose queue is a SQLite table shared by several processes
+
+    Each process runs its own fetch workers and claims queued jobs
+    atomically. Jobs are stored by function name and JSON arguments, so
+    job functions must be registered with register(). Claims held by a
+    process that died (or by a previous launch, see boot_id) are released
+    and the job runs again.
+    """
+
+    def __init__(self, db_path, fetch_workers=4, cpu_workers=None, max_queued=100,
+                 poll_interval=0.5, boot_id=None):
+        super().__init__(fetch_workers, cpu_workers, max_queued)
+        self.poll_interval = poll_interval
+        self.boot_id = boot_id or uuid.uuid4().hex
+        self.instance = f"{self.boot_id}:{os.getpid()}"
+        self._last_reclaim = 0
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_queue (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL UNIQUE,
+                priority INTEGER NOT NULL,
+                task TEXT NOT NULL,
+                args TEXT NOT NULL,
+                claimed_by TEXT,
+                claimed_at REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS job_queue_order ON job_queue (claimed_by, priority, seq)")
+
+    def submit(self, job_id, func, *args, priority=PRIORITY_NORMAL):
+        """Queue a job for any process, raising QueueFullError when admission is refused
+
+        Submitting a job that is already queued or running is a no-op.
+        Returns the 1-based position of the job in the queue.
+        """
+        if self._tasks.get(func.__name__) is not func:
+            raise Exception(f"Job function {func.__name__} is not registered")
+        self.start()
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                known = self._conn.execute("SELECT 1 FROM job_queue WHERE job_id = ?", (job_id,)).fetchone()
+                queued = self._conn.execute("SELECT COUNT(*) FROM job_queue WHERE claimed_by IS NULL").fetchone()[0]
+                if queued >= self.max_queued and not known:
+                    raise QueueFullError(f"Server is busy ({queued} jobs queued). Please try again in a few minutes.")
+                self._conn.execute("INSERT OR IGNORE INTO job_queue (job_id, priority, task, args) VALUES (?, ?, ?, ?)",
+                                   (job_id, priority, func.__name__, json.dumps(args)))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        with self._condition:
+            self._condition.notify()
+        return self.queue_position(job_id)
+
+    def queue_position(self, job_id):
+        """1-based position of a queued job across all processes, or None"""
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT priority, seq FROM job_queue WHERE job_id = ? AND claimed_by IS NULL", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            ahead = self._conn.execute(
+                "SELECT COUNT(*) FROM job_queue WHERE claimed_by IS NULL AND (priority < ? OR (priority = ? AND seq < ?))",
+                (row[0], row[0], row[1])
+            ).fetchone()[0]
+        return ahead + 1
+
+    def is_running(self, job_id):
+        with self._db_lock:
+            row = self._conn.execute("SELECT claimed_by FROM job_queue WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def knows(self, job_id):
+        with self._db_lock:
+            return self._conn.execute("SELECT 1 FROM job_queue WHERE job_id = ?", (job_id,)).fetchone() is not None
+
+    def stats(self):
+        with self._db_lock:
+            queued, running = self._conn.execute(
+                "SELECT COALESCE(SUM(claimed_by IS NULL), 0), COALESCE(SUM(claimed_by IS NOT NULL), 0) FROM job_queue"
+            ).fetchone()
+        return {
+            "queued": queued,
+            "running": running,
+            "running_here": len(self._running),
+            "fetch_workers": self.fetch_workers,
+            "cpu_workers": self.cpu_workers,
+            "encodes_waiting": self._cpu_waiting,
+            "max_queued": self.max_queued,
+            "shared": True
+        }
+
+    def reclaim_stale(self):
+        """Release jobs claimed by processes that no longer run, returns how many"""
+        with self._db_lock:
+            self._last_reclaim = time.time()
+            claims = self._conn.execute(
+                "SELECT job_id, claimed_by FROM job_queue WHERE claimed_by IS NOT NULL"
+            ).fetchall()
+            stale = [(job_id, claimed_by) for job_id, claimed_by in claims if not self.instance_alive(claimed_by)]
+            for job_id, claimed_by in stale:
+                self._conn.execute("UPDATE job_queue SET claimed_by = NULL, claimed_at = NULL "
+                                   "WHERE job_id = ? AND claimed_by = ?", (job_id, claimed_by))
+        if stale:
+            print(f"Requeued {len(stale)} jobs left by stopped workers")
+        return len(stale)
+
+    def instance_alive(self, instance):
+        """Whether an instance id (boot id and pid) belongs to a process of this launch that still runs"""
+        boot_id, _, pid = (instance or "").rpartition(":")
+        return boot_id == self.boot_id and pid.isdigit() and _pid_alive(int(pid))
+
+    def _claim(self):
+        if time.time() - self._last_reclaim >= 30:
+            self.reclaim_stale()
+        with self._db_lock:
+            return self._conn.execute("""
+                UPDATE job_queue SET claimed_by = ?, claimed_at = ?
+                WHERE seq = (SELECT seq FROM job_queue WHERE claimed_by IS NULL ORDER BY priority, seq LIMIT 1)
+                RETURNING job_id, task, args
+            """, (self.instance, time.time())).fetchone()
+
+    def _worker(self):
+        while not self._handed_off():
+            claimed = self._claim()
+            if claimed is None:
+                # Other processes submit without notifying us, so poll as well
+                with self._condition:
+                    self._condition.wait(self.poll_interval)
+                continue
+            job_id, task, args = claimed
+            func = self._tasks.get(task)
+            with self._condition:
+                self._running.add(job_id)
+            self._dequeued()
+            try:
+                if func is None:
+                    print(f"Job {job_id} has unknown task {task}, dropping it")
+                else:
+                    self._run(job_id, func, json.loads(args))
+            finally:
+                with self._db_lock:
+                    self._conn.execute("DELETE FROM job_queue WHERE job_id = ?", (job_id,))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Production server for YouTube Downloader
+Runs YT_WEB_WORKERS worker processes behind uvicorn, whose progress streams
+hold no thread, or behind gunicorn with --wsgi (also used when uvicorn is
+not installed). The workers share job records, live progress and the
+download queue through the jobs database, so any worker can answer for a
+job another one is running
+
+Run with: python serve.py [--wsgi]  (pip install uvicorn, or gunicorn for --wsgi)
+"""
+
+import importlib.util
+import os
+import sys
+import uuid
+
+# Everything below is set before config is imported here or in a worker
+os.environ["YT_SHARED_STATE"] = "true"
+os.environ.setdefault("YT_BOOT_ID", uuid.uuid4().hex)
+# Same default as WEB_WORKERS in config.py, which must not be imported yet
+workers = int(os.environ.get("YT_WEB_WORKERS", str(min(os.cpu_count() or 1, 8))))
+if "YT_CPU_WORKERS" not in os.environ:
+    # Every worker has its own CPU slots, split the cores between them
+    os.environ["YT_CPU_WORKERS"] = str(max(1, (os.cpu_count() or 1) // workers))
+
+from config import HOST, PORT, WEB_WORKERS, WEB_THREADS, print_config_info
+
+def serve_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    class ServerApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{HOST}:{PORT}")
+            self.cfg.set("workers", WEB_WORKERS)
+            # Threaded workers, progress streams hold a connection each
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", WEB_THREADS)
+            self.cfg.set("timeout", 120)
+
+        def load(self):
+            from app import app
+            return app
+
+    ServerApplication().run()
+
+def serve_uvicorn():
+    import uvicorn
+    uvicorn.run("asgi:application", host=HOST, port=PORT, workers=WEB_WORKERS, log_level="warning")
+
+def installed(module):
+    return importlib.util.find_spec(module) is not None
+
+def main():
+    # Whichever one is installed when the other is not (gunicorn does not run on Windows)
+    use_asgi = installed("uvicorn") and ("--wsgi" not in sys.argv[1:] or not installed("gunicorn"))
+    if not use_asgi and not installed("gunicorn"):
+        print("The production server needs uvicorn or gunicorn: pip install uvicorn (or gunicorn)")
+        sys.exit(1)
+
+    print_config_info()
+    print(f"\nYouTube Downloader - {WEB_WORKERS} {'ASGI' if use_asgi else 'WSGI'} workers "
+          f"at http://localhost:{PORT}")
+    if use_asgi:
+        serve_uvicorn()
+    else:
+        serve_gunicorn()
+
+if __name__ == "__main__":
+    main()
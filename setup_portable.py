@@ -95,7 +95,7 @@ A fast, portable YouTube video downloader with built-in file merging capabilitie
 
 - **Fast Processing:** Optimized for speed with chunked downloads
 - **Real-time Progress:** Live download tracking
-- **Auto-Merge:** Automatic video+audio merging with MoviePy
+- **Auto-Merge:** Automatic video+audio merging with FFmpeg
 - **File Merger:** Upload and merge separate audio/video files
 - **Portable:** No external dependencies, works offline after setup
 - **High Quality:** Up to 4K/8K resolution support
@@ -104,7 +104,7 @@ A fast, portable YouTube video downloader with built-in file merging capabilitie
 
 - **Framework:** Flask (Python web framework)
 - **YouTube Library:** pytubefix (YouTube video extraction)
-- **Video Processing:** MoviePy (Python-based, no FFmpeg required)
+- **Video Processing:** FFmpeg bundled with imageio-ffmpeg (no separate install required)
 - **Port:** 5000 (configurable in app.py)
 
 ## 📦 Dependencies
@@ -112,7 +112,7 @@ A fast, portable YouTube video downloader with built-in file merging capabilitie
 All dependencies are automatically installed via `requirements.txt`:
 - Flask 3.0.0
 - pytubefix 6.10.2
-- moviepy 2.2.1
+- imageio-ffmpeg
 - Werkzeug 3.0.1
 
 ## 🌐 Network Access
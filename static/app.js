@@ -35,6 +35,7 @@ let currentVideoInfo = null;
 let selectedStream = null;
 let currentDownloadId = null;
 let pollInterval = null;
+let progressSource = null;
 
 // Initialize when DOM is loaded
 document.addEventListener('DOMContentLoaded', function() {
@@ -324,80 +325,105 @@ function showProgressCard() {
 }
 
 function startProgressPolling() {
+    // Server-Sent Events push each change; polling is the fallback
+    if (window.EventSource) {
+        console.log('Subscribing to progress events...');
+        progressSource = new EventSource(`/events/${currentDownloadId}`);
+        progressSource.onmessage = event => renderProgress(JSON.parse(event.data));
+        progressSource.onerror = () => {
+            progressSource.close();
+            progressSource = null;
+            pollProgress();
+        };
+        return;
+    }
+    pollProgress();
+}
+
+function pollProgress() {
     console.log('Starting progress polling...');
     pollInterval = setInterval(updateProgress, 1000);
     updateProgress(); // Initial update
 }
 
+function stopProgress() {
+    clearInterval(pollInterval);
+    if (progressSource) {
+        progressSource.close();
+    }
+}
+
 async function updateProgress() {
     try {
-        const response = await fetch(`/progress/${currentDownloadId}`);
-        const data = await response.json();
-
-        const progressBar = document.getElementById('progressBar');
-        const statusText = document.getElementById('statusText');
-        const downloadSection = document.getElementById('downloadSection');
-        const errorSection = document.getElementById('errorSection');
-
-        // Update progress bar
-        progressBar.style.width = data.progress + '%';
-        progressBar.setAttribute('aria-valuenow', data.progress);
-        progressBar.textContent = Math.round(data.progress) + '%';
-
-        // Update status text and styling
-        let statusMessage = '';
-        let statusIcon = '';
-
-        switch(data.status) {
-            case 'starting':
-                statusMessage = 'Starting download...';
-                statusIcon = 'fas fa-spinner fa-spin';
-                break;
-            case 'downloading_audio':
-                statusMessage = 'Downloading audio...';
-                statusIcon = 'fas fa-music';
-                progressBar.className = 'progress-bar progress-bar-striped progress-bar-animated bg-info';
-                break;
-            case 'downloading_video':
-                statusMessage = 'Downloading video...';
-                statusIcon = 'fas fa-video';
-                progressBar.className = 'progress-bar progress-bar-striped progress-bar-animated bg-warning';
-                break;
-            case 'merging':
-                statusMessage = 'Merging audio and video...';
-                statusIcon = 'fas fa-cogs';
-                progressBar.className = 'progress-bar progress-bar-striped progress-bar-animated bg-primary';
-                break;
-            case 'completed':
-                statusMessage = 'Download completed!';
-                statusIcon = 'fas fa-check-circle text-success';
-                progressBar.className = 'progress-bar bg-success';
-                document.getElementById('downloadFileBtn').href = `/download_file/${currentDownloadId}`;
-                downloadSection.style.display = 'block';
-                clearInterval(pollInterval);
-                break;
-            default:
-                if (data.status.startsWith('error:')) {
-                    statusMessage = 'Download failed';
-                    statusIcon = 'fas fa-exclamation-triangle text-danger';
-                    progressBar.className = 'progress-bar bg-danger';
-                    errorSection.style.display = 'block';
-                    document.getElementById('errorMessage').textContent = data.status.substring(7);
-                    clearInterval(pollInterval);
-                } else {
-                    statusMessage = 'Processing...';
-                    statusIcon = 'fas fa-spinner fa-spin';
-                }
-        }
-
-        statusText.innerHTML = `<i class="${statusIcon}"></i> ${statusMessage}`;
+        const response = await fetch(`/progress_api/${currentDownloadId}`);
+        renderProgress(await response.json());
     } catch (error) {
         console.error('Error fetching progress:', error);
         document.getElementById('statusText').innerHTML = 
             '<i class="fas fa-exclamation-triangle text-danger"></i> Error checking progress';
         document.getElementById('errorSection').style.display = 'block';
-        clearInterval(pollInterval);
+        stopProgress();
+    }
+}
+
+function renderProgress(data) {
+    const progressBar = document.getElementById('progressBar');
+    const statusText = document.getElementById('statusText');
+    const downloadSection = document.getElementById('downloadSection');
+    const errorSection = document.getElementById('errorSection');
+
+    // Update progress bar
+    progressBar.style.width = data.progress + '%';
+    progressBar.setAttribute('aria-valuenow', data.progress);
+    progressBar.textContent = Math.round(data.progress) + '%';
+
+    // Update status text and styling
+    let statusMessage = '';
+    let statusIcon = '';
+
+    switch(data.status) {
+        case 'starting':
+            statusMessage = 'Starting download...';
+            statusIcon = 'fas fa-spinner fa-spin';
+            break;
+        case 'downloading_audio':
+            statusMessage = 'Downloading audio...';
+            statusIcon = 'fas fa-music';
+            progressBar.className = 'progress-bar progress-bar-striped progress-bar-animated bg-info';
+            break;
+        case 'downloading_video':
+            statusMessage = 'Downloading video...';
+            statusIcon = 'fas fa-video';
+            progressBar.className = 'progress-bar progress-bar-striped progress-bar-animated bg-warning';
+            break;
+        case 'merging':
+            statusMessage = 'Merging audio and video...';
+            statusIcon = 'fas fa-cogs';
+            progressBar.className = 'progress-bar progress-bar-striped progress-bar-animated bg-primary';
+            break;
+        case 'completed':
+            statusMessage = 'Download completed!';
+            statusIcon = 'fas fa-check-circle text-success';
+            progressBar.className = 'progress-bar bg-success';
+            document.getElementById('downloadFileBtn').href = `/download_file/${currentDownloadId}`;
+            downloadSection.style.display = 'block';
+            stopProgress();
+            break;
+        default:
+            if (data.status.startsWith('error:')) {
+                statusMessage = 'Download failed';
+                statusIcon = 'fas fa-exclamation-triangle text-danger';
+                progressBar.className = 'progress-bar bg-danger';
+                errorSection.style.display = 'block';
+                document.getElementById('errorMessage').textContent = data.status.substring(7);
+                stopProgress();
+            } else {
+                statusMessage = 'Processing...';
+                statusIcon = 'fas fa-spinner fa-spin';
+            }
     }
+
+    statusText.innerHTML = `<i class="${statusIcon}"></i> ${statusMessage}`;
 }
 
 function formatDuration(seconds) {
@@ -412,11 +438,9 @@ function formatDuration(seconds) {
     }
 }
 
-// Clean up interval when page is unloaded
+// Clean up interval and event stream when page is unloaded
 window.addEventListener('beforeunload', function() {
-    if (pollInterval) {
-        clearInterval(pollInterval);
-    }
+    stopProgress();
 });
 
 console.log('YouTube Downloader JS file loaded completely');
@@ -0,0 +1,97 @@
+"""Fixtures for tests of the Flask routes in app.py, with a fake YouTube in place of pytubefix"""
+
+import os
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+import pytubefix
+
+from metadata_cache import extract_video_id
+
+MB = 1024 * 1024
+
+def fake_stream(itag, mime_type, quality, size, progressive=False, video_codec=None, audio_codec=None):
+    kind, subtype = mime_type.split("/")
+    return SimpleNamespace(itag=itag, type=kind, mime_type=mime_type, subtype=subtype,
+                           is_progressive=progressive, is_adaptive=not progressive,
+                           resolution=quality if kind == "video" else None, fps=30 if kind == "video" else None,
+                           abr=quality if kind == "audio" else None,
+                           video_codec=video_codec, audio_codec=audio_codec, _filesize=size)
+
+# What a video offers unless a test gives it other streams
+DEFAULT_STREAMS = [
+    fake_stream(18, "video/mp4", "360p", 5 * MB, progressive=True, video_codec="avc1.42001E", audio_codec="mp4a.40.2"),
+    fake_stream(137, "video/mp4", "1080p", 40 * MB, video_codec="avc1.640028"),
+    fake_stream(136, "video/mp4", "720p", 20 * MB, video_codec="avc1.4d401f"),
+    fake_stream(135, "video/mp4", "480p", 10 * MB, video_codec="avc1.4d401e"),
+    fake_stream(248, "video/webm", "1080p", 30 * MB, video_codec="vp9"),
+    fake_stream(140, "audio/mp4", "128kbps", 2 * MB, audio_codec="mp4a.40.2"),
+    fake_stream(251, "audio/webm", "160kbps", 3 * MB, audio_codec="opus"),
+]
+
+class FakeYouTube:
+    """Videos, playlists and channels the tests set up, served like pytubefix would"""
+
+    def __init__(self):
+        self.streams = {}  # video ID -> streams, DEFAULT_STREAMS for any other
+        self.titles = {}  # video ID -> title, 'Video <ID>' for any other
+        self.playlists = {}  # playlist or channel URL -> (title, video URLs)
+        self.broken = set()  # video IDs whose download fails
+        self.loaded = []
+
+    def video(self, url, **kwargs):
+        video_id = extract_video_id(url)
+        self.loaded.append(video_id)
+        return SimpleNamespace(title=self.titles.get(video_id, f"Video {video_id}"), author="Someone", views=1,
+                               length=60, description="", thumbnail_url="https://i.ytimg.com/vi/x/hqdefault.jpg",
+                               streams=self.streams.get(video_id, DEFAULT_STREAMS))
+
+    def playlist(self, url):
+        title, video_urls = self.playlists[url]
+        # Channels have a channel_name where playlists have a title
+        return SimpleNamespace(title=title, channel_name=title, video_urls=iter(video_urls))
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """The app module, with its databases and folders in a temporary directory"""
+    root = tmp_path_factory.mktemp("server")
+    os.environ.update({
+        "YT_JOBS_DB": str(root / "jobs.db"),
+        "YT_DOWNLOAD_FOLDER": str(root / "downloads"),
+        "YT_UPLOAD_FOLDER": str(root / "uploads"),
+        "YT_MERGED_FOLDER": str(root / "merged"),
+        "YT_WORKSPACE_DIR": str(root / "work"),
+        "YT_WORKSPACE_TMPFS": "",
+        "YT_METADATA_CACHE_DIR": "",
+    })
+    import app
+    app._recovery_done = True  # nothing to recover in a new database
+    return app
+
+@pytest.fixture
+def youtube(server, monkeypatch):
+    """FakeYouTube behind the metadata cache, the playlist expander and the download workers"""
+    fake = FakeYouTube()
+    monkeypatch.setattr(pytubefix, "Playlist", fake.playlist)
+    monkeypatch.setattr(pytubefix, "Channel", fake.playlist)
+    monkeypatch.setattr(server.metadata, "loader", fake.video)
+    monkeypatch.setattr(server.metadata, "_entries", OrderedDict())
+
+    def process_download(url, itag, mode, download_id):
+        video_id = extract_video_id(url)
+        if video_id in fake.broken:
+            server.jobs.update(download_id, status="error: Video unavailable", progress=0, error="Video unavailable")
+            return
+        os.makedirs(server.DOWNLOAD_FOLDER, exist_ok=True)
+        path = os.path.join(server.DOWNLOAD_FOLDER, f"{download_id}.mp4")
+        with open(path, "wb") as f:
+            f.write(f"{video_id}:{itag}:{mode}".encode())
+        server.jobs.update(download_id, status="completed", progress=100, file_path=path,
+                           filename=fake.titles.get(video_id, f"Video {video_id}") + ".mp4")
+    monkeypatch.setattr(server, "process_download", process_download)
+    return fake
+
+@pytest.fixture
+def client(server, youtube):
+    return server.app.test_client()
@@ -0,0 +1,131 @@
+"""Tests for size-bounded eviction in artifact_cache.py"""
+
+import itertools
+import os
+import time
+
+import pytest
+
+import artifact_cache
+from artifact_cache import ArtifactCache, artifact_dirname
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Make every time.time() call in the cache one second later than the previous one"""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(artifact_cache.time, "time", lambda: float(next(ticks)))
+
+def make_cache(tmp_path, **kwargs):
+    kwargs.setdefault("max_bytes", 10_000)
+    return ArtifactCache(str(tmp_path / "artifacts.db"), **kwargs)
+
+def store(cache, tmp_path, key, size=100, own_dir=False, category="downloads"):
+    directory = tmp_path / category / (artifact_dirname(key) if own_dir else "")
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{artifact_dirname(key)}.mp4"
+    path.write_bytes(b"x" * size)
+    cache.add(key, str(path), path.name, category)
+    return str(path)
+
+def keys(cache):
+    return {row[0] for row in cache._conn.execute("SELECT key FROM artifacts")}
+
+def test_lru_evicts_least_recently_used_down_to_low_water(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    paths = {key: store(cache, tmp_path, key) for key in "abcd"}
+    cache.lookup("a")
+    cache.max_bytes = 250  # evicts down to 225 bytes
+
+    assert cache.evict_to_budget() == 200
+
+    assert keys(cache) == {"a", "d"}
+    assert cache.total_bytes == 200
+    assert not os.path.exists(paths["b"]) and not os.path.exists(paths["c"])
+    assert os.path.exists(paths["a"]) and os.path.exists(paths["d"])
+
+def test_lfu_evicts_least_used_first(tmp_path, clock):
+    cache = make_cache(tmp_path, policy="lfu")
+    for key in "abc":
+        store(cache, tmp_path, key)
+    for key in "cccaab":
+        cache.lookup(key)
+    cache.max_bytes = 250
+
+    cache.evict_to_budget()
+
+    # b was used last but least often, LRU would have dropped c
+    assert keys(cache) == {"a", "c"}
+
+def test_eviction_batches_are_bounded(tmp_path, clock):
+    cache = make_cache(tmp_path, batch_size=2)
+    for key in "abcdef":
+        store(cache, tmp_path, key)
+    cache.max_bytes = 100
+
+    assert cache.evict_to_budget() == 200
+    assert keys(cache) == {"c", "d", "e", "f"}
+
+def test_eviction_skips_files_in_use(tmp_path, clock):
+    held = set()
+    cache = make_cache(tmp_path, in_use=lambda path: path in held)
+    paths = {key: store(cache, tmp_path, key) for key in "abc"}
+    held.add(paths["a"])
+    cache.max_bytes = 150
+
+    assert cache.evict_to_budget() == 200
+
+    assert keys(cache) == {"a"}
+    assert os.path.exists(paths["a"])
+
+def test_eviction_removes_per_key_directories(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    own = store(cache, tmp_path, "video:abc:22", own_dir=True)
+    sidecar = os.path.join(os.path.dirname(own), "thumbnail.jpg")
+    with open(sidecar, "wb") as f:
+        f.write(b"jpg")
+    shared = store(cache, tmp_path, "video:def:22")
+    neighbour = os.path.join(os.path.dirname(shared), "other.mp4")
+    with open(neighbour, "wb") as f:
+        f.write(b"keep")
+    cache.max_bytes = 1
+
+    cache.evict_to_budget()
+
+    assert keys(cache) == set()
+    assert not os.path.exists(os.path.dirname(own))
+    # A file that shares its directory is removed on its own
+    assert not os.path.exists(shared)
+    assert os.path.exists(neighbour)
+
+def test_adding_over_budget_evicts_in_the_background(tmp_path, clock):
+    cache = make_cache(tmp_path, max_bytes=350)
+    for key in "abcd":
+        store(cache, tmp_path, key)
+
+    deadline = time.monotonic() + 5
+    while cache.total_bytes > 315:
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+    assert keys(cache) == {"b", "c", "d"}
+
+def test_lookup_forgets_files_removed_behind_its_back(tmp_path):
+    cache = make_cache(tmp_path)
+    path = store(cache, tmp_path, "a")
+    os.remove(path)
+
+    assert cache.lookup("a") is None
+    assert keys(cache) == set()
+    assert cache.total_bytes == 0
+
+def test_evict_older_than_by_category(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    store(cache, tmp_path, "old-download")
+    store(cache, tmp_path, "old-merge", category="merged")
+    cutoff = artifact_cache.time.time()
+    store(cache, tmp_path, "new-download")
+
+    now = artifact_cache.time.time()
+    removed = cache.evict_older_than(now - cutoff, categories=["downloads"])
+
+    assert removed == (1, 100)
+    assert keys(cache) == {"old-merge", "new-download"}
@@ -0,0 +1,106 @@
+"""Tests for playlist and channel batches through the Flask routes in app.py"""
+
+import io
+import time
+import zipfile
+
+import pytest
+
+from batches import expand_playlist, is_batch_url
+
+PLAYLIST = "https://www.youtube.com/playlist?list=PL123"
+CHANNEL = "https://www.youtube.com/@someone/videos"
+
+def video_urls(prefix, count):
+    return [f"https://www.youtube.com/watch?v={prefix}{index:09d}" for index in range(count)]
+
+def wait_for_batch(client, batch_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        progress = client.get(f"/batch/{batch_id}").get_json()
+        if progress["status"] == "completed" or progress["status"].startswith("error"):
+            return progress
+        if time.monotonic() > deadline:
+            raise AssertionError(f"Timed out, batch is {progress['status']}")
+        time.sleep(0.02)
+
+@pytest.mark.parametrize("url, expected", [
+    (PLAYLIST, True),
+    (CHANNEL, True),
+    ("https://www.youtube.com/channel/UC123", True),
+    ("https://youtube.com/c/someone/", True),
+    ("https://www.youtube.com/watch?v=abcdefghijk&list=PL123", False),
+    ("https://youtu.be/abcdefghijk", False),
+    ("https://www.youtube.com/@someone/shorts", False),
+    ("https://example.com/playlist?list=PL123", False),
+])
+def test_is_batch_url(url, expected):
+    assert is_batch_url(url) is expected
+
+def test_expand_playlist_and_channel(youtube):
+    youtube.playlists[PLAYLIST] = ("My List", video_urls("ex", 5))
+    youtube.playlists[CHANNEL] = ("Someone", video_urls("ch", 3))
+
+    assert expand_playlist(PLAYLIST, 3) == ("My List", video_urls("ex", 3))
+    assert expand_playlist(CHANNEL, 10) == ("Someone", video_urls("ch", 3))
+
+def test_analyze_offers_a_batch_for_playlists(client, youtube):
+    response = client.post("/analyze", data={"url": PLAYLIST})
+
+    assert response.status_code == 200
+    assert b"Download Playlist" in response.data
+    assert youtube.loaded == []
+
+def test_batch_downloads_every_video_and_zips_them(client, youtube):
+    urls = video_urls("zp", 4)
+    youtube.playlists[PLAYLIST] = ("My List", urls)
+    for index in range(3):
+        youtube.titles[f"zp{index:09d}"] = "Same"
+    youtube.broken.add("zp000000003")
+
+    batch_id = client.post("/batch", json={"url": PLAYLIST, "quality": "360p"}).get_json()["batch_id"]
+    progress = wait_for_batch(client, batch_id)
+
+    assert progress["status"] == "completed"
+    assert progress["title"] == "My List"
+    assert (progress["total"], progress["completed"], progress["failed"]) == (4, 3, 1)
+    assert [item["status"] for item in progress["items"]] == ["completed"] * 3 + ["error: Video unavailable"]
+
+    response = client.get(f"/batch/{batch_id}/zip")
+    assert response.status_code == 200
+    assert "My%20List.zip" in response.headers["Content-Disposition"]
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    # Videos of the same title get numbered names in the archive
+    assert archive.namelist() == ["Same.mp4", "Same (2).mp4", "Same (3).mp4"]
+    assert [archive.read(name) for name in archive.namelist()] == [
+        f"zp{index:09d}:18:progressive".encode() for index in range(3)]
+
+def test_channel_batches_are_capped(client, youtube, server, monkeypatch):
+    monkeypatch.setattr(server, "BATCH_MAX_VIDEOS", 2)
+    youtube.playlists[CHANNEL] = ("Someone", video_urls("cp", 5))
+
+    batch_id = client.post("/batch", json={"url": CHANNEL, "quality": "audio"}).get_json()["batch_id"]
+    progress = wait_for_batch(client, batch_id)
+
+    assert progress["title"] == "Someone"
+    assert progress["total"] == 2 and progress["completed"] == 2
+    assert [server.jobs.get(item["job_id"]).extra["itag"] for item in progress["items"]] == [251, 251]
+
+def test_empty_playlist_fails_the_batch(client, youtube):
+    youtube.playlists[PLAYLIST] = ("Empty", [])
+
+    batch_id = client.post("/batch", json={"url": PLAYLIST}).get_json()["batch_id"]
+
+    assert wait_for_batch(client, batch_id)["status"] == "error: No videos found at this URL"
+    assert client.get(f"/batch/{batch_id}/zip").status_code == 302
+
+@pytest.mark.parametrize("body, error", [
+    ({"url": "https://www.youtube.com/watch?v=abcdefghijk"}, "Please enter a YouTube playlist or channel URL"),
+    ({"url": PLAYLIST, "quality": "4k"}, "Quality must be"),
+    ({"url": PLAYLIST, "audio_format": "flac"}, "Audio format must be"),
+])
+def test_batch_rejects_bad_requests(client, body, error):
+    response = client.post("/batch", json=body)
+
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith(error)
@@ -0,0 +1,104 @@
+"""Tests for submitting and polling many jobs at once through /api/jobs in app.py"""
+
+import time
+
+import pytest
+
+def video_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def wait_for_jobs(client, job_ids, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        statuses = client.post("/api/jobs/status", json={"ids": job_ids}).get_json()["jobs"]
+        if all(entry["status"] == "completed" or entry["status"].startswith("error") for entry in statuses.values()):
+            return statuses
+        if time.monotonic() > deadline:
+            raise AssertionError(f"Timed out: {statuses}")
+        time.sleep(0.02)
+
+def test_submit_and_poll_itag_and_quality_jobs(client):
+    entries = client.post("/api/jobs", json={"jobs": [
+        {"url": video_url("bk000000001"), "itag": 18},
+        {"url": video_url("bk000000002"), "quality": "720p"},
+        {"url": video_url("bk000000003"), "quality": "audio", "audio_format": "copy"},
+    ]}).get_json()["jobs"]
+
+    assert [entry["status"] for entry in entries] == ["queued", "resolving", "resolving"]
+    job_ids = [entry["job_id"] for entry in entries]
+    statuses = wait_for_jobs(client, job_ids)
+
+    assert sorted(statuses) == sorted(job_ids)
+    for job_id in job_ids:
+        assert statuses[job_id] == {"status": "completed", "progress": 100,
+                                    "file": f"/download_file/{job_id}"}
+    response = client.get(f"/download_file/{job_ids[1]}")
+    assert response.data == b"bk000000002:136:merge"
+
+def test_a_bare_list_is_accepted(client):
+    entries = client.post("/api/jobs", json=[{"url": video_url("bk000000004"), "itag": "22"}]).get_json()["jobs"]
+
+    assert "job_id" in entries[0]
+
+def test_entries_fail_one_by_one(client):
+    entries = client.post("/api/jobs", json={"jobs": [
+        "https://www.youtube.com/watch?v=bk000000005",
+        {"itag": 18},
+        {"url": video_url("bk000000005")},
+        {"url": video_url("bk000000005"), "quality": "4k"},
+        {"url": video_url("bk000000005"), "itag": "abc"},
+        {"url": video_url("bk000000005"), "itag": 18, "mode": "torrent"},
+        {"url": video_url("bk000000005"), "itag": 140, "mode": "audio", "audio_bitrate": 999},
+        {"url": video_url("bk000000005"), "itag": 18},
+    ]}).get_json()["jobs"]
+
+    assert [entry.get("error") for entry in entries[:7]] == [
+        "Each job must be an object",
+        "Missing url",
+        "Give an itag or a quality",
+        "Quality must be best, 1080p, <=720p, smallest or audio-best",
+        "itag must be a number",
+        "mode must be progressive, merge or audio",
+        "Audio bitrate must be between 32 and 320 kbps",
+    ]
+    # The valid one still runs
+    assert "job_id" in entries[7]
+
+@pytest.mark.parametrize("body", [None, {}, {"jobs": []}, {"jobs": "url"}, "jobs"])
+def test_submit_needs_a_list_of_jobs(client, body):
+    response = client.post("/api/jobs", json=body)
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Expected a JSON list of jobs"}
+
+def test_submit_is_capped_at_the_queue_size(client, server, monkeypatch):
+    monkeypatch.setattr(server, "MAX_QUEUED_JOBS", 2)
+
+    response = client.post("/api/jobs", json={"jobs": [{"url": video_url("bk000000006"), "itag": 18}] * 3})
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "At most 2 jobs per request"}
+
+def test_a_stream_the_video_lacks_fails_its_job(client):
+    job_id = client.post("/api/jobs", json=[{"url": video_url("bk000000007"), "quality": "2160p"}]
+                         ).get_json()["jobs"][0]["job_id"]
+
+    assert wait_for_jobs(client, [job_id])[job_id] == {
+        "status": "error: No 2160p stream available", "progress": 0, "error": "No 2160p stream available"}
+
+def test_poll_by_query_string_reports_unknown_ids(client):
+    entries = client.post("/api/jobs", json=[{"url": video_url("bk000000008"), "itag": 18}]).get_json()["jobs"]
+    job_id = entries[0]["job_id"]
+    wait_for_jobs(client, [job_id])
+
+    statuses = client.get(f"/api/jobs/status?ids={job_id},missing").get_json()["jobs"]
+
+    assert statuses[job_id]["status"] == "completed"
+    assert statuses["missing"] == {"status": "not_found"}
+
+@pytest.mark.parametrize("body", [{"ids": "a,b"}, {"ids": [1, 2]}, "a"])
+def test_poll_needs_a_list_of_ids(client, body):
+    response = client.post("/api/jobs/status", json=body)
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Expected a list of job ids"}
@@ -0,0 +1,81 @@
+"""Tests for download coalescing and file reference counting in coalescer.py"""
+
+import pytest
+
+from coalescer import DownloadCoalescer
+from job_store import JobStore
+
+KEY = DownloadCoalescer.key_for("video", 137, "merge")
+
+def test_key_variants():
+    assert KEY == "video:137:merge"
+    assert DownloadCoalescer.key_for("video", 140, "audio", "mp3-192k") == "video:140:audio:mp3-192k"
+
+def test_followers_share_the_download_and_hold_a_reference_each():
+    coalescer = DownloadCoalescer()
+    assert coalescer.join(KEY, "a") == ("primary", "a")
+    assert coalescer.join(KEY, "b") == ("follower", "a")
+    assert coalescer.join(KEY, "c") == ("follower", "a")
+    assert coalescer.finish(KEY, "a", "/files/clip.mp4") == ["b", "c"]
+    for _ in range(3):
+        assert coalescer.in_use("/files/clip.mp4")
+        coalescer.release_for_job("/files/clip.mp4")
+    assert not coalescer.in_use("/files/clip.mp4")
+    # Finished, so the next job downloads again
+    assert coalescer.join(KEY, "d") == ("primary", "d")
+
+def test_failure_hands_back_followers_without_references():
+    coalescer = DownloadCoalescer()
+    coalescer.join(KEY, "a")
+    coalescer.join(KEY, "b")
+    assert coalescer.fail(KEY, "a") == ["b"]
+    assert coalescer._refs == {}
+    assert coalescer.join(KEY, "c") == ("primary", "c")
+
+def test_reference_counts():
+    coalescer = DownloadCoalescer()
+    coalescer.acquire("/tmp/part")
+    coalescer.hold_for_job("/tmp/part")
+    coalescer.release("/tmp/part")
+    assert coalescer.in_use("/tmp/part")
+    coalescer.release("/tmp/part")
+    assert not coalescer.in_use("/tmp/part")
+    # Releasing more often than acquired never goes negative
+    coalescer.release("/tmp/part")
+    coalescer.acquire("/tmp/part")
+    assert coalescer.in_use("/tmp/part")
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"), shared=True)
+
+def test_shared_store_records_the_download_to_follow(store):
+    coalescer = DownloadCoalescer(store=store)
+    for job_id in ("a", "b", "c"):
+        store.create(job_id, "download")
+    assert coalescer.join(KEY, "a") == ("primary", "a")
+    assert coalescer.join(KEY, "b") == ("follower", "a")
+    assert coalescer.join(KEY, "c") == ("follower", "a")
+    assert store.get("b").extra == {"key": KEY, "follows": "a"}
+    store.update("c", status="error: cancelled")
+    assert coalescer.finish(KEY, "a", "/files/clip.mp4") == ["b"]
+
+def test_shared_store_starts_over_after_the_download_ends(store):
+    coalescer = DownloadCoalescer(store=store)
+    store.create("a", "download")
+    coalescer.join(KEY, "a")
+    store.update("a", status="error: gone")
+    store.create("b", "download")
+    assert coalescer.join(KEY, "b") == ("primary", "b")
+
+def test_shared_store_job_records_are_the_references(store):
+    coalescer = DownloadCoalescer(store=store)
+    store.create("a", "download", status="completed", file_path="/files/clip.mp4")
+    coalescer.hold_for_job("/files/clip.mp4")
+    assert coalescer._refs == {}
+    assert coalescer.in_use("/files/clip.mp4")
+    store.delete("a")
+    assert not coalescer.in_use("/files/clip.mp4")
+    # Temp files of running jobs are still counted in memory
+    coalescer.acquire("/tmp/part")
+    assert coalescer.in_use("/tmp/part")
@@ -0,0 +1,89 @@
+"""Tests for Range, ETag and conditional request handling in delivery.py"""
+
+import os
+from email.utils import formatdate
+
+import pytest
+
+from delivery import etag_matches, if_range_matches, parse_range, plan_delivery
+
+SIZE = 1000
+
+@pytest.mark.parametrize("value, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=900-", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=500-5000", (500, 999)),
+    ("bytes=999-999", (999, 999)),
+])
+def test_parse_range_satisfiable(value, expected):
+    assert parse_range(value, SIZE) == expected
+
+@pytest.mark.parametrize("value", ["bytes=1000-", "bytes=1000-2000", "bytes=200-100", "bytes=-0"])
+def test_parse_range_unsatisfiable(value):
+    assert parse_range(value, SIZE) is False
+
+@pytest.mark.parametrize("value", [None, "", "items=0-10", "bytes=0-10,20-30", "bytes=a-b"])
+def test_parse_range_ignored(value):
+    assert parse_range(value, SIZE) is None
+
+def test_etag_matches_lists_weak_tags_and_star():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+
+def test_if_range_needs_strong_etag_or_exact_date():
+    assert if_range_matches('"b"', '"b"', 1000)
+    assert not if_range_matches('W/"b"', '"b"', 1000)
+    assert if_range_matches(formatdate(1000, usegmt=True), '"b"', 1000.5)
+    assert not if_range_matches(formatdate(999, usegmt=True), '"b"', 1000)
+
+@pytest.fixture
+def media(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(bytes(range(256)) * 4)
+    return str(path)
+
+def plan(path, tag=None, **headers):
+    return plan_delivery(path, "clip.mp4", lambda name: headers.get(name.replace("-", "_")), tag=tag)
+
+def header(delivery, name):
+    return dict(delivery.headers).get(name)
+
+def test_full_file(media):
+    delivery = plan(media)
+    assert (delivery.status, delivery.start, delivery.length, delivery.body) == (200, 0, 1024, True)
+    assert header(delivery, "Accept-Ranges") == "bytes"
+    assert header(delivery, "Content-Type") == "video/mp4"
+
+def test_range(media):
+    delivery = plan(media, Range="bytes=100-199")
+    assert (delivery.status, delivery.start, delivery.length) == (206, 100, 100)
+    assert header(delivery, "Content-Range") == "bytes 100-199/1024"
+    assert header(delivery, "Content-Length") == "100"
+
+def test_range_outside_the_file(media):
+    delivery = plan(media, Range="bytes=2000-")
+    assert delivery.status == 416 and not delivery.body
+    assert header(delivery, "Content-Range") == "bytes */1024"
+
+def test_if_none_match_returns_not_modified(media):
+    etag = header(plan(media), "ETag")
+    delivery = plan(media, If_None_Match=etag)
+    assert delivery.status == 304 and not delivery.body
+
+def test_etag_follows_content_tag(media):
+    assert header(plan(media, tag="abc"), "ETag") == '"abc"'
+    assert plan(media, tag="abc", If_None_Match='"abc"').status == 304
+
+def test_if_modified_since(media):
+    mtime = os.stat(media).st_mtime
+    assert plan(media, If_Modified_Since=formatdate(mtime + 60, usegmt=True)).status == 304
+    assert plan(media, If_Modified_Since=formatdate(mtime - 60, usegmt=True)).status == 200
+
+def test_stale_if_range_sends_the_whole_file(media):
+    delivery = plan(media, Range="bytes=0-9", If_Range='"stale"')
+    assert (delivery.status, delivery.length) == (200, 1024)
+    etag = header(plan(media), "ETag")
+    assert plan(media, Range="bytes=0-9", If_Range=etag).status == 206
@@ -0,0 +1,127 @@
+"""Tests for resuming segmented downloads from their journal in fetcher.py"""
+
+import os
+
+import pytest
+
+from fetcher import DownloadJournal, SegmentedDownloader, journal_path
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+SEGMENT = 1024
+
+class FakeResponse:
+    def __init__(self, status_code, data=b"", headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):
+        for offset in range(0, len(self.data), chunk_size):
+            yield self.data[offset:offset + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class FakeSession:
+    """Serves CONTENT with range support, cutting off ranges that start inside cut_segments"""
+
+    def __init__(self, content=CONTENT, cut_segments=()):
+        self.content = content
+        self.cut_segments = set(cut_segments)
+        self.ranges = []
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        first, _, last = headers["Range"][6:].partition("-")
+        start, end = int(first), min(int(last), len(self.content) - 1)
+        self.ranges.append((start, end))
+        data = self.content[start:end + 1]
+        if start // SEGMENT in self.cut_segments:
+            data = data[:100]
+        return FakeResponse(206, data, {"Content-Range": f"bytes {start}-{end}/{len(self.content)}"})
+
+def downloader(session):
+    return SegmentedDownloader(connections=2, segment_size=SEGMENT, max_retries=0, chunk_size=64, session=session)
+
+def interrupted_download(path, cut_segments=(3, 7)):
+    with pytest.raises(Exception, match="Connection closed"):
+        downloader(FakeSession(cut_segments=cut_segments)).download("http://media/clip", path)
+    assert os.path.exists(journal_path(path))
+
+def test_resumes_where_segments_stopped(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    interrupted_download(path)
+
+    session = FakeSession()
+    progress = []
+    assert downloader(session).download("http://media/clip", path,
+                                        on_progress=lambda done, segments: progress.append(done)) == len(CONTENT)
+    # Only the rest of the two cut segments is fetched again (after the size probe)
+    assert sorted(session.ranges[1:]) == [(3 * SEGMENT + 100, 4 * SEGMENT - 1), (7 * SEGMENT + 100, 8 * SEGMENT - 1)]
+    assert progress[0] == len(CONTENT) - 2 * (SEGMENT - 100)
+    assert open(path, "rb").read() == CONTENT
+    assert not os.path.exists(journal_path(path))
+
+def test_corrupted_segment_is_fetched_again(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    interrupted_download(path, cut_segments=(7,))
+    with open(path, "r+b") as f:
+        f.seek(2 * SEGMENT + 10)
+        f.write(b"garbage")
+
+    session = FakeSession()
+    downloader(session).download("http://media/clip", path)
+    assert sorted(session.ranges[1:]) == [(2 * SEGMENT, 3 * SEGMENT - 1), (7 * SEGMENT + 100, 8 * SEGMENT - 1)]
+    assert open(path, "rb").read() == CONTENT
+
+def test_changed_size_starts_over(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    interrupted_download(path)
+
+    content = CONTENT + b"more"
+    session = FakeSession(content=content)
+    downloader(session).download("http://media/clip", path)
+    assert len(session.ranges) == 1 + 11
+    assert open(path, "rb").read() == content
+
+def test_unexpected_size_is_refused(tmp_path):
+    with pytest.raises(Exception, match="expected"):
+        downloader(FakeSession()).download("http://media/clip", str(tmp_path / "clip.mp4"), expected_size=5)
+
+def test_stream_yields_segments_in_order(tmp_path):
+    session = FakeSession()
+    chunks = list(downloader(session).stream("http://media/clip"))
+    assert b"".join(chunks) == CONTENT
+    assert max(len(chunk) for chunk in chunks) == SEGMENT
+
+def test_verify_rechecks_segment_checksums(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    segments = downloader(FakeSession()).plan_segments(len(CONTENT))
+    journal = DownloadJournal(path, len(CONTENT), segments)
+    for index, (start, end) in enumerate(segments):
+        journal.record(index, CONTENT[start:end + 1])
+    with open(path, "wb") as f:
+        f.write(CONTENT)
+    journal.verify(path)
+
+    # Damaged on disk after the bytes were received
+    with open(path, "r+b") as f:
+        f.seek(5 * SEGMENT + 3)
+        f.write(b"!")
+    with pytest.raises(Exception, match="1 segments fail their checksum"):
+        journal.verify(path)
+
+    # The journal left behind makes the next attempt fetch that segment only
+    journal.save(force=True)
+    session = FakeSession()
+    downloader(session).download("http://media/clip", path)
+    assert session.ranges[1:] == [(5 * SEGMENT, 6 * SEGMENT - 1)]
+    assert open(path, "rb").read() == CONTENT
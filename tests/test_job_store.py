@@ -0,0 +1,106 @@
+"""Tests for SQLite-backed job records in job_store.py"""
+
+import time
+
+import pytest
+
+import job_store
+from job_store import Job, JobStore, is_terminal
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+@pytest.mark.parametrize("status, terminal", [
+    ("completed", True),
+    ("error", True),
+    ("error: Video unavailable", True),
+    ("queued", False),
+    ("downloading", False),
+    ("merging", False),
+])
+def test_is_terminal(status, terminal):
+    assert is_terminal(status) is terminal
+
+def test_job_round_trips_through_rows():
+    job = Job("j1", "merge", status="merging", progress=42.5, file_path="/data/merged/a.mp4", filename="a.mp4",
+              extra={"key": "merge:x", "sources": [1, 2]}, created=100.0, updated=200.0,
+              live={"progress": 42.5, "fps": 30.0})
+
+    copy = Job.from_row(job.to_row())
+
+    assert [getattr(copy, name) for name in Job.__slots__] == [getattr(job, name) for name in Job.__slots__]
+
+def test_job_row_without_extra_or_live():
+    copy = Job.from_row(Job("j1", "download", created=1.0, updated=1.0).to_row())
+
+    assert copy.extra == {} and copy.live is None
+
+def test_jobs_survive_a_restart(db_path):
+    store = JobStore(db_path)
+    store.create("j1", "download", extra={"itag": 22})
+    store.update("j1", status="downloading", progress=30, extra={"key": "video:x:22"})
+
+    job = JobStore(db_path).get("j1")
+
+    assert (job.status, job.progress) == ("downloading", 30)
+    assert job.extra == {"itag": 22, "key": "video:x:22"}
+
+def test_interrupted_lists_unfinished_jobs(db_path):
+    store = JobStore(db_path)
+    for job_id, status in [("queued", "queued"), ("running", "downloading"), ("done", "completed"),
+                           ("failed", "error: Video unavailable")]:
+        store.create(job_id, "download", status=status)
+
+    assert sorted(job.job_id for job in JobStore(db_path).interrupted()) == ["queued", "running"]
+
+def test_evict_expired_drops_old_finished_jobs(db_path, monkeypatch):
+    evicted = []
+    store = JobStore(db_path, ttl_seconds=3600, evict_interval=10 ** 9, on_evict=evicted.append)
+    now = time.time()
+    monkeypatch.setattr(job_store.time, "time", lambda: now - 7200)
+    store.create("old-done", "download", status="completed", file_path="/data/a.mp4")
+    store.create("old-failed", "merge", status="error: FFmpeg failed")
+    store.create("old-running", "download", status="downloading")
+    monkeypatch.setattr(job_store.time, "time", lambda: now)
+    store.create("new-done", "download", status="completed")
+
+    assert store.evict_expired() == 2
+
+    # on_evict gets the records, e.g. to release their files
+    assert sorted((job.job_id, job.file_path) for job in evicted) == [("old-done", "/data/a.mp4"),
+                                                                     ("old-failed", None)]
+    for job_id in ("old-done", "old-failed"):
+        assert store.get(job_id) is None
+        assert JobStore(db_path).get(job_id) is None
+    assert store.get("old-running") is not None and store.get("new-done") is not None
+
+def test_finishing_a_job_clears_its_live_snapshot(db_path):
+    store = JobStore(db_path, shared=True)
+    store.create("j1", "merge", status="merging")
+    store.set_live("j1", {"progress": 50.0, "fps": 24.0})
+    assert store.get("j1").live == {"progress": 50.0, "fps": 24.0}
+
+    store.update("j1", status="completed", progress=100)
+
+    job = store.get("j1")
+    assert job.live is None and job.progress == 100
+
+def test_claim_only_in_expected_status(db_path):
+    store = JobStore(db_path, shared=True)
+    store.create("j1", "download")
+
+    assert store.claim("j1", "queued", status="downloading") is not None
+    assert store.claim("j1", "queued", status="downloading") is None
+    assert store.claim("missing", "queued", status="downloading") is None
+
+def test_shared_updates_keep_other_processes_changes(db_path):
+    ours, theirs = JobStore(db_path, shared=True), JobStore(db_path, shared=True)
+    ours.create("j1", "download", extra={"itag": 22})
+    theirs.join_download("j1", "video:x:22")
+
+    ours.update("j1", status="downloading", extra={"size": 10})
+
+    job = theirs.get("j1")
+    assert job.status == "downloading"
+    assert job.extra == {"itag": 22, "key": "video:x:22", "size": 10}
@@ -0,0 +1,240 @@
+"""Tests for merge planning, encode profiles and FFmpeg progress parsing in merger.py"""
+
+import sys
+
+import pytest
+
+import merger
+from merger import (ENCODE_PROFILES, build_merge_command, choose_profile, codec_from_manifest, copy_incompatible,
+                    plan_merge, progress_report, resolve_profile, run_ffmpeg)
+
+def video(codec):
+    return {'video': codec, 'audio': None, 'duration': 10.0, 'height': 720}
+
+def audio(codec):
+    return {'video': None, 'audio': codec, 'duration': 10.0, 'height': None}
+
+@pytest.mark.parametrize("video_codec, audio_codec, method, video_action, audio_action", [
+    ('h264', 'aac', 'remux', 'copy', 'copy'),
+    ('hevc', 'mp3', 'remux', 'copy', 'copy'),
+    ('av1', 'aac', 'remux', 'copy', 'copy'),
+    ('vp9', 'aac', 'remux', 'copy', 'copy'),
+    ('vp9', 'opus', 'remux_audio_transcode', 'copy', 'encode'),
+    ('av1', 'vorbis', 'remux_audio_transcode', 'copy', 'encode'),
+    ('vp8', 'aac', 'reencode', 'encode', 'copy'),
+    ('vp8', 'vorbis', 'reencode', 'encode', 'encode'),
+])
+def test_plan_merge_copies_codecs_that_fit_mp4(video_codec, audio_codec, method, video_action, audio_action):
+    plan = plan_merge(video(video_codec), audio(audio_codec))
+
+    assert plan == {'method': method, 'video': video_action, 'audio': audio_action}
+
+def test_plan_merge_needs_a_video_and_an_audio_stream():
+    with pytest.raises(Exception, match="no video stream"):
+        plan_merge(audio('aac'), audio('aac'))
+    with pytest.raises(Exception, match="no audio stream"):
+        plan_merge(video('h264'), video('h264'))
+
+@pytest.mark.parametrize("codec, name", [
+    ('avc1.640028', 'h264'),
+    ('vp09.00.40.08', 'vp9'),
+    ('av01.0.08M.08', 'av1'),
+    ('mp4a.40.2', 'aac'),
+    ('opus', 'opus'),
+    (None, None),
+])
+def test_codec_from_manifest(codec, name):
+    assert codec_from_manifest(codec) == name
+
+@pytest.mark.parametrize("errors, expected", [
+    ("[mp4 @ 0x1] Could not find tag for codec vorbis in stream #1", True),
+    ("Malformed AAC bitstream detected: use the audio bitstream filter", True),
+    ("https://example.com/video: Connection reset by peer", False),
+    ("", False),
+    (None, False),
+])
+def test_copy_incompatible_only_matches_copy_errors(errors, expected):
+    assert copy_incompatible(errors) is expected
+
+# -progress output of an encode, as FFmpeg writes it to pipe:1
+PROGRESS_TRANSCRIPT = """\
+frame=0
+fps=0.00
+stream_0_0_q=0.0
+bitrate=N/A
+total_size=48
+out_time_us=N/A
+out_time_ms=N/A
+out_time=N/A
+dup_frames=0
+drop_frames=0
+speed=N/A
+progress=continue
+frame=240
+fps=60.00
+stream_0_0_q=28.0
+bitrate=524.3kbits/s
+total_size=262144
+out_time_us=4000000
+out_time_ms=4000000
+out_time=00:00:04.000000
+dup_frames=0
+drop_frames=0
+speed=2.00x
+progress=continue
+frame=595
+fps=59.50
+stream_0_0_q=28.0
+bitrate=530.1kbits/s
+total_size=655360
+out_time_us=10000000
+out_time_ms=10000000
+out_time=00:00:10.000000
+dup_frames=0
+drop_frames=0
+speed=2.50x
+progress=continue
+frame=1190
+fps=59.50
+stream_0_0_q=-1.0
+bitrate=528.0kbits/s
+total_size=1310720
+out_time_us=20000000
+out_time_ms=20000000
+out_time=00:00:20.000000
+dup_frames=0
+drop_frames=0
+speed=2.49x
+progress=end
+"""
+
+def progress_blocks(transcript):
+    blocks, values = [], {}
+    for line in transcript.splitlines():
+        key, _, value = line.partition('=')
+        values[key] = value
+        if key == 'progress':
+            blocks.append(values)
+            values = {}
+    return blocks
+
+def test_progress_report_from_a_transcript():
+    reports = [progress_report(values, duration=20) for values in progress_blocks(PROGRESS_TRANSCRIPT)]
+
+    assert reports == [
+        {'seconds': 0, 'fps': 0.0, 'speed': 0.0, 'percent': 0.0, 'eta': None},
+        {'seconds': 4.0, 'fps': 60.0, 'speed': 2.0, 'percent': 20.0, 'eta': 8},
+        {'seconds': 10.0, 'fps': 59.5, 'speed': 2.5, 'percent': 50.0, 'eta': 4},
+        {'seconds': 20.0, 'fps': 59.5, 'speed': 2.49, 'percent': 100, 'eta': 0},
+    ]
+
+def test_progress_report_without_a_duration():
+    report = progress_report({'out_time_us': '4000000', 'fps': '30', 'speed': '1.5x', 'progress': 'continue'})
+
+    assert report['seconds'] == 4.0
+    assert report['percent'] is None and report['eta'] is None
+
+def test_progress_report_reads_out_time_ms_and_caps_percent():
+    # Older builds only write out_time_ms, which also holds microseconds
+    report = progress_report({'out_time_ms': '21000000', 'speed': '2x', 'progress': 'continue'}, duration=20)
+
+    assert report['seconds'] == 21.0
+    assert report['percent'] == 100
+    assert report['eta'] is None
+
+def test_progress_report_clamps_negative_times():
+    # FFmpeg reports a negative out_time while it reads the first packets of some inputs
+    report = progress_report({'out_time_us': '-23220', 'progress': 'continue'}, duration=20)
+
+    assert report['seconds'] == 0
+    assert report['percent'] == 0
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    """Executable that prints the transcript like 'ffmpeg -progress pipe:1' and a warning on stderr"""
+    transcript = tmp_path / "progress.txt"
+    transcript.write_text(PROGRESS_TRANSCRIPT)
+    script = tmp_path / "ffmpeg"
+    script.write_text(f"#!{sys.executable}\n"
+                      "import sys\n"
+                      f"sys.stdout.write(open({str(transcript)!r}).read())\n"
+                      "sys.stderr.write('[aac @ 0x1] Too many bits per frame requested\\n')\n"
+                      "sys.exit(sys.argv[1:3] != ['-progress', 'pipe:1'])\n")
+    script.chmod(0o755)
+    return str(script)
+
+def test_run_ffmpeg_reports_progress_blocks(fake_ffmpeg, tmp_path):
+    reports = []
+    returncode, errors = run_ffmpeg([fake_ffmpeg, '-i', 'in.mp4', str(tmp_path / "out.mp4")],
+                                    duration=20, on_progress=reports.append, interval=0)
+
+    assert returncode == 0
+    assert errors == "[aac @ 0x1] Too many bits per frame requested"
+    assert [report['percent'] for report in reports] == [0.0, 20.0, 50.0, 100]
+    assert [report['eta'] for report in reports] == [None, 8, 4, 0]
+    assert reports[1]['fps'] == 60.0
+
+def test_run_ffmpeg_always_reports_the_end(fake_ffmpeg, tmp_path):
+    reports = []
+    run_ffmpeg([fake_ffmpeg, str(tmp_path / "out.mp4")], duration=20, on_progress=reports.append, interval=3600)
+
+    assert len(reports) <= 2
+    assert reports[-1]['percent'] == 100
+
+@pytest.mark.parametrize("height, backlog, profile", [
+    (None, 0, 'balanced'),
+    (720, 0, 'balanced'),
+    (1080, 0, 'balanced'),
+    (1440, 0, 'throughput'),
+    (2160, 0, 'throughput'),
+    (720, 1, 'throughput'),
+    (None, 3, 'throughput'),
+])
+def test_choose_profile_by_height_and_backlog(height, backlog, profile):
+    assert choose_profile(height, backlog) == profile
+
+def test_resolve_profile():
+    assert resolve_profile('auto', height=2160) == 'throughput'
+    assert resolve_profile('auto', height=720, backlog=0) == 'balanced'
+    # A named profile is used whatever the height or backlog
+    assert resolve_profile('archival', height=2160, backlog=5) == 'archival'
+    with pytest.raises(Exception, match="must be auto or one of throughput, balanced, archival"):
+        resolve_profile('fastest')
+
+def test_encode_profiles_trade_speed_for_quality():
+    presets = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow']
+    profiles = [ENCODE_PROFILES[name] for name in ('throughput', 'balanced', 'archival')]
+
+    assert [presets.index(profile['preset']) for profile in profiles] == sorted(
+        presets.index(profile['preset']) for profile in profiles)
+    assert [profile['crf'] for profile in profiles] == sorted((profile['crf'] for profile in profiles), reverse=True)
+    assert all(set(profile) == {'preset', 'crf', 'audio_bitrate'} for profile in profiles)
+
+def option(cmd, name):
+    return cmd[cmd.index(name) + 1] if name in cmd else None
+
+@pytest.mark.parametrize("x264", [True, False])
+def test_build_merge_command_limits_video_encoder_threads(monkeypatch, x264):
+    monkeypatch.setattr(merger, 'has_encoder', lambda name: x264)
+    plan = {'method': 'reencode', 'video': 'encode', 'audio': 'encode'}
+
+    cmd = build_merge_command('ffmpeg', 'v.webm', 'a.webm', 'out.mp4', plan, profile='throughput', threads=2)
+
+    assert option(cmd, '-threads') == '2'
+    assert option(cmd, '-c:v') == ('libx264' if x264 else 'mpeg4')
+    if x264:
+        assert option(cmd, '-preset') == 'ultrafast'
+        assert option(cmd, '-crf') == '23'
+    assert option(cmd, '-b:a') == ENCODE_PROFILES['throughput']['audio_bitrate']
+
+def test_build_merge_command_sets_threads_only_when_limited(monkeypatch):
+    monkeypatch.setattr(merger, 'has_encoder', lambda name: True)
+    plan = {'method': 'remux_audio_transcode', 'video': 'copy', 'audio': 'encode'}
+
+    copied = build_merge_command('ffmpeg', 'v.mp4', 'a.webm', 'out.mp4', plan, threads=2)
+    unlimited = build_merge_command('ffmpeg', 'v.webm', 'a.webm', 'out.mp4', dict(plan, video='encode'))
+
+    # Copying video leaves nothing to limit, threads=0 lets x264 pick
+    assert option(copied, '-c:v') == 'copy' and '-threads' not in copied
+    assert '-threads' not in unlimited
+    assert option(copied, '-b:a') == ENCODE_PROFILES['balanced']['audio_bitrate']
@@ -0,0 +1,194 @@
+"""Tests for the memory and disk tiers of metadata_cache.py"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import metadata_cache
+from metadata_cache import MetadataCache, extract_video_id
+
+class FakeStream:
+    def __init__(self, itag, type, mime_type, resolution=None, abr=None):
+        self.itag = itag
+        self.type = type
+        self.mime_type = mime_type
+        self.subtype = mime_type.split("/")[1]
+        self.is_progressive = False
+        self.is_adaptive = True
+        self.resolution = resolution
+        self.abr = abr
+        self._filesize = 1000 + itag
+
+class FakeYouTube:
+    def __init__(self, url):
+        self.url = url
+        self.title = f"Video {extract_video_id(url)}"
+        self.author = "Someone"
+        self.views = 10
+        self.length = 60
+        self.description = ""
+        self.thumbnail_url = "https://i.ytimg.com/vi/x/hqdefault.jpg"
+        self.streams = [FakeStream(137, "video", "video/mp4", resolution="1080p"),
+                        FakeStream(140, "audio", "audio/mp4", abr="128kbps")]
+
+class Loader:
+    """Counts calls and, while gate is cleared, blocks them"""
+
+    def __init__(self):
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, url, **kwargs):
+        self.calls.append(url)
+        self.gate.wait(5)
+        return FakeYouTube(url)
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(metadata_cache.time, "time", lambda: now[0])
+    return now
+
+def url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+@pytest.mark.parametrize("link", [
+    "https://www.youtube.com/watch?v=abcdefghijk&t=10",
+    "https://youtu.be/abcdefghijk",
+    "https://www.youtube.com/shorts/abcdefghijk",
+    "https://www.youtube.com/embed/abcdefghijk?start=3",
+    "  abcdefghijk ",
+])
+def test_extract_video_id(link):
+    assert extract_video_id(link) == "abcdefghijk"
+
+def test_entries_are_shared_by_urls_of_one_video():
+    loader = Loader()
+    cache = MetadataCache(loader)
+
+    info = cache.get(url("abcdefghijk"))
+
+    assert cache.get("https://youtu.be/abcdefghijk") is info
+    assert len(loader.calls) == 1
+    assert info.manifest["title"] == "Video abcdefghijk"
+    assert [stream["itag"] for stream in info.manifest["streams"]] == [137, 140]
+    assert info.manifest["streams"][1]["filesize"] == 1140
+
+def test_lru_bound_evicts_least_recently_used():
+    loader = Loader()
+    cache = MetadataCache(loader, max_entries=2)
+    cache.get(url("aaaaaaaaaaa"))
+    cache.get(url("bbbbbbbbbbb"))
+    cache.get(url("aaaaaaaaaaa"))  # now the most recently used
+
+    cache.get(url("ccccccccccc"))
+
+    assert list(cache._entries) == ["aaaaaaaaaaa", "ccccccccccc"]
+    assert cache.stats()["evictions"] == 1
+    cache.get(url("bbbbbbbbbbb"))
+    assert len(loader.calls) == 4
+
+def test_expired_entries_are_loaded_again(clock):
+    loader = Loader()
+    cache = MetadataCache(loader, ttl_seconds=60)
+    first = cache.get(url("abcdefghijk"))
+
+    clock[0] += 59
+    assert cache.get(url("abcdefghijk")) is first
+    clock[0] += 1
+    assert cache.get(url("abcdefghijk")) is not first
+    assert len(loader.calls) == 2
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    loader = Loader()
+    MetadataCache(loader, disk_dir=str(tmp_path)).get(url("abcdefghijk"))
+
+    cache = MetadataCache(loader, disk_dir=str(tmp_path))
+    info = cache.get(url("abcdefghijk"))
+
+    assert len(loader.calls) == 1
+    assert info.yt is None
+    assert info.manifest["title"] == "Video abcdefghijk"
+    assert cache.stats()["disk_hits"] == 1
+    # The manifest alone does not do for callers that need the YouTube object
+    assert cache.get(url("abcdefghijk"), need_object=True).yt is not None
+    assert len(loader.calls) == 2
+
+def test_expired_disk_entries_are_removed(tmp_path, clock):
+    loader = Loader()
+    MetadataCache(loader, ttl_seconds=60, disk_dir=str(tmp_path)).get(url("abcdefghijk"))
+    clock[0] += 60
+
+    MetadataCache(loader, ttl_seconds=60, disk_dir=str(tmp_path)).get(url("abcdefghijk"))
+
+    assert len(loader.calls) == 2
+    assert [path.name for path in tmp_path.iterdir()] == ["abcdefghijk.json"]
+
+def test_invalidate_drops_both_tiers(tmp_path):
+    loader = Loader()
+    cache = MetadataCache(loader, disk_dir=str(tmp_path))
+    cache.get(url("abcdefghijk"))
+
+    cache.invalidate("https://youtu.be/abcdefghijk")
+
+    assert list(tmp_path.iterdir()) == []
+    cache.get(url("abcdefghijk"))
+    assert len(loader.calls) == 2
+
+def test_concurrent_misses_share_one_load():
+    loader = Loader()
+    loader.gate.clear()
+    cache = MetadataCache(loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(url("abcdefghijk"))))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while not loader.calls:
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+    loader.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(loader.calls) == 1
+    assert len(results) == 5 and all(info is results[0] for info in results)
+    assert cache.stats()["misses"] == 1
+    assert cache._key_locks == {}
+
+def test_failed_load_is_retried_and_leaves_no_lock():
+    def failing(url, **kwargs):
+        raise Exception("Video unavailable")
+    cache = MetadataCache(failing)
+
+    with pytest.raises(Exception, match="unavailable"):
+        cache.get(url("abcdefghijk"))
+
+    assert cache._key_locks == {}
+    cache.loader = Loader()
+    assert cache.get(url("abcdefghijk")).manifest["video_id"] == "abcdefghijk"
+
+def test_get_async_shares_one_load():
+    loader = Loader()
+    cache = MetadataCache(loader)
+
+    async def load(link):
+        await asyncio.sleep(0.05)
+        return loader(link)
+
+    async def run_blocking(func, *args):
+        return await asyncio.to_thread(func, *args)
+
+    async def main():
+        return await asyncio.gather(*(cache.get_async(url("abcdefghijk"), load, run_blocking) for _ in range(5)))
+
+    results = asyncio.run(main())
+
+    assert len(loader.calls) == 1
+    assert all(info is results[0] for info in results)
+    assert cache._pending == {}
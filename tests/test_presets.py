@@ -0,0 +1,87 @@
+"""Tests for picking a stream from a quality preset in app.py"""
+
+import time
+
+import pytest
+
+from conftest import DEFAULT_STREAMS, MB, FakeYouTube, fake_stream
+from metadata_cache import build_manifest
+
+def manifest(streams=DEFAULT_STREAMS):
+    youtube = FakeYouTube()
+    youtube.streams["abcdefghijk"] = streams
+    return build_manifest("abcdefghijk", youtube.video("abcdefghijk"))
+
+WITHOUT_480P = [stream for stream in DEFAULT_STREAMS if stream.resolution != "480p"]
+
+@pytest.mark.parametrize("quality, itag, download_type", [
+    ("best", 137, "merge"),
+    ("1080p", 137, "merge"),
+    ("720p", 136, "merge"),
+    ("<=720p", 136, "merge"),
+    ("<=600p", 135, "merge"),
+    ("480p", 135, "merge"),
+    ("360p", 18, "progressive"),
+    ("smallest", 18, "progressive"),
+    ("audio", 251, "audio"),
+    ("audio-best", 251, "audio"),
+])
+def test_choose_option(server, quality, itag, download_type):
+    option = server.choose_option(manifest(), quality)
+
+    assert (option["itag"], option["download_type"]) == (itag, download_type)
+
+@pytest.mark.parametrize("quality", ["480p", "2160p", "<=240p"])
+def test_choose_option_without_a_matching_stream(server, quality):
+    assert server.choose_option(manifest(WITHOUT_480P), quality) is None
+
+def test_progressive_wins_over_merge_at_the_same_resolution(server):
+    streams = DEFAULT_STREAMS + [fake_stream(134, "video/mp4", "360p", 1 * MB, video_codec="avc1.4d401e")]
+
+    assert server.choose_option(manifest(streams), "360p")["itag"] == 18
+
+def test_smallest_counts_unknown_sizes_as_large(server):
+    streams = [fake_stream(18, "video/mp4", "360p", None, progressive=True),
+               fake_stream(22, "video/mp4", "720p", 30 * MB, progressive=True)]
+
+    assert server.choose_option(manifest(streams), "smallest")["itag"] == 22
+
+@pytest.mark.parametrize("quality", ["best", "1080p", "<=720p", "smallest", "audio", "audio-best"])
+def test_is_quality_preset(server, quality):
+    assert server.is_quality_preset(quality)
+
+@pytest.mark.parametrize("quality", ["4k", "720", "<720p", "hd", "", None, 720])
+def test_is_not_quality_preset(server, quality):
+    assert not server.is_quality_preset(quality)
+
+def wait_for_download(client, download_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        progress = client.get(f"/progress_api/{download_id}").get_json()
+        if progress["status"] == "completed" or progress["status"].startswith("error"):
+            return progress
+        if time.monotonic() > deadline:
+            raise AssertionError(f"Timed out, download is {progress['status']}")
+        time.sleep(0.02)
+
+def test_download_by_preset(client, server):
+    response = client.post("/download", json={"url": "https://youtu.be/pr000000001", "quality": "<=720p"})
+    download_id = response.get_json()["download_id"]
+
+    assert wait_for_download(client, download_id)["status"] == "completed"
+    job = server.jobs.get(download_id)
+    assert (job.extra["itag"], job.extra["mode"], job.extra["title"]) == (136, "merge", "Video pr000000001")
+
+def test_download_of_a_missing_resolution_fails(client, youtube):
+    youtube.streams["pr000000002"] = WITHOUT_480P
+
+    response = client.post("/download", json={"url": "https://youtu.be/pr000000002", "quality": "480p"})
+
+    assert wait_for_download(client, response.get_json()["download_id"])["status"] == "error: No 480p stream available"
+
+def test_download_rejects_unknown_presets(client, youtube):
+    response = client.post("/download", json={"url": "https://youtu.be/pr000000003", "quality": "4k"})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Quality must be best, 1080p, <=720p, smallest or audio-best"
+    assert youtube.loaded == []
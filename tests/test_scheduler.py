@@ -0,0 +1,124 @@
+"""Tests for claiming and reclaiming jobs of the SQLite-backed SharedJobScheduler"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from scheduler import PRIORITY_HIGH, PRIORITY_LOW, QueueFullError, SharedJobScheduler
+
+BOOT_ID = "test-boot"
+
+ran = []
+ran_lock = threading.Lock()
+gate = threading.Event()
+
+def record(name):
+    with ran_lock:
+        ran.append(name)
+
+def blocker(name):
+    gate.wait(5)
+    record(name)
+
+@pytest.fixture(autouse=True)
+def reset():
+    ran.clear()
+    gate.clear()
+    yield
+    gate.set()
+
+def make_scheduler(tmp_path, **kwargs):
+    scheduler = SharedJobScheduler(str(tmp_path / "queue.db"), poll_interval=0.01, boot_id=BOOT_ID, **kwargs)
+    scheduler.register(record, blocker)
+    return scheduler
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def test_each_job_runs_once_across_schedulers(tmp_path):
+    first = make_scheduler(tmp_path, fetch_workers=3)
+    second = make_scheduler(tmp_path, fetch_workers=3)
+    for index in range(30):
+        (first if index % 2 else second).submit(f"job-{index}", record, f"job-{index}")
+    wait_for(lambda: len(ran) == 30 and first.stats()["queued"] + first.stats()["running"] == 0)
+    assert sorted(ran) == sorted(f"job-{index}" for index in range(30))
+
+def test_priority_then_submission_order(tmp_path):
+    scheduler = make_scheduler(tmp_path, fetch_workers=1)
+    scheduler.submit("block", blocker, "block")
+    wait_for(lambda: scheduler.is_running("block"))
+    scheduler.submit("low", record, "low", priority=PRIORITY_LOW)
+    scheduler.submit("normal-1", record, "normal-1")
+    scheduler.submit("normal-2", record, "normal-2")
+    scheduler.submit("high", record, "high", priority=PRIORITY_HIGH)
+    assert scheduler.queue_position("high") == 1
+    assert scheduler.queue_position("low") == 4
+    gate.set()
+    wait_for(lambda: len(ran) == 5)
+    assert ran == ["block", "high", "normal-1", "normal-2", "low"]
+
+def test_admission_counts_unclaimed_jobs_only(tmp_path):
+    scheduler = make_scheduler(tmp_path, fetch_workers=1, max_queued=1)
+    scheduler.submit("block", blocker, "block")
+    wait_for(lambda: scheduler.is_running("block"))
+    scheduler.submit("queued", record, "queued")
+    # Already known: a no-op rather than a second entry
+    scheduler.submit("queued", record, "queued")
+    with pytest.raises(QueueFullError):
+        scheduler.submit("refused", record, "refused")
+    assert not scheduler.knows("refused")
+    gate.set()
+    wait_for(lambda: len(ran) == 2)
+    assert ran == ["block", "queued"]
+
+def test_unregistered_functions_are_refused(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    with pytest.raises(Exception, match="not registered"):
+        scheduler.submit("job", print, "x")
+
+def test_dequeue_callback(tmp_path):
+    scheduler = make_scheduler(tmp_path, fetch_workers=1)
+    calls = []
+    scheduler.on_dequeue = lambda: calls.append(scheduler.is_running("job"))
+    scheduler.submit("job", record, "job")
+    wait_for(lambda: ran == ["job"])
+    assert calls == [True]
+
+def test_reclaims_jobs_of_stopped_processes_only(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    claims = {
+        "mine": scheduler.instance,
+        "dead-process": f"{BOOT_ID}:{dead_pid()}",
+        "previous-launch": f"old-boot:{os.getpid()}",
+    }
+    for job_id, claimed_by in claims.items():
+        scheduler._conn.execute("INSERT INTO job_queue (job_id, priority, task, args, claimed_by, claimed_at) "
+                                "VALUES (?, 5, 'record', ?, ?, ?)", (job_id, f'["{job_id}"]', claimed_by, time.time()))
+    assert scheduler.reclaim_stale() == 2
+    assert scheduler.is_running("mine")
+    assert not scheduler.is_running("dead-process") and not scheduler.is_running("previous-launch")
+    assert scheduler.queue_position("dead-process") is not None
+
+    # Workers pick reclaimed jobs up again
+    scheduler.start()
+    wait_for(lambda: sorted(ran) == ["dead-process", "previous-launch"])
+
+def test_instance_alive(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    assert scheduler.instance_alive(scheduler.instance)
+    assert not scheduler.instance_alive(f"{BOOT_ID}:{dead_pid()}")
+    assert not scheduler.instance_alive(f"other-boot:{os.getpid()}")
+    assert not scheduler.instance_alive(None)
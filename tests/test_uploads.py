@@ -0,0 +1,84 @@
+"""Tests for the streaming multipart parser in uploads.py"""
+
+import hashlib
+import io
+import os
+
+import pytest
+
+from uploads import UploadRejected, UploadTooLarge, ingest_multipart
+
+BOUNDARY = "----test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+MB = 1024 * 1024
+
+def body(*parts):
+    """Encode (field name, filename or None, bytes) parts as a multipart body"""
+    out = io.BytesIO()
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        out.write(f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n".encode())
+        if filename:
+            out.write(b"Content-Type: application/octet-stream\r\n")
+        out.write(b"\r\n" + data + b"\r\n")
+    out.write(f"--{BOUNDARY}--\r\n".encode())
+    return out.getvalue()
+
+def ingest(data, tmp_path, max_file_bytes=MB, max_request_bytes=10 * MB, chunk_size=7, **kwargs):
+    def destination(field, filename):
+        return str(tmp_path / f"{field}_{filename}") if field.endswith("_file") else None
+    return ingest_multipart(io.BytesIO(data), CONTENT_TYPE, len(data), destination, max_file_bytes,
+                            max_request_bytes, chunk_size=chunk_size, **kwargs)
+
+def test_fields_and_files(tmp_path):
+    video = os.urandom(5000)
+    fields, files = ingest(body(("output_name", None, "clip ✓".encode()), ("video_file", "v.mp4", video),
+                                ("audio_file", "a.m4a", b"audio")), tmp_path)
+    assert fields == {"output_name": "clip ✓"}
+    upload = files["video_file"]
+    assert (upload.filename, upload.size, upload.sha256) == ("v.mp4", 5000, hashlib.sha256(video).hexdigest())
+    with open(upload.path, "rb") as f:
+        assert f.read() == video
+    assert open(files["audio_file"].path, "rb").read() == b"audio"
+
+def test_dropped_file_parts_are_not_written(tmp_path):
+    _, files = ingest(body(("other", "x.bin", b"data"), ("video_file", "v.mp4", b"v")), tmp_path)
+    assert list(files) == ["video_file"]
+    assert sorted(os.listdir(tmp_path)) == ["video_file_v.mp4"]
+
+def test_header_callback(tmp_path):
+    seen = []
+    ingest(body(("video_file", "v.mp4", b"x" * 300)), tmp_path, header_bytes=100,
+           on_header=lambda field, path: seen.append((field, os.path.getsize(path) >= 100)))
+    assert seen == [("video_file", True)]
+
+def test_file_over_the_limit_is_removed(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        ingest(body(("audio_file", "a.m4a", b"a"), ("video_file", "v.mp4", b"x" * 2000)), tmp_path,
+               max_file_bytes=1000)
+    assert os.listdir(tmp_path) == []
+
+def test_request_over_the_limit(tmp_path):
+    data = body(("video_file", "v.mp4", b"x" * 2000))
+    with pytest.raises(UploadTooLarge):
+        ingest(data, tmp_path, max_request_bytes=1000)
+    # Without a Content-Length the limit is enforced while reading
+    with pytest.raises(UploadTooLarge):
+        ingest_multipart(io.BytesIO(data), CONTENT_TYPE, None, lambda field, filename: str(tmp_path / "v"),
+                         MB, 1000)
+    assert os.listdir(tmp_path) == []
+
+def test_repeated_file_field_is_rejected(tmp_path):
+    with pytest.raises(UploadRejected):
+        ingest(body(("video_file", "one.mp4", b"1" * 100), ("video_file", "two.mp4", b"2" * 100)), tmp_path)
+    assert os.listdir(tmp_path) == []
+
+def test_truncated_body(tmp_path):
+    data = body(("video_file", "v.mp4", b"x" * 100))
+    with pytest.raises(Exception):
+        ingest(data[:-30], tmp_path)
+    assert os.listdir(tmp_path) == []
+
+def test_missing_boundary(tmp_path):
+    with pytest.raises(Exception, match="multipart"):
+        ingest_multipart(io.BytesIO(b""), "multipart/form-data", 0, lambda *args: None, MB, MB)
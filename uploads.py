@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Upload ingestion for YouTube Downloader
+Parses multipart/form-data request bodies as they arrive and writes file
+parts straight to their final location, enforcing size limits early and
+hashing the content on the way for deduplication
+"""
+
+import hashlib
+import os
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+class UploadTooLarge(Exception):
+    """An upload went over a configured size limit"""
+
+class UploadRejected(Exception):
+    """A malformed upload, e.g. one sending the same file field twice"""
+
+class UploadedFile:
+    """A file part written to disk"""
+
+    __slots__ = ("name", "filename", "path", "size", "sha256")
+
+    def __init__(self, name, filename, path, size, sha256):
+        self.name = name
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+def ingest_multipart(stream, content_type, content_length, destination, max_file_bytes,
+                     max_request_bytes, on_header=None, header_bytes=1024 * 1024, chunk_size=256 * 1024):
+    """Read a multipart body from stream, writing each file part where destination says
+
+    destination(field_name, filename) returns the path for a file part, or
+    None to drop it. on_header(field_name, path) is called once the first
+    header_bytes of a file are on disk, e.g. to start probing it. Returns
+    (form fields, {field name: UploadedFile}). Raises UploadTooLarge when
+    a limit is exceeded and UploadRejected when a file field repeats; files
+    written so far are removed on any error.
+    """
+    if content_length and content_length > max_request_bytes:
+        raise UploadTooLarge(f"Upload is larger than {max_request_bytes // (1024 * 1024)} MB")
+    boundary = parse_options_header(content_type)[1].get("boundary")
+    if not boundary:
+        raise Exception("Expected a multipart/form-data upload")
+
+    decoder = MultipartDecoder(boundary.encode(), max_form_memory_size=1024 * 1024)
+    fields = {}
+    files = {}
+    received = 0
+    current = None  # (field name, text parts) or [UploadedFile, open file, hash, header reported]
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise UploadTooLarge(f"Upload is larger than {max_request_bytes // (1024 * 1024)} MB")
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, Field):
+                    current = (event.name, [])
+                elif isinstance(event, File):
+                    if event.name in files:
+                        raise UploadRejected(f"More than one file sent as {event.name}")
+                    path = destination(event.name, event.filename)
+                    if path is None:
+                        current = None
+                    else:
+                        upload = UploadedFile(event.name, event.filename, path, 0, None)
+                        files[event.name] = upload
+                        current = [upload, open(path, "wb"), hashlib.sha256(), False]
+                elif isinstance(event, Data) and current is not None:
+                    if isinstance(current, tuple):
+                        current[1].append(event.data)
+                        if not event.more_data:
+                            fields[current[0]] = b"".join(current[1]).decode("utf-8", "replace")
+                    else:
+                        upload, f, digest, reported = current
+                        upload.size += len(event.data)
+                        if upload.size > max_file_bytes:
+                            raise UploadTooLarge(f"{upload.filename} is larger than "
+                                                 f"{max_file_bytes // (1024 * 1024)} MB")
+                        f.write(event.data)
+                        digest.update(event.data)
+                        if on_header and not reported and (upload.size >= header_bytes or not event.more_data):
+                            f.flush()
+                            current[3] = True
+                            on_header(upload.name, upload.path)
+                        if not event.more_data:
+                            f.close()
+                            upload.sha256 = digest.hexdigest()
+                            current = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue):
+                break
+            if not chunk:
+                raise Exception("Upload ended before it was complete")
+    except Exception:
+        if current is not None and not isinstance(current, tuple):
+            current[1].close()
+        for upload in files.values():
+            if os.path.exists(upload.path):
+                os.remove(upload.path)
+        raise
+    return fields, files
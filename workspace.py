@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Per-job scratch directories for YouTube Downloader
+Every merge or conversion writes its intermediate files and its unfinished
+output in a directory of its own, so concurrent jobs never share a
+temporary name. Small jobs can go to a RAM-backed filesystem, directories
+are removed when the job ends either way, and ones left behind by a crash
+are swept on startup
+"""
+
+import os
+import shutil
+import threading
+
+class Workspace:
+    """A job's scratch directory, removed with everything in it on cleanup()"""
+
+    def __init__(self, path, on_cleanup=None):
+        self.path = path
+        self._on_cleanup = on_cleanup
+        os.makedirs(path, exist_ok=True)
+
+    def file(self, name):
+        """Path for a scratch file, the name only has to be unique within the job"""
+        return os.path.join(self.path, os.path.basename(name))
+
+    def publish(self, scratch_path, destination):
+        """Move a finished file to its final place, atomically when on the same filesystem"""
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        try:
+            os.replace(scratch_path, destination)
+        except OSError:
+            # Crossing filesystems (e.g. from tmpfs): copy beside the destination, then rename
+            partial = destination + ".publishing"
+            shutil.copyfile(scratch_path, partial)
+            os.replace(partial, destination)
+            os.remove(scratch_path)
+        return destination
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        if self._on_cleanup:
+            self._on_cleanup()
+            self._on_cleanup = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+class WorkspaceManager:
+    """Hands out job workspaces under a disk root, or a tmpfs root for small jobs"""
+
+    def __init__(self, root, tmpfs_root=None, tmpfs_max_bytes=0):
+        self.root = root
+        # A subdirectory of our own, so sweeping never touches anyone else's files
+        self.tmpfs_root = os.path.join(tmpfs_root, "yt-workspaces") if tmpfs_root and tmpfs_max_bytes > 0 else None
+        self.tmpfs_max_bytes = tmpfs_max_bytes
+        self._lock = threading.Lock()
+        self._tmpfs_reserved = 0
+
+    def open(self, job_id, expected_bytes=None):
+        """Create the workspace of a job
+
+        expected_bytes estimates how much it will hold at most; jobs known to
+        fit within the tmpfs limit and the space still free there get a
+        RAM-backed directory.
+        """
+        reserved = self._reserve_tmpfs(expected_bytes)
+        if not reserved:
+            return Workspace(os.path.join(self.root, job_id))
+
+        def release():
+            with self._lock:
+                self._tmpfs_reserved -= reserved
+        try:
+            return Workspace(os.path.join(self.tmpfs_root, job_id), on_cleanup=release)
+        except OSError:
+            release()
+            return Workspace(os.path.join(self.root, job_id))
+
+    def _reserve_tmpfs(self, expected_bytes):
+        if not self.tmpfs_root or not expected_bytes:
+            return 0
+        with self._lock:
+            if self._tmpfs_reserved + expected_bytes > self.tmpfs_max_bytes:
+                return 0
+            try:
+                free = shutil.disk_usage(os.path.dirname(self.tmpfs_root)).free
+            except OSError:
+                return 0
+            # Leave half of the free memory to everything else
+            if self._tmpfs_reserved + expected_bytes > free // 2:
+                return 0
+            self._tmpfs_reserved += expected_bytes
+            return expected_bytes
+
+    def sweep(self, in_use=lambda job_id: False):
+        """Remove workspaces whose job is no longer running, returns how many"""
+        removed = 0
+        for root in (self.root, self.tmpfs_root):
+            if not root or not os.path.isdir(root):
+                continue
+            for entry in os.scandir(root):
+                if entry.is_dir() and not in_use(entry.name):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+        return removed